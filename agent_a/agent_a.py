@@ -2,72 +2,252 @@ import asyncio
 import feedparser
 import httpx
 import os
-from pyrogram import Client
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import metrics, storage
+from common.telegram_outbox import Outbox, TelegramDispatcher
+
 # Load environment variables
 load_dotenv()
 
-API_ID = int(os.getenv("API_ID"))
-API_HASH = os.getenv("API_HASH")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID  = os.getenv("CHAT_ID")
 AGENT_B_ENDPOINT = os.getenv("AGENT_B_URL", "http://127.0.0.1:8000/ingest")
+# Telegram outbox and seen-ID store; both survive restarts
+STATE_DB = os.getenv("AGENT_A_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent_a.db"))
 
-if not API_ID or not API_HASH or not BOT_TOKEN or not CHAT_ID:
-    raise RuntimeError("Missing API_ID, API_HASH, BOT_TOKEN or CHAT_ID in .env")
-
-# Pass full auth to Client
-app = Client("sentiment_stream_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
+if not BOT_TOKEN or not CHAT_ID:
+    raise RuntimeError("Missing BOT_TOKEN or CHAT_ID in .env")
 
 RSS_FEEDS = [
     "https://www.forexlive.com/feed/news/",
     "https://www.fxstreet.com/rss/news"
 ]
 
-async def main():
-    await app.start()
-    print("Agent A (bot) started")
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "15"))  # seconds; unchanged feeds answer 304
+ENTRIES_PER_FEED = 10
+FEED_TIMEOUT = 10.0
+PARSE_WORKERS = 2
+
+FORWARD_BATCH_MAX = 50       # headlines per POST to Agent B
+FORWARD_BATCH_WINDOW = 0.2   # seconds to wait for more headlines before posting
+FORWARD_RETRIES = 3
+
+SEEN_MAX = 50000
+SEEN_TTL = 7 * 86400         # seconds
+
+METRICS_PORT = 9108          # Prometheus text at http://127.0.0.1:9108/metrics
+FORWARD_SECONDS = metrics.histogram("agent_a_forward_seconds", "Batch POST to Agent B, retries included")
+HEADLINES = metrics.counter("agent_a_new_headlines_total", "Headlines not seen before")
+FORWARD_DROPPED = metrics.counter("agent_a_forward_dropped_total", "Headlines dropped after FORWARD_RETRIES")
+
+
+# === SEEN-ID STORE ===
+
+class SeenStore:
+    """
+    Bounded LRU of entry IDs with a TTL, mirrored to SQLite so a restart
+    does not re-send headlines that are still in the feeds.
+    """
+
+    def __init__(self, db_path, max_items=SEEN_MAX, ttl=SEEN_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.items = OrderedDict()   # uid -> seen_at, oldest first
+        self.conn = storage.connect(db_path, migrate_schema=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen_ids (
+                uid     TEXT PRIMARY KEY,
+                seen_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_ids_seen_at ON seen_ids(seen_at)")
+        self.conn.commit()
+        self._load()
+
+    def _load(self):
+        rows = self.conn.execute(
+            "SELECT uid, seen_at FROM seen_ids WHERE seen_at >= ? ORDER BY seen_at DESC LIMIT ?",
+            (time.time() - self.ttl, self.max_items),
+        ).fetchall()
+        for uid, seen_at in reversed(rows):
+            self.items[uid] = seen_at
+
+    def __contains__(self, uid):
+        seen_at = self.items.get(uid)
+        if seen_at is None:
+            return False
+        if time.time() - seen_at > self.ttl:
+            del self.items[uid]
+            return False
+        self.items.move_to_end(uid)
+        return True
+
+    def __len__(self):
+        return len(self.items)
+
+    def add_many(self, uids):
+        now = time.time()
+        for uid in uids:
+            self.items[uid] = now
+            self.items.move_to_end(uid)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO seen_ids (uid, seen_at) VALUES (?, ?)",
+            [(uid, now) for uid in uids],
+        )
+        self.conn.commit()
+
+    def prune(self):
+        """Drop expired rows and keep the table at max_items."""
+        self.conn.execute("DELETE FROM seen_ids WHERE seen_at < ?", (time.time() - self.ttl,))
+        self.conn.execute("""
+            DELETE FROM seen_ids WHERE uid NOT IN (
+                SELECT uid FROM seen_ids ORDER BY seen_at DESC LIMIT ?
+            )
+        """, (self.max_items,))
+        self.conn.commit()
+
+
+# === FEEDS ===
+
+def parse_feed(content):
+    """Runs in a worker process; returns plain tuples so the result pickles cheaply."""
+    feed = feedparser.parse(content)
+    entries = []
+    for entry in feed.entries[:ENTRIES_PER_FEED]:
+        uid = entry.get("id") or entry.get("link")
+        if not uid:
+            continue
+        entries.append((uid, entry.get("title", "No Title").strip(), entry.get("link", "").strip()))
+    return bool(feed.bozo) and not entries, entries
 
-    seen = set()
+async def fetch_feed(client, pool, url, validators):
+    started = time.perf_counter()
+    try:
+        return await _fetch_feed(client, pool, url, validators)
+    finally:
+        metrics.histogram("agent_a_feed_fetch_seconds", "Conditional GET and parse of one feed",
+                          feed=url).observe(time.perf_counter() - started)
+
+async def _fetch_feed(client, pool, url, validators):
+    headers = {}
+    etag, modified = validators.get(url, (None, None))
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    try:
+        resp = await client.get(url, headers=headers, timeout=FEED_TIMEOUT)
+    except httpx.HTTPError as e:
+        print(f"[Warning] Could not fetch RSS feed {url}: {e}")
+        return []
+    if resp.status_code == 304:
+        return []
+    if resp.status_code != 200:
+        print(f"[Warning] RSS feed {url} responded {resp.status_code}")
+        return []
+
+    bozo, entries = await asyncio.get_running_loop().run_in_executor(pool, parse_feed, resp.content)
+    if bozo:
+        print(f"[Warning] Could not parse RSS feed: {url}")
+        return []
+    validators[url] = (resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+    return entries
+
+async def poll_feeds(client, pool, seen, telegram_queue, forward_queue):
+    validators = {}
+    last_prune = time.time()
     while True:
-        for url in RSS_FEEDS:
-            feed = feedparser.parse(url)
-            if feed.bozo:
-                print(f"[Warning] Could not parse RSS feed: {url}")
-                continue
-
-            for entry in feed.entries[:10]:
-                uid = entry.get("id") or entry.get("link")
-                if uid in seen:
-                    continue
-                seen.add(uid)
-
-                headline = entry.get("title", "No Title").strip()
-                link     = entry.get("link", "").strip()
-                message  = f"📰 {headline}\n{link}"
-
-                try:
-                    await app.send_message(chat_id=CHAT_ID, text=message)
-                    print(f"[Telegram] Sent: {headline[:30]}…")
-                except Exception as e:
-                    print(f"[Error] Telegram send failed: {e}")
-
-                async with httpx.AsyncClient() as client:
-                    try:
-                        resp = await client.post(
-                            AGENT_B_ENDPOINT,
-                            json={"headline": headline, "link": link},
-                            timeout=10.0
-                        )
-                        if resp.status_code != 200:
-                            print(f"[Warning] Agent B responded {resp.status_code}")
-                    except Exception as e:
-                        print(f"[Error] Agent B POST failed: {e}")
-
-                await asyncio.sleep(1)
-
-        await asyncio.sleep(60)
+        results = await asyncio.gather(*(fetch_feed(client, pool, url, validators) for url in RSS_FEEDS))
+
+        fresh = {}
+        for entries in results:
+            for uid, headline, link in entries:
+                if uid not in fresh and uid not in seen:
+                    fresh[uid] = (headline, link)
+
+        if fresh:
+            seen.add_many(list(fresh))
+            HEADLINES.inc(len(fresh))
+            detected = time.time()
+            for headline, link in fresh.values():
+                telegram_queue.put_nowait((headline, link, detected))
+                forward_queue.put_nowait({"headline": headline, "link": link})
+
+        if time.time() - last_prune >= 3600:
+            seen.prune()
+            last_prune = time.time()
+
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+# === CONSUMERS ===
+
+async def telegram_consumer(queue, outbox):
+    while True:
+        headline, link, detected = await queue.get()
+        # Queued for the dispatcher, which paces and packs sends
+        outbox.send(CHAT_ID, f"📰 {headline}\n{link}", origin_at=detected)
+        print(f"[Telegram] Queued: {headline[:30]}…")
+
+async def agent_b_forwarder(queue, client):
+    while True:
+        batch = [await queue.get()]
+        deadline = time.monotonic() + FORWARD_BATCH_WINDOW
+        while len(batch) < FORWARD_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        started = time.perf_counter()
+        for attempt in range(FORWARD_RETRIES):
+            try:
+                resp = await client.post(AGENT_B_ENDPOINT, json={"items": batch}, timeout=10.0)
+                if resp.status_code == 200:
+                    break
+                print(f"[Warning] Agent B responded {resp.status_code}")
+            except httpx.HTTPError as e:
+                print(f"[Error] Agent B POST failed: {e}")
+            await asyncio.sleep(2 ** attempt)
+        else:
+            FORWARD_DROPPED.inc(len(batch))
+            print(f"[Error] Dropped {len(batch)} headline(s) for Agent B after {FORWARD_RETRIES} attempts")
+        FORWARD_SECONDS.observe(time.perf_counter() - started)
+
+
+async def main(pool):
+    outbox = Outbox(STATE_DB)
+    seen = SeenStore(STATE_DB)
+    dispatcher = TelegramDispatcher(STATE_DB, BOT_TOKEN)
+    telegram_queue = asyncio.Queue()
+    forward_queue = asyncio.Queue()
+    metrics.serve(METRICS_PORT)
+    print(f"Agent A (bot) started ({len(seen)} seen IDs restored)")
+
+    limits = httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60)
+    async with httpx.AsyncClient(limits=limits, follow_redirects=True) as client:
+        await asyncio.gather(
+            dispatcher.run(),
+            poll_feeds(client, pool, seen, telegram_queue, forward_queue),
+            telegram_consumer(telegram_queue, outbox),
+            agent_b_forwarder(forward_queue, client),
+        )
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Fork the parser workers before any thread exists (metrics server,
+    # dispatcher, the event loop's resolver threads): a forked child copies
+    # only the calling thread and can inherit a lock held by another
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as pool:
+        pool.submit(int).result()   # the first submit starts every worker
+        asyncio.run(main(pool))
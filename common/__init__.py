@@ -0,0 +1,6 @@
+"""
+Modules shared by part1, part2 and agent_a.
+
+Scripts put the repository root on sys.path and import them as
+`from common import telegram_outbox`.
+"""
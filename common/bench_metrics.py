@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+bench_metrics.py
+
+Per-event cost of the instrumentation in metrics.py, and histogram
+accuracy:
+
+  * ns per Counter.inc, Histogram.observe, a timed block (two
+    perf_counter calls + observe) and LogWriter.write
+  * p50/p99/p99.9 from the histogram versus exact percentiles over
+    lognormal latencies spanning microseconds to seconds
+
+Usage: python bench_metrics.py [N_EVENTS]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import metrics
+
+
+def per_event_ns(fn, n):
+    started = time.perf_counter()
+    fn(n)
+    return (time.perf_counter() - started) / n * 1e9
+
+
+def main(n):
+    counter = metrics.Counter()
+    hist = metrics.Histogram()
+    perf = time.perf_counter
+
+    def inc(k):
+        for _ in range(k):
+            counter.inc()
+
+    def observe(k):
+        for _ in range(k):
+            hist.observe(0.00123)
+
+    def timed(k):
+        for _ in range(k):
+            started = perf()
+            hist.observe(perf() - started)
+
+    def baseline(k):
+        for _ in range(k):
+            pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = metrics.LogWriter(os.path.join(tmp, "bench.log"), max_pending=n + 1)
+
+        def write(k):
+            for i in range(k):
+                log.write("article queued", weight=3)
+
+        loop_ns = per_event_ns(baseline, n)
+        print(f"{n:,} events each (loop overhead {loop_ns:.0f} ns subtracted)")
+        for name, fn in (("Counter.inc", inc), ("Histogram.observe", observe),
+                         ("timed block", timed), ("LogWriter.write", write)):
+            print(f"  {name:<18} {per_event_ns(fn, n) - loop_ns:7.0f} ns")
+        started = time.perf_counter()
+        log.close()
+        print(f"  log flush of {n:,} lines took {time.perf_counter() - started:.2f}s (background thread)")
+
+    rng = np.random.default_rng(1)
+    samples = rng.lognormal(mean=np.log(0.002), sigma=2.0, size=200000)
+    hist = metrics.Histogram()
+    for s in samples:
+        hist.observe(float(s))
+    print("Histogram accuracy on lognormal latencies (seconds):")
+    for q in (50, 99, 99.9):
+        exact = float(np.percentile(samples, q))
+        approx = hist.percentile(q)
+        print(f"  p{q:<5} exact {exact:.6f}  histogram {approx:.6f}  ({(approx / exact - 1) * 100:+.1f}%)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
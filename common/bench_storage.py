@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+bench_storage.py
+
+Multi-process write contention on one SQLite file, before and after
+common/storage.py:
+
+  default  sqlite3.connect() as the services used to open it (rollback
+           journal, synchronous=FULL, Python's 5 s busy timeout), and the
+           schema created by hand without the migration indexes
+  storage  storage.connect(): WAL, synchronous=NORMAL, busy_timeout,
+           mmap/cache pragmas, migrated schema
+
+WRITERS processes commit small transactions for DURATION seconds (every
+writer alternates a candle-writer-style batch of ROWS bars and a single
+news row, like the services sharing crypto.db), while READERS processes
+run the resampler's catch-up range scan in a loop. Reports commits/s,
+p50/p99 commit latency, "database is locked" errors and reader scans/s.
+
+Usage: python bench_storage.py [DURATION] [WRITERS] [READERS]
+"""
+
+import multiprocessing as mp
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import storage
+
+ROWS = 20
+SEED_MINUTES = 2000
+SEED_SYMBOLS = 20
+MINUTE_MS = 60000
+
+
+def open_conn(mode, db_path):
+    if mode == "default":
+        return sqlite3.connect(db_path)
+    return storage.connect(db_path)
+
+
+def seed(mode, db_path):
+    conn = open_conn(mode, db_path)
+    if mode == "default":
+        conn.execute("""
+            CREATE TABLE market_data_1m (symbol TEXT, timestamp INTEGER, open REAL, high REAL,
+                low REAL, close REAL, volume REAL, PRIMARY KEY(symbol, timestamp))
+        """)
+        conn.execute("""
+            CREATE TABLE raw_news_queue (article_id TEXT PRIMARY KEY, title TEXT NOT NULL,
+                link TEXT NOT NULL, summary TEXT, published_at DATETIME NOT NULL,
+                weight INTEGER NOT NULL DEFAULT 1, cluster_id TEXT)
+        """)
+    conn.executemany(
+        "INSERT INTO market_data_1m VALUES (?, ?, 1, 1, 1, 1, 1)",
+        [(f"S{s}USDT", m * MINUTE_MS) for s in range(SEED_SYMBOLS) for m in range(SEED_MINUTES)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def writer(mode, db_path, worker_id, stop_at, results):
+    conn = open_conn(mode, db_path)
+    latencies, errors, seq = [], 0, 0
+    while time.time() < stop_at:
+        started = time.perf_counter()
+        try:
+            if seq % 2 == 0:
+                ts0 = (SEED_MINUTES + seq * ROWS) * MINUTE_MS
+                conn.executemany(
+                    "INSERT OR REPLACE INTO market_data_1m VALUES (?, ?, 1, 1, 1, 1, 1)",
+                    [(f"W{worker_id}USDT", ts0 + k * MINUTE_MS) for k in range(ROWS)],
+                )
+            else:
+                conn.execute(
+                    "INSERT INTO raw_news_queue (article_id, title, link, published_at) VALUES (?, ?, ?, ?)",
+                    (f"{worker_id}-{seq}", "headline", "https://example.com", "2024-01-01"),
+                )
+            conn.commit()
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            errors += 1
+            conn.rollback()
+        seq += 1
+    conn.close()
+    results.put(("writer", latencies, errors))
+
+
+def reader(mode, db_path, stop_at, results):
+    conn = open_conn(mode, db_path)
+    scans, errors = 0, 0
+    since = (SEED_MINUTES - 600) * MINUTE_MS
+    while time.time() < stop_at:
+        try:
+            conn.execute("""
+                SELECT symbol, timestamp, open, high, low, close, volume
+                FROM market_data_1m WHERE timestamp >= ? ORDER BY symbol, timestamp
+            """, (since,)).fetchall()
+            scans += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    conn.close()
+    results.put(("reader", scans, errors))
+
+
+def run(mode, duration, writers, readers):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "crypto.db")
+        seed(mode, db_path)
+        results = mp.Queue()
+        stop_at = time.time() + 0.5 + duration
+        procs = [mp.Process(target=writer, args=(mode, db_path, i, stop_at, results)) for i in range(writers)]
+        procs += [mp.Process(target=reader, args=(mode, db_path, stop_at, results)) for _ in range(readers)]
+        for p in procs:
+            p.start()
+        collected = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+    latencies = np.concatenate([np.array(r[1]) for r in collected if r[0] == "writer"] or [np.zeros(0)])
+    write_errors = sum(r[2] for r in collected if r[0] == "writer")
+    scans = sum(r[1] for r in collected if r[0] == "reader")
+    read_errors = sum(r[2] for r in collected if r[0] == "reader")
+    lat = latencies * 1000 if len(latencies) else np.zeros(1)
+    print(f"{mode:<8} {len(latencies) / duration:>9,.0f} commits/s  "
+          f"p50 {np.percentile(lat, 50):7.2f} ms  p99 {np.percentile(lat, 99):8.2f} ms  "
+          f"locked {write_errors:>4}  reader scans/s {scans / duration:6.1f} (locked {read_errors})")
+
+
+if __name__ == "__main__":
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    print(f"{writers} writer and {readers} reader processes, {duration:.0f}s each")
+    for mode in ("default", "storage"):
+        run(mode, duration, writers, readers)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+bench_telegram_outbox.py
+
+Runs TelegramDispatcher against a local fake Bot API that enforces
+Telegram-like limits (per-chat and global) and answers 429 with
+retry_after when they are exceeded. A burst is queued into a fresh
+outbox; the script checks every message arrived exactly once and in order
+per chat, then reports wall time, requests and 429s.
+
+Usage: python bench_telegram_outbox.py [MESSAGES] [CHATS]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.telegram_outbox import Outbox, TelegramDispatcher, PACK_SEPARATOR
+
+CHAT_LIMIT_PER_SEC = 1.0
+GLOBAL_LIMIT_PER_SEC = 30.0
+
+
+class FakeBotAPI:
+    def __init__(self, flaky_every=0):
+        self.received = defaultdict(list)
+        self.chat_last = {}
+        self.global_times = []
+        self.requests = 0
+        self.rejected = 0
+        self.flaky_every = flaky_every
+
+    async def send_message(self, request):
+        self.requests += 1
+        payload = await request.json()
+        chat = payload["chat_id"]
+        now = time.monotonic()
+
+        if self.flaky_every and self.requests % self.flaky_every == 0:
+            return web.json_response({"ok": False, "description": "Bad Gateway"}, status=502)
+
+        self.global_times = [t for t in self.global_times if now - t < 1.0]
+        too_fast = now - self.chat_last.get(chat, -10) < 1.0 / CHAT_LIMIT_PER_SEC * 0.9
+        if too_fast or len(self.global_times) >= GLOBAL_LIMIT_PER_SEC:
+            self.rejected += 1
+            return web.json_response(
+                {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                 "parameters": {"retry_after": 1}}, status=429)
+
+        self.chat_last[chat] = now
+        self.global_times.append(now)
+        self.received[chat].extend(payload["text"].split(PACK_SEPARATOR))
+        return web.json_response({"ok": True, "result": {"message_id": self.requests}})
+
+
+async def main(n_messages, n_chats):
+    fake = FakeBotAPI(flaky_every=25)
+    app = web.Application()
+    app.router.add_post("/bot{token}/sendMessage", fake.send_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "outbox.db")
+        outbox = Outbox(db_path)
+        expected = defaultdict(list)
+        started = time.perf_counter()
+        for i in range(n_messages):
+            chat = f"chat{i % n_chats}"
+            text = f"*Headline {i}*\nsource {'x' * (i % 300)}"
+            outbox.send(chat, text, "Markdown")
+            expected[chat].append(text)
+        enqueue_ms = (time.perf_counter() - started) * 1000
+
+        dispatcher = TelegramDispatcher(db_path, "TEST", api_base=f"http://127.0.0.1:{port}",
+                                        poll_interval=0.05)
+        task = asyncio.create_task(dispatcher.run())
+        started = time.perf_counter()
+        while dispatcher.messages_sent < n_messages and time.perf_counter() - started < 120:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        dispatcher.stop()
+        await task
+
+        pending = outbox.conn.execute(
+            "SELECT COUNT(*) FROM telegram_outbox WHERE status != 'sent'").fetchone()[0]
+        outbox.close()
+
+    await runner.cleanup()
+
+    # Every message delivered once, in order per chat (rejected requests
+    # are not recorded by the fake, so any duplicate would be a real resend)
+    for chat, texts in expected.items():
+        assert fake.received[chat] == texts, f"{chat}: order or content mismatch"
+
+    print(f"{n_messages} messages to {n_chats} chats, enqueue {enqueue_ms:.1f} ms total")
+    print(f"delivered in {elapsed:.2f}s: {fake.requests} requests, "
+          f"{fake.rejected} answered 429, rows not marked sent: {pending}")
+    print(f"dispatcher stats: {dispatcher.stats()}")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    chats = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    asyncio.run(main(n, chats))
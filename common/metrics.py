@@ -0,0 +1,364 @@
+"""
+metrics.py
+
+In-process instrumentation shared by every service: counters, gauges and
+HDR-style latency histograms, a Prometheus text endpoint, and a buffered
+log writer.
+
+Metrics are created once at module level and updated on the hot path:
+
+    FLUSH_SECONDS = metrics.histogram("candle_flush_seconds", "SQLite flush time")
+    ...
+    FLUSH_SECONDS.observe(elapsed)
+
+Updates are plain attribute/list increments with no lock, so they cost
+about a microsecond or less (bench_metrics.py); under heavy thread
+contention an increment can occasionally be lost, which is fine for
+monitoring. serve(port) exposes every metric of the process at
+http://127.0.0.1:<port>/metrics from a daemon thread.
+
+Histograms keep log-linear buckets (SUB_BUCKETS per power of two from
+1 microsecond up to ~2 minutes, about 6% relative resolution) so p50/p99
+stay accurate over six orders of magnitude; the Prometheus output folds
+them into the fixed LE_BOUNDS.
+"""
+
+import atexit
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUB_BUCKETS = 16
+MAX_EXPONENT = 28                 # 2**27 us ~ 134 s; slower observations share the last bucket
+LE_BOUNDS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+             0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_N_BUCKETS = MAX_EXPONENT * SUB_BUCKETS + 1
+_LAST = _N_BUCKETS - 1
+_frexp = math.frexp
+_TWICE_SUB = 2 * SUB_BUCKETS
+_OFFSET = 1 - 2 * SUB_BUCKETS
+
+
+def _bucket_upper(i):
+    """Upper bound (seconds) of fine bucket i."""
+    if i == 0:
+        return 1e-6
+    exponent, sub = divmod(i - 1, SUB_BUCKETS)
+    return 2.0 ** exponent * (1 + (sub + 1) / SUB_BUCKETS) * 1e-6
+
+
+_UPPER = [_bucket_upper(i) for i in range(_N_BUCKETS)]
+
+
+# === METRIC TYPES ===
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        return [("", {}, self.value)]
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set_function(self, function):
+        """Read the value from function() at scrape time (queue depths and the like)."""
+        self.function = function
+
+    def samples(self):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                value = float("nan")
+        return [("", {}, value)]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self):
+        self.counts = [0] * _N_BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        us = seconds * 1e6
+        if us < 1.0:
+            i = 0
+        else:
+            # us = m * 2**e with 0.5 <= m < 1: e picks the power of two, m the
+            # linear sub-bucket inside it. Same as
+            # (e - 1) * SUB_BUCKETS + int((m - 0.5) * 2 * SUB_BUCKETS) + 1
+            m, e = _frexp(us)
+            i = e * SUB_BUCKETS + int(m * _TWICE_SUB) + _OFFSET
+            if i > _LAST:
+                i = _LAST
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def time(self):
+        """Context manager observing the wall time of its block."""
+        return _Timer(self)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (0-100), in seconds."""
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = max(1, math.ceil(total * q / 100))
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                # The last bucket is open-ended; every other bound is capped by the max seen
+                return self.max if i == _LAST else min(_UPPER[i], self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+    def samples(self):
+        counts = list(self.counts)
+        out = []
+        cumulative, i = 0, 0
+        for le in LE_BOUNDS:
+            while i < _N_BUCKETS and _UPPER[i] <= le * (1 + 1e-9):
+                cumulative += counts[i]
+                i += 1
+            out.append(("_bucket", {"le": repr(le)}, cumulative))
+        total = sum(counts)
+        out.append(("_bucket", {"le": "+Inf"}, total))
+        out.append(("_sum", {}, self.sum))
+        out.append(("_count", {}, total))
+        return out
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+# === REGISTRY ===
+
+class Registry:
+    def __init__(self):
+        self.families = {}     # name -> (kind, help, {label tuple: metric})
+        self.lock = threading.Lock()
+
+    def get(self, cls, name, help_text, labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = (cls.kind, help_text, {})
+            elif family[0] != cls.kind:
+                raise ValueError(f"metric {name} already registered as a {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = cls()
+            return metric
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            families = [(name, kind, help_text, list(children.items()))
+                        for name, (kind, help_text, children) in sorted(self.families.items())]
+        for name, kind, help_text, children in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in children:
+                for suffix, extra, value in metric.samples():
+                    lines.append(f"{name}{suffix}{_labels(dict(key), extra)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text="", **labels):
+    return REGISTRY.get(Counter, name, help_text, labels)
+
+
+def gauge(name, help_text="", **labels):
+    return REGISTRY.get(Gauge, name, help_text, labels)
+
+
+def histogram(name, help_text="", **labels):
+    return REGISTRY.get(Histogram, name, help_text, labels)
+
+
+# === HTTP ENDPOINT ===
+
+def serve(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve GET /metrics from a daemon thread; returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# === BUFFERED LOG WRITER ===
+
+class LogWriter:
+    """
+    Append-only log file written from a background thread. write() only
+    appends to an in-memory deque (no formatting, no I/O); the thread
+    formats and writes everything pending every flush_interval seconds
+    through one open file handle, reopened when logrotate moves the file.
+    When more than max_pending lines are waiting, new lines are dropped
+    and counted instead of blocking the caller.
+    """
+
+    def __init__(self, path, flush_interval=1.0, max_pending=100000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.dropped = 0
+        self.file = None
+        self.inode = None
+        self.flush_lock = threading.Lock()
+        self.closed = threading.Event()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, message, **fields):
+        """Queue one line: "[<utc iso time>] message key=value ..."."""
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self.pending.append((time.time(), message, fields))
+
+    def _open(self):
+        if self.file is not None:
+            try:
+                if os.stat(self.path).st_ino == self.inode:
+                    return
+            except FileNotFoundError:
+                pass
+            self.file.close()
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.inode = os.fstat(self.file.fileno()).st_ino
+
+    def flush(self):
+        with self.flush_lock:
+            if not self.pending and not self.dropped:
+                return
+            self._open()
+            lines = []
+            while self.pending:
+                ts, message, fields = self.pending.popleft()
+                stamp = datetime.fromtimestamp(ts, timezone.utc).isoformat()
+                extra = "".join(f" {k}={v}" for k, v in fields.items())
+                lines.append(f"[{stamp}] {message}{extra}\n")
+            if self.dropped:
+                stamp = datetime.now(timezone.utc).isoformat()
+                lines.append(f"[{stamp}] log writer dropped {self.dropped} lines (buffer full)\n")
+                self.dropped = 0
+            self.file.writelines(lines)
+            self.file.flush()
+
+    def _run(self):
+        while not self.closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError:
+                pass  # disk full or similar: keep buffering, retry next interval
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        try:
+            self.flush()
+        finally:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,370 @@
+"""
+storage.py
+
+One SQLite setup for every process that uses crypto.db.
+
+connect() opens a connection with the pragmas every writer needs when
+several services share the file:
+
+  - journal_mode=WAL, synchronous=NORMAL: readers never block the writer
+    and a commit is an append to the WAL instead of a rollback-journal
+    round trip
+  - busy_timeout: a writer that finds the lock taken waits for it
+    instead of failing with "database is locked"
+  - mmap_size / cache_size / temp_store: reads come from the page cache
+    and mapped memory rather than read() calls
+
+get_connection() keeps one such connection per process and thread, so a
+service's statements stay in that connection's prepared-statement cache
+(sqlite3 reuses a compiled statement whenever the same SQL text runs
+again) instead of being recompiled on every cycle.
+
+migrate() brings the schema to SCHEMA_VERSION (tracked in PRAGMA
+user_version). Every service runs it on its first connection; the first
+process to get there applies the pending steps in one IMMEDIATE
+transaction and the others wait on busy_timeout, then see nothing to do.
+
+article_id() and utc_iso() are the key and timestamp formats of the news
+tables; every writer uses them so dedup and retention see each other's rows.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+DB_PATH = "/home/tito/crypto_algotrader_part1/part1/db/crypto.db"
+
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024      # bytes of the file mapped into memory
+CACHE_SIZE_KB = 64 * 1024          # page cache per connection
+STATEMENT_CACHE = 256              # compiled statements kept per connection
+
+
+# === CONNECTIONS ===
+
+def apply_pragmas(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def connect(db_path=DB_PATH, migrate_schema=True, check_same_thread=True):
+    """A new tuned connection (the caller owns and closes it)."""
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000,
+                           cached_statements=STATEMENT_CACHE,
+                           check_same_thread=check_same_thread)
+    apply_pragmas(conn)
+    if migrate_schema:
+        migrate(conn)
+    return conn
+
+
+_local = threading.local()
+
+
+def get_connection(db_path=DB_PATH, row_factory=sqlite3.Row):
+    """
+    This process's (and thread's) connection to db_path, opened and
+    migrated on first use. Do not close it; it lives as long as the process.
+    """
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        # A forked child must never reuse its parent's connection
+        _local.pid = pid
+        _local.conns = {}
+    conn = _local.conns.get(db_path)
+    if conn is None:
+        conn = _local.conns[db_path] = connect(db_path)
+    conn.row_factory = row_factory
+    return conn
+
+
+# === SHARED FORMATS ===
+
+def article_id(link):
+    """fetched_articles / raw_news_queue key: sha256 of the article URL."""
+    return hashlib.sha256(link.encode("utf-8")).hexdigest()
+
+
+def utc_iso(ts=None):
+    """fetched_at and friends: ISO-8601 UTC, so string order is time order."""
+    return datetime.fromtimestamp(time.time() if ts is None else ts, timezone.utc).isoformat()
+
+
+# === MIGRATIONS ===
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _create_tables(conn):
+    # News pipeline (part1)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fetched_articles (
+            article_id TEXT PRIMARY KEY,
+            fetched_at DATETIME NOT NULL,
+            weight     INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS raw_news_queue (
+            article_id   TEXT PRIMARY KEY,
+            title        TEXT NOT NULL,
+            link         TEXT NOT NULL,
+            summary      TEXT,
+            published_at DATETIME NOT NULL,
+            weight       INTEGER NOT NULL DEFAULT 1,
+            cluster_id   TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scored_news_queue (
+            article_id      TEXT PRIMARY KEY,
+            timestamp       DATETIME NOT NULL,
+            headline        TEXT NOT NULL,
+            url             TEXT NOT NULL,
+            sentiment_label TEXT NOT NULL,
+            intensity       REAL NOT NULL,
+            relevance_score REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tradable_news_queue (
+            article_id      TEXT PRIMARY KEY,
+            timestamp       DATETIME NOT NULL,
+            headline        TEXT NOT NULL,
+            url             TEXT NOT NULL,
+            sentiment_label TEXT NOT NULL,
+            intensity       REAL NOT NULL,
+            relevance_score REAL NOT NULL,
+            processed       INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS alerted_articles (
+            article_id TEXT PRIMARY KEY,
+            alerted_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS filter_state (
+            name  TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS feed_state (
+            feed_url      TEXT PRIMARY KEY,
+            etag          TEXT,
+            last_modified TEXT,
+            checked_at    TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS story_clusters (
+            cluster_id TEXT PRIMARY KEY,
+            first_seen TEXT NOT NULL,
+            last_seen  TEXT NOT NULL,
+            size       INTEGER NOT NULL,
+            weight     INTEGER NOT NULL,
+            sources    TEXT NOT NULL DEFAULT '',
+            alerted_at TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sentiment_cache (
+            text_hash       TEXT PRIMARY KEY,
+            sentiment_label TEXT NOT NULL,
+            intensity       REAL NOT NULL,
+            relevance_score REAL NOT NULL,
+            model           TEXT NOT NULL,
+            scored_at       TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS telegram_outbox (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id    TEXT NOT NULL,
+            text       TEXT NOT NULL,
+            parse_mode TEXT,
+            created_at REAL NOT NULL,
+            status     TEXT NOT NULL DEFAULT 'pending',
+            attempts   INTEGER NOT NULL DEFAULT 0,
+            sent_at    REAL,
+            last_error TEXT
+        )
+    """)
+
+    # Market data (part2)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS market_data_1m (
+            symbol    TEXT,
+            timestamp INTEGER,
+            open      REAL,
+            high      REAL,
+            low       REAL,
+            close     REAL,
+            volume    REAL,
+            PRIMARY KEY(symbol, timestamp)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS market_data_live (
+            symbol     TEXT PRIMARY KEY,
+            timestamp  INTEGER,
+            open       REAL,
+            high       REAL,
+            low        REAL,
+            close      REAL,
+            volume     REAL,
+            updated_at INTEGER
+        )
+    """)
+
+
+def _fix_legacy_columns(conn):
+    # The first db_setup.py created raw_news_queue with headline/url, and
+    # fetched_articles without the weight the fetcher writes
+    cols = _columns(conn, "raw_news_queue")
+    if "headline" in cols and "title" not in cols:
+        conn.execute("ALTER TABLE raw_news_queue RENAME COLUMN headline TO title")
+    if "url" in cols and "link" not in cols:
+        conn.execute("ALTER TABLE raw_news_queue RENAME COLUMN url TO link")
+    if "weight" not in cols:
+        conn.execute("ALTER TABLE raw_news_queue ADD COLUMN weight INTEGER NOT NULL DEFAULT 1")
+    if "cluster_id" not in cols:
+        conn.execute("ALTER TABLE raw_news_queue ADD COLUMN cluster_id TEXT")
+    if "weight" not in _columns(conn, "fetched_articles"):
+        conn.execute("ALTER TABLE fetched_articles ADD COLUMN weight INTEGER NOT NULL DEFAULT 1")
+
+
+def _create_indexes(conn):
+    # Retention pruning and the story-cluster warm start scan by fetch time
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fetched_articles_fetched_at ON fetched_articles(fetched_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_raw_news_queue_published_at ON raw_news_queue(published_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scored_news_queue_timestamp ON scored_news_queue(timestamp)")
+    # Consumers only ever look at the unprocessed tail of the tradable queue
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tradable_news_queue_unprocessed
+        ON tradable_news_queue(timestamp) WHERE processed = 0
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_story_clusters_last_seen ON story_clusters(last_seen)")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_telegram_outbox_pending
+        ON telegram_outbox(id) WHERE status = 'pending'
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_telegram_outbox_done
+        ON telegram_outbox(sent_at) WHERE status != 'pending'
+    """)
+    # (symbol, timestamp) range scans use the primary key; this one serves
+    # the all-symbol "since T" scans (resampler catch-up, archiving)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_market_data_1m_timestamp ON market_data_1m(timestamp)")
+
+
+def _outbox_origin(conn):
+    # Event time carried with each alert, for the origin-to-sent latency metric
+    if "origin_at" not in _columns(conn, "telegram_outbox"):
+        conn.execute("ALTER TABLE telegram_outbox ADD COLUMN origin_at REAL")
+
+
+def _market_data_rollups(conn):
+    # Compacted tiers of market_data_1m (see part2/scripts/market_data_tiers.py);
+    # `minutes` is the number of 1m bars folded into each row
+    for table in ("market_data_5m", "market_data_1h", "market_data_1d"):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                symbol    TEXT,
+                timestamp INTEGER,
+                open      REAL,
+                high      REAL,
+                low       REAL,
+                close     REAL,
+                volume    REAL,
+                minutes   INTEGER,
+                PRIMARY KEY(symbol, timestamp)
+            )
+        """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS compaction_state (
+            name  TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+
+
+def _raw_news_seq(conn):
+    # Consumers keep a high-water mark into raw_news_queue. The implicit
+    # rowid is no stable cursor: VACUUM may renumber it and it restarts once
+    # retention empties the table. Rebuild with an AUTOINCREMENT key, seeded
+    # from the old rowids so stored cursors stay valid.
+    conn.execute("""
+        CREATE TABLE raw_news_queue_new (
+            seq          INTEGER PRIMARY KEY AUTOINCREMENT,
+            article_id   TEXT NOT NULL UNIQUE,
+            title        TEXT NOT NULL,
+            link         TEXT NOT NULL,
+            summary      TEXT,
+            published_at DATETIME NOT NULL,
+            weight       INTEGER NOT NULL DEFAULT 1,
+            cluster_id   TEXT
+        )
+    """)
+    conn.execute("""
+        INSERT INTO raw_news_queue_new
+            (seq, article_id, title, link, summary, published_at, weight, cluster_id)
+        SELECT rowid, article_id, title, link, summary, published_at, weight, cluster_id
+        FROM raw_news_queue ORDER BY rowid
+    """)
+    conn.execute("DROP TABLE raw_news_queue")
+    conn.execute("ALTER TABLE raw_news_queue_new RENAME TO raw_news_queue")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_raw_news_queue_published_at ON raw_news_queue(published_at)")
+    conn.execute("UPDATE filter_state SET name = replace(name, '.last_rowid', '.last_seq') "
+                 "WHERE name LIKE '%.last_rowid'")
+
+
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "fix legacy db_setup columns", _fix_legacy_columns),
+    (3, "indexes for hot queries", _create_indexes),
+    (4, "telegram_outbox.origin_at", _outbox_origin),
+    (5, "market data rollup tables", _market_data_rollups),
+    (6, "raw_news_queue.seq cursor key", _raw_news_seq),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations; returns the list of (version, name) applied."""
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return []
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Re-read under the write lock: another process may have just migrated
+        version = schema_version(conn)
+        applied = []
+        for target, name, step in MIGRATIONS:
+            if target > version:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+                applied.append((target, name))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return applied
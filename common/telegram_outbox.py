@@ -0,0 +1,367 @@
+"""
+telegram_outbox.py
+
+Outbound Telegram notifications through a persistent outbox.
+
+Producers call enqueue() (or Outbox.send()) which is a single INSERT and
+returns immediately; the write can share the producer's own transaction,
+so "article handled" and "alert queued" commit together.
+
+TelegramDispatcher drains the outbox over one pooled aiohttp session:
+
+  - one worker per chat keeps that chat's messages in order
+  - a token bucket per chat and one global bucket pace requests to
+    Telegram's limits (about 1 msg/s per chat, 30 msg/s per bot)
+  - queued messages for the same chat are packed into as few requests as
+    fit in 4096 characters
+  - 429 responses pause the chat for `retry_after` seconds; network and
+    5xx errors back off exponentially
+  - a row is marked sent only after Telegram accepted it, so anything in
+    flight during a crash or restart is delivered again (at least once)
+
+Producers may pass origin_at (when the underlying event happened, e.g.
+the article was fetched); the dispatcher records origin-to-delivered
+latency in the telegram_origin_to_sent_seconds histogram.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+import aiohttp
+
+from common import metrics, storage
+
+API_BASE = "https://api.telegram.org"
+MAX_MESSAGE_CHARS = 4096
+PACK_SEPARATOR = "\n\n"
+
+GLOBAL_RATE = 25.0        # requests/s across all chats (Telegram allows ~30)
+CHAT_RATE = 1.0           # requests/s per chat
+CHAT_BURST = 1
+POLL_INTERVAL = 0.5       # seconds between outbox scans
+MAX_BACKOFF = 300.0
+MAX_ATTEMPTS = 10         # non-429 failures before a row is given up
+SENT_RETENTION_DAYS = 7
+PRUNE_INTERVAL = 3600
+
+ORIGIN_TO_SENT = metrics.histogram("telegram_origin_to_sent_seconds",
+                                   "Event (origin_at, else enqueue time) until Telegram accepted the message")
+REQUEST_SECONDS = metrics.histogram("telegram_request_seconds", "sendMessage round trip")
+REQUESTS = metrics.counter("telegram_requests_total", "sendMessage requests")
+RATE_LIMITED = metrics.counter("telegram_rate_limited_total", "sendMessage requests answered 429")
+FAILED = metrics.counter("telegram_failed_total", "Messages given up on")
+
+
+# === OUTBOX TABLE ===
+
+def enqueue(conn, chat_id, text, parse_mode=None, origin_at=None):
+    """Queue one message; the caller commits. Returns the outbox id."""
+    cur = conn.execute(
+        "INSERT INTO telegram_outbox (chat_id, text, parse_mode, created_at, origin_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (str(chat_id), text, parse_mode, time.time(), origin_at),
+    )
+    return cur.lastrowid
+
+
+class Outbox:
+    """Producer-side handle for code that has no connection of its own."""
+
+    def __init__(self, db_path):
+        # telegram_outbox comes from the shared migrations
+        self.conn = storage.connect(db_path)
+
+    def send(self, chat_id, text, parse_mode=None, origin_at=None):
+        msg_id = enqueue(self.conn, chat_id, text, parse_mode, origin_at)
+        self.conn.commit()
+        return msg_id
+
+    def close(self):
+        self.conn.close()
+
+
+# === PACKING ===
+
+def split_text(text, limit=MAX_MESSAGE_CHARS):
+    """Split an over-long message on line breaks (hard cut as a last resort)."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    chunks.append(text)
+    return chunks
+
+
+def pack_front(queue, limit=MAX_MESSAGE_CHARS, separator=PACK_SEPARATOR):
+    """
+    Take as many leading (id, text, parse_mode) items off `queue` as fit in
+    one message with the same parse_mode. Returns (items, text, parse_mode).
+    """
+    items = []
+    size = 0
+    parse_mode = queue[0][2]
+    while queue:
+        item = queue[0]
+        extra = len(item[1]) + (len(separator) if items else 0)
+        if items and (item[2] != parse_mode or size + extra > limit):
+            break
+        items.append(queue.popleft())
+        size += extra
+    return items, separator.join(item[1] for item in items), parse_mode
+
+
+# === RATE LIMITING ===
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self):
+        """Seconds until a token is available (0 if one is available now)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.delay()
+            if wait <= 0:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+    def block(self, seconds):
+        """Hold every request for `seconds` (e.g. Telegram's retry_after)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+# === DISPATCHER ===
+
+class TelegramDispatcher:
+    def __init__(self, db_path, bot_token, api_base=API_BASE, global_rate=GLOBAL_RATE,
+                 chat_rate=CHAT_RATE, chat_burst=CHAT_BURST, poll_interval=POLL_INTERVAL):
+        self.db_path = db_path
+        self.url = f"{api_base}/bot{bot_token}/sendMessage"
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.poll_interval = poll_interval
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+
+        self.queues = {}          # chat_id -> deque[(id, text, parse_mode)]
+        self.buckets = {}
+        self.wakeups = {}
+        self.workers = {}
+        self.last_loaded_id = 0
+        self.origins = {}         # id -> origin time, until the message is sent or failed
+        self._results = []        # (status, ids, error) waiting to be written back
+        self._running = False
+        self._last_prune = 0.0
+        self.conn = None
+        self.session = None
+
+        self.messages_sent = 0
+        self.requests_sent = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.failed = 0
+
+    # --- database side (only ever touched from the loader, via to_thread) ---
+
+    def _open(self):
+        # Migrated like any other database, including agent_a's own state database
+        self.conn = storage.connect(self.db_path, check_same_thread=False)
+
+    def _load_pending(self):
+        return self.conn.execute("""
+            SELECT id, chat_id, text, parse_mode, COALESCE(origin_at, created_at)
+            FROM telegram_outbox
+            WHERE status = 'pending' AND id > ?
+            ORDER BY id
+        """, (self.last_loaded_id,)).fetchall()
+
+    def _write_results(self, results):
+        now = time.time()
+        for status, ids, error in results:
+            params = [(now, error, i) for i in ids]
+            if status == "sent":
+                self.conn.executemany(
+                    "UPDATE telegram_outbox SET status = 'sent', sent_at = ?, last_error = ?, "
+                    "attempts = attempts + 1 WHERE id = ?", params)
+            elif status == "failed":
+                self.conn.executemany(
+                    "UPDATE telegram_outbox SET status = 'failed', sent_at = ?, last_error = ?, "
+                    "attempts = attempts + 1 WHERE id = ?", params)
+            else:
+                self.conn.executemany(
+                    "UPDATE telegram_outbox SET last_error = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(error, i) for i in ids])
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self.conn.execute(
+                "DELETE FROM telegram_outbox WHERE status != 'pending' AND sent_at < ?",
+                (now - SENT_RETENTION_DAYS * 86400,))
+            self._last_prune = now
+        self.conn.commit()
+
+    async def _sync(self):
+        """Write back finished sends, then pick up newly queued rows."""
+        results, self._results = self._results, []
+        await asyncio.to_thread(self._write_results, results)
+        rows = await asyncio.to_thread(self._load_pending)
+        for msg_id, chat_id, text, parse_mode, origin_at in rows:
+            self.origins[msg_id] = origin_at
+            for chunk in split_text(text):
+                self._queue_for(chat_id).append((msg_id, chunk, parse_mode))
+            self.last_loaded_id = msg_id
+        for chat_id in {r[1] for r in rows}:
+            self.wakeups[chat_id].set()
+
+    def _queue_for(self, chat_id):
+        if chat_id not in self.queues:
+            self.queues[chat_id] = deque()
+            self.buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            self.wakeups[chat_id] = asyncio.Event()
+            self.workers[chat_id] = asyncio.create_task(self._chat_worker(chat_id))
+        return self.queues[chat_id]
+
+    # --- sending side ---
+
+    async def _post(self, chat_id, text, parse_mode):
+        """Returns (ok, retry_after, error, permanent)."""
+        payload = {"chat_id": chat_id, "text": text, "disable_web_page_preview": True}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        REQUESTS.inc()
+        started = time.perf_counter()
+        try:
+            async with self.session.post(self.url, json=payload) as resp:
+                try:
+                    body = await resp.json(content_type=None)
+                except ValueError:
+                    body = {}
+                REQUEST_SECONDS.observe(time.perf_counter() - started)
+                if resp.status == 200:
+                    return True, 0, None, False
+                error = f"HTTP {resp.status}: {body.get('description', '')}".strip()
+                if resp.status == 429:
+                    retry_after = (body.get("parameters") or {}).get("retry_after", 1)
+                    return False, float(retry_after), error, False
+                return False, 0, error, 400 <= resp.status < 500
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return False, 0, f"{type(e).__name__}: {e}", False
+
+    async def _chat_worker(self, chat_id):
+        queue = self.queues[chat_id]
+        bucket = self.buckets[chat_id]
+        wakeup = self.wakeups[chat_id]
+        failures = 0
+
+        while self._running:
+            if not queue:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+
+            items, text, parse_mode = pack_front(queue)
+            ids = sorted({item[0] for item in items})
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            ok, retry_after, error, permanent = await self._post(chat_id, text, parse_mode)
+            self.requests_sent += 1
+
+            if not ok and permanent and parse_mode:
+                # Usually broken Markdown in a headline; plain text still gets it out
+                ok, retry_after, error, permanent = await self._post(chat_id, text, None)
+                self.requests_sent += 1
+
+            if ok:
+                failures = 0
+                # A split message is only done once its last chunk went out
+                if queue and queue[0][0] == ids[-1]:
+                    ids = ids[:-1]
+                self.messages_sent += len(ids)
+                now = time.time()
+                for msg_id in ids:
+                    origin_at = self.origins.pop(msg_id, None)
+                    if origin_at is not None:
+                        ORIGIN_TO_SENT.observe(now - origin_at)
+                if ids:
+                    self._results.append(("sent", ids, None))
+                continue
+
+            if retry_after:
+                self.rate_limited += 1
+                RATE_LIMITED.inc()
+                queue.extendleft(reversed(items))
+                bucket.block(retry_after)
+                self._results.append(("retry", ids, error))
+                continue
+
+            failures += 1
+            self.errors += 1
+            if permanent or failures >= MAX_ATTEMPTS:
+                while queue and queue[0][0] == ids[-1]:
+                    queue.popleft()  # rest of a split message
+                self.failed += len(ids)
+                FAILED.inc(len(ids))
+                for msg_id in ids:
+                    self.origins.pop(msg_id, None)
+                self._results.append(("failed", ids, error))
+                print(f"[telegram_outbox] giving up on {len(ids)} message(s) for {chat_id}: {error}")
+                failures = 0
+            else:
+                queue.extendleft(reversed(items))
+                bucket.block(min(MAX_BACKOFF, 2 ** failures))
+                self._results.append(("retry", ids, error))
+
+    # --- lifecycle ---
+
+    async def run(self):
+        self._running = True
+        metrics.gauge("telegram_pending_messages", "Chunks queued in the dispatcher").set_function(self.pending)
+        await asyncio.to_thread(self._open)
+        timeout = aiohttp.ClientTimeout(total=15)
+        connector = aiohttp.TCPConnector(limit=32, keepalive_timeout=60)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            self.session = session
+            try:
+                while self._running:
+                    await self._sync()
+                    await asyncio.sleep(self.poll_interval)
+            finally:
+                for task in self.workers.values():
+                    task.cancel()
+                await asyncio.gather(*self.workers.values(), return_exceptions=True)
+                results, self._results = self._results, []
+                await asyncio.to_thread(self._write_results, results)
+                self.conn.close()
+
+    def stop(self):
+        self._running = False
+
+    def pending(self):
+        return sum(len(q) for q in self.queues.values())
+
+    def stats(self):
+        return {
+            "messages_sent": self.messages_sent,
+            "requests_sent": self.requests_sent,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "failed": self.failed,
+            "pending": self.pending(),
+            "chats": len(self.queues),
+        }
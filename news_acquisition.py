@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 import time
 import sqlite3
-import os
 import feedparser
 
-# Path to the SQLite database created earlier
-DB_PATH = os.path.expanduser("~/crypto_algotrader_part1/crypto_part1.db")
+from common import storage
+
+# Path to the shared SQLite database (schema in common/storage.py)
+DB_PATH = storage.DB_PATH
 
 # List of RSS feed URLs for crypto news (you can add or remove URLs here)
 RSS_FEEDS = [
@@ -18,43 +19,60 @@ RSS_FEEDS = [
 # Interval (in seconds) between fetches
 FETCH_INTERVAL = 120  # 2 minutes
 
+# Dedup/queue rows older than this many days are pruned, checked once an hour
+RETENTION_DAYS = 30
+RETENTION_INTERVAL = 3600
+
 def get_db_connection():
     """Open a connection to the SQLite database (with row access)."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = storage.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
-def article_already_seen(conn, article_id):
-    """Check if article_id exists in fetched_articles table."""
+def find_unseen(conn, article_ids):
+    """Return the subset of article_ids not yet in fetched_articles (one join)."""
     cur = conn.cursor()
-    cur.execute("SELECT 1 FROM fetched_articles WHERE article_id = ?", (article_id,))
-    return cur.fetchone() is not None
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS cycle_ids (article_id TEXT PRIMARY KEY)")
+    cur.execute("DELETE FROM cycle_ids")
+    cur.executemany("INSERT OR IGNORE INTO cycle_ids (article_id) VALUES (?)",
+                    [(aid,) for aid in article_ids])
+    cur.execute("""
+        SELECT c.article_id
+        FROM cycle_ids c
+        LEFT JOIN fetched_articles f ON f.article_id = c.article_id
+        WHERE f.article_id IS NULL
+    """)
+    return {row[0] for row in cur.fetchall()}
 
-def mark_article_seen(conn, article_id, fetched_at):
-    """Insert a new article_id into fetched_articles to mark it seen."""
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO fetched_articles (article_id, fetched_at) VALUES (?, ?)",
-        (article_id, fetched_at)
+def mark_articles_seen(conn, rows):
+    """Insert (article_id, fetched_at) rows into fetched_articles (no commit)."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO fetched_articles (article_id, fetched_at) VALUES (?, ?)",
+        rows
     )
-    conn.commit()
 
-def enqueue_raw_article(conn, article_id, headline, url, summary, published_at):
-    """Insert a new row into raw_news_queue."""
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-            INSERT INTO raw_news_queue (article_id, headline, url, summary, published_at)
-            VALUES (?, ?, ?, ?, ?)
-        """, (article_id, headline, url, summary, published_at))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        # If the same article_id already exists in raw_news_queue, ignore
-        pass
+def enqueue_raw_articles(conn, rows):
+    """Insert (article_id, title, link, summary, published_at) rows (no commit)."""
+    # Articles already in raw_news_queue are ignored
+    conn.executemany("""
+        INSERT OR IGNORE INTO raw_news_queue (article_id, title, link, summary, published_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows)
+
+def prune_old_articles(conn, retention_days=RETENTION_DAYS):
+    """Delete dedup/queue rows fetched more than retention_days ago."""
+    cutoff = storage.utc_iso(time.time() - retention_days * 86400)
+    with conn:
+        conn.execute("""
+            DELETE FROM raw_news_queue WHERE article_id IN
+                (SELECT article_id FROM fetched_articles WHERE fetched_at < ?)
+        """, (cutoff,))
+        cur = conn.execute("DELETE FROM fetched_articles WHERE fetched_at < ?", (cutoff,))
+    print(f"[Retention] Pruned {cur.rowcount} articles older than {retention_days} days")
 
 def fetch_and_store():
-    """Fetch each RSS feed, dedupe, and store new articles."""
-    conn = get_db_connection()
+    """Fetch each RSS feed, dedupe, and store new articles in one transaction."""
+    candidates = {}
     for feed_url in RSS_FEEDS:
         feed = feedparser.parse(feed_url)
         if feed.bozo:
@@ -63,35 +81,50 @@ def fetch_and_store():
             continue
 
         for entry in feed.entries:
-            # Use a unique article_id: prefer entry.id if available, else entry.link
-            article_id = entry.get("id", entry.get("link", None))
-            if not article_id:
-                # If neither ID nor link exists, skip this item
+            # Same key as part1's fetcher (sha256 of the link), so both dedup
+            # against the same fetched_articles rows
+            url = entry.get("link", "").strip()
+            if not url:
                 continue
-
-            # If we’ve already seen this article, skip
-            if article_already_seen(conn, article_id):
+            article_id = storage.article_id(url)
+            if article_id in candidates:
+                # Another feed already carried it this cycle
                 continue
 
             # Extract fields (some entries may not have summary; handle gracefully)
             headline = entry.get("title", "").strip()
-            url = entry.get("link", "").strip()
             summary = entry.get("summary", "").strip() if entry.get("summary") else ""
             published_at = entry.get("published", entry.get("updated", ""))
+            candidates[article_id] = (article_id, headline, url, summary, published_at)
 
-            # Mark as seen and insert into raw_news_queue
-            fetched_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
-            mark_article_seen(conn, article_id, fetched_at)
-            enqueue_raw_article(conn, article_id, headline, url, summary, published_at)
-            print(f"[New] {headline}")
+    conn = get_db_connection()
+    try:
+        # If we’ve already seen an article, skip it
+        unseen = find_unseen(conn, candidates)
+        new_rows = [candidates[aid] for aid in candidates if aid in unseen]
+
+        # Mark as seen and insert into raw_news_queue
+        fetched_at = storage.utc_iso()
+        mark_articles_seen(conn, [(row[0], fetched_at) for row in new_rows])
+        enqueue_raw_articles(conn, new_rows)
+        conn.commit()
+    finally:
+        conn.close()
 
-    conn.close()
+    for row in new_rows:
+        print(f"[New] {row[1]}")
 
 def main():
     print("=== Starting news_acquisition.py ===")
+    last_pruned = 0.0
     while True:
         try:
             fetch_and_store()
+            if time.time() - last_pruned >= RETENTION_INTERVAL:
+                conn = get_db_connection()
+                prune_old_articles(conn)
+                conn.close()
+                last_pruned = time.time()
         except Exception as e:
             print(f"[Error] Exception during fetch_and_store: {e}")
         time.sleep(FETCH_INTERVAL)
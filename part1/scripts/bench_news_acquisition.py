@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+bench_news_acquisition.py
+
+Runs news_acquisition's fetch and store stages against a local HTTP
+stand-in serving the fixture feeds in fixtures/feeds/:
+
+    /a.rss          feed_a.xml, ETag validator (304 on If-None-Match)
+    /b.rss          feed_b.xml, Last-Modified validator (304 on If-Modified-Since)
+    /malformed.rss  malformed.xml, 200 with a body that is not a feed
+    /slow.rss       answers after FEED_TIMEOUT has passed
+    /error.rss      HTTP 503
+
+Cycle 1 must queue the four URLs of a and b (one story carried by both
+feeds, so weight 2), count the three broken feeds as errors without
+losing the cycle, and finish within the feed timeout. Cycle 2 must get
+304 from a and b and queue nothing. Then feed a gains an item and cycle
+3 must queue just that one. Exits non-zero if any check fails.
+
+Usage: python bench_news_acquisition.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import aiohttp
+from aiohttp import web
+
+import news_acquisition as na
+from story_clusters import StoryClusterer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics, storage
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "feeds")
+FEED_TIMEOUT = 0.5   # seconds; /slow.rss answers after twice this
+LAST_MODIFIED = "Tue, 13 Oct 2026 14:07:00 GMT"
+EXTRA_ITEM = b"""    <item>
+      <title>Stablecoin issuer mints $1 billion on Tron</title>
+      <link>https://news.example/stablecoin-mint</link>
+      <description>The issuer minted another billion tokens overnight.</description>
+      <pubDate>Tue, 13 Oct 2026 15:00:00 GMT</pubDate>
+    </item>
+  </channel>"""
+
+
+class FeedServer:
+    def __init__(self):
+        self.bodies = {}
+        for name in ("feed_a", "feed_b", "malformed"):
+            with open(os.path.join(FIXTURES, f"{name}.xml"), "rb") as f:
+                self.bodies[name] = f.read()
+        self.version = 1          # bumps the ETag of feed a
+        self.statuses = []        # (path, status) per request
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/a.rss", self.feed_a)
+        app.router.add_get("/b.rss", self.feed_b)
+        app.router.add_get("/malformed.rss", self.malformed)
+        app.router.add_get("/slow.rss", self.slow)
+        app.router.add_get("/error.rss", self.error)
+        return app
+
+    def _reply(self, request, status, body=None, headers=None):
+        self.statuses.append((request.path, status))
+        return web.Response(status=status, body=body, headers=headers, content_type="application/rss+xml")
+
+    async def feed_a(self, request):
+        etag = f'"a-{self.version}"'
+        if request.headers.get("If-None-Match") == etag:
+            return self._reply(request, 304, headers={"ETag": etag})
+        return self._reply(request, 200, self.bodies["feed_a"], {"ETag": etag})
+
+    async def feed_b(self, request):
+        if request.headers.get("If-Modified-Since") == LAST_MODIFIED:
+            return self._reply(request, 304, headers={"Last-Modified": LAST_MODIFIED})
+        return self._reply(request, 200, self.bodies["feed_b"], {"Last-Modified": LAST_MODIFIED})
+
+    async def malformed(self, request):
+        return self._reply(request, 200, self.bodies["malformed"])
+
+    async def slow(self, request):
+        await asyncio.sleep(FEED_TIMEOUT * 2)
+        return self._reply(request, 200, self.bodies["feed_b"])
+
+    async def error(self, request):
+        return self._reply(request, 503, b"Service Unavailable")
+
+    def add_item_to_a(self):
+        self.bodies["feed_a"] = self.bodies["feed_a"].replace(b"  </channel>", EXTRA_ITEM)
+        self.version += 1
+
+
+def check(ok, message):
+    print(f"  {'ok  ' if ok else 'FAIL'} {message}")
+    return ok
+
+
+async def run(pool, db_path):
+    server = FeedServer()
+    runner = web.AppRunner(server.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    na.RSS_FEEDS = [f"{base}/{name}.rss" for name in ("a", "b", "malformed", "slow", "error")]
+    na.FEED_TIMEOUT = FEED_TIMEOUT
+    feed_a, feed_b = na.RSS_FEEDS[:2]
+
+    conn = storage.get_connection(db_path)
+    clusterer = StoryClusterer()
+    feed_state = na.load_feed_state(conn)
+    passed = True
+
+    async def cycle(label):
+        errors_before = na.FEED_ERRORS.value
+        del server.statuses[:]
+        started = time.perf_counter()
+        url_map, updates = await na.fetch_all_feeds(session, pool, feed_state)
+        elapsed = time.perf_counter() - started
+        new_rows = na.store_new_articles(conn, url_map, datetime.now(timezone.utc).isoformat(), clusterer)
+        na.save_feed_state(conn, updates)
+        conn.commit()
+        feed_state.update(updates)
+        statuses = dict(server.statuses)
+        print(f"{label}: {elapsed * 1000:6.1f} ms, {len(url_map)} URLs, {len(new_rows)} new, "
+              f"{na.FEED_ERRORS.value - errors_before} feed errors, responses {sorted(statuses.items())}")
+        return url_map, updates, new_rows, na.FEED_ERRORS.value - errors_before, elapsed, statuses
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            url_map, updates, new_rows, errors, elapsed, _ = await cycle("cycle 1")
+            passed &= check(set(updates) == {feed_a, feed_b}, "validators stored for the two good feeds only")
+            passed &= check(len(url_map) == 4 and len(new_rows) == 4, "4 unique URLs queued")
+            shared = url_map.get("https://news.example/btc-etf-inflows", {})
+            passed &= check(shared.get("weight") == 2, "story carried by both feeds has weight 2")
+            passed &= check(errors == 3, "malformed, slow and 503 feeds counted as errors")
+            passed &= check(elapsed < FEED_TIMEOUT + 0.4, "cycle bounded by the feed timeout")
+
+            url_map, updates, new_rows, errors, _, statuses = await cycle("cycle 2")
+            passed &= check(statuses.get("/a.rss") == 304 and statuses.get("/b.rss") == 304,
+                            "unchanged feeds answer 304")
+            passed &= check(not url_map and not new_rows, "nothing parsed or queued")
+
+            server.add_item_to_a()
+            url_map, updates, new_rows, errors, _, statuses = await cycle("cycle 3")
+            passed &= check(statuses.get("/a.rss") == 200 and statuses.get("/b.rss") == 304,
+                            "changed feed downloaded again, other still 304")
+            passed &= check([r[3] for r in new_rows] == ["https://news.example/stablecoin-mint"],
+                            "only the added item queued")
+    finally:
+        await runner.cleanup()
+
+    queued = conn.execute("SELECT COUNT(*) FROM raw_news_queue").fetchone()[0]
+    passed &= check(queued == 5, f"raw_news_queue holds 5 rows ({queued})")
+    return passed
+
+
+def main():
+    # Same order as the service: fork the parser workers before any thread starts
+    with ProcessPoolExecutor(max_workers=na.PARSE_WORKERS) as pool:
+        pool.submit(int).result()
+        with tempfile.TemporaryDirectory() as tmp:
+            na.log_writer = metrics.LogWriter(os.path.join(tmp, "news_acquisition.log"))
+            passed = asyncio.run(run(pool, os.path.join(tmp, "crypto.db")))
+            na.log_writer.close()
+    if not passed:
+        sys.exit("news_acquisition fixture checks failed")
+
+
+if __name__ == "__main__":
+    main()
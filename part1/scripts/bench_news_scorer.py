@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+bench_news_scorer.py
+
+CPU inference throughput of the sentiment model: fp32 vs int8 dynamic
+quantization across batch sizes, plus label agreement between the two
+so the quantized model can be trusted. Needs torch + transformers.
+
+Usage: python bench_news_scorer.py [MODEL_NAME] [N_TEXTS]
+"""
+
+import random
+import sys
+import time
+
+from news_scorer import MODEL_NAME, SCORER_THREADS, SentimentScorer
+
+SUBJECTS = ["Bitcoin", "Ether", "Solana", "XRP", "Binance", "Coinbase", "Tether", "The SEC"]
+EVENTS = ["surges to record high after ETF inflows", "plunges as liquidations top $500 million",
+          "holds steady ahead of Fed decision", "faces lawsuit over unregistered securities",
+          "reports record quarterly profit", "suffers $230 million exploit", "is little changed"]
+
+
+def texts(n, seed=3):
+    rng = random.Random(seed)
+    return [f"{rng.choice(SUBJECTS)} {rng.choice(EVENTS)}. Analysts expect volatility to persist "
+            f"as traders weigh macro data and on-chain flows." for _ in range(n)]
+
+
+def run(scorer, data, batch):
+    started = time.perf_counter()
+    out = []
+    for i in range(0, len(data), batch):
+        out.extend(scorer.score(data[i:i + batch]))
+    return len(data) / (time.perf_counter() - started), out
+
+
+if __name__ == "__main__":
+    model = sys.argv[1] if len(sys.argv) > 1 else MODEL_NAME
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    data = texts(n)
+    print(f"{model}, {SCORER_THREADS} threads, {n} texts")
+
+    fp32 = SentimentScorer(model, quantize=False)
+    int8 = SentimentScorer(model, quantize=True)
+    for batch in (1, 8, 32):
+        rate32, out32 = run(fp32, data, batch)
+        rate8, out8 = run(int8, data, batch)
+        agree = sum(a[0] == b[0] for a, b in zip(out32, out8)) / n
+        print(f"batch {batch:>3}: fp32 {rate32:7.1f}/s  int8 {rate8:7.1f}/s  "
+              f"({rate8 / rate32:.2f}x)  label agreement {agree:.1%}")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+bench_story_clusters.py
+
+1. Quality: feeds the labeled fixture (fixtures/story_clusters_fixture.json,
+   articles tagged with the story they belong to) through StoryClusterer
+   in several random orders and reports pairwise precision / recall /
+   F1: a pair counts as predicted-same when both articles land in the
+   same cluster, and as truly-same when they share a story label.
+
+2. Throughput: clusters a synthetic stream (default 5000 articles, a
+   third of them rewrites of earlier ones) and reports articles/s and
+   candidate comparisons per article, which stays flat with window size
+   instead of growing like pairwise matching would.
+
+Usage: python bench_story_clusters.py [N_ARTICLES]
+"""
+
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+from story_clusters import StoryClusterer, SIM_THRESHOLD
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "story_clusters_fixture.json")
+
+
+def pairwise_scores(labels, clusters):
+    tp = fp = fn = 0
+    for i, j in itertools.combinations(range(len(labels)), 2):
+        same_story = labels[i] == labels[j]
+        same_cluster = clusters[i] == clusters[j]
+        tp += same_story and same_cluster
+        fp += same_cluster and not same_story
+        fn += same_story and not same_cluster
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def evaluate(threshold=SIM_THRESHOLD, orders=20, verbose=False):
+    with open(FIXTURE) as f:
+        articles = json.load(f)
+    totals = [0.0, 0.0, 0.0]
+    for seed in range(orders):
+        order = articles[:]
+        random.Random(seed).shuffle(order)
+        clusterer = StoryClusterer(threshold=threshold)
+        assigned = [clusterer.assign(str(k), a["title"], a["summary"], [a["source"]], ts=1e9 + k).cluster_id
+                    for k, a in enumerate(order)]
+        scores = pairwise_scores([a["story"] for a in order], assigned)
+        totals = [t + s for t, s in zip(totals, scores)]
+        if verbose and seed == 0:
+            for a, c in sorted(zip(order, assigned), key=lambda x: (x[0]["story"], x[1])):
+                print(f"  {a['story']:<18} {c:>4}  {a['title'][:60]}")
+    return [t / orders for t in totals]
+
+
+def synthetic_stream(n, seed=7):
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(5000)]
+    originals = []
+    for k in range(n):
+        if originals and rng.random() < 0.33:
+            title = originals[rng.randrange(len(originals))].split()
+            for _ in range(2):  # light rewrite: swap in a couple of words
+                title[rng.randrange(len(title))] = rng.choice(vocab)
+            yield " ".join(title)
+        else:
+            title = " ".join(rng.choice(vocab) for _ in range(12))
+            originals.append(title)
+            yield title
+
+
+def throughput(n):
+    clusterer = StoryClusterer()
+    stream = list(synthetic_stream(n))
+    started = time.perf_counter()
+    for k, title in enumerate(stream):
+        clusterer.assign(str(k), title, "", ["feed"], ts=1e9 + k)
+    elapsed = time.perf_counter() - started
+    return n / elapsed, clusterer.comparisons / n, len(clusterer.clusters)
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    for threshold in (0.2, 0.25, 0.3, 0.4):
+        p, r, f1 = evaluate(threshold)
+        mark = "  <- SIM_THRESHOLD" if threshold == SIM_THRESHOLD else ""
+        print(f"threshold {threshold:.2f}: precision {p:.3f}  recall {r:.3f}  F1 {f1:.3f}{mark}")
+    rate, comparisons, clusters = throughput(n)
+    print(f"{n} synthetic articles: {rate:,.0f} articles/s, "
+          f"{comparisons:.1f} candidate comparisons per article, {clusters} clusters")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+keyword_matcher.py
+
+Whole-word keyword matching for the news filter, built once from
+news_filter_config.yaml.
+
+All keywords are folded into a single compiled regex shaped like a trie
+(shared prefixes are factored out: "et(?:f|h(?:ereum)?)"), wrapped in
+word boundaries, so one left-to-right pass over the text finds every
+match and the cost stays flat as the list grows into the hundreds.
+A plain keyword also matches its common inflections (INFLECTIONS:
+"ETF" -> ETFs, "hack" -> hacked, "listing" -> listings); a keyword
+ending in "*" matches as a prefix ("hack*" -> hacker, hackathon).
+
+ReloadingKeywordMatcher re-reads the YAML when its mtime changes.
+"""
+
+import os
+import re
+import time
+from collections import namedtuple
+
+import yaml
+
+Match = namedtuple("Match", "keyword start end")
+
+RELOAD_CHECK_SECONDS = 2.0
+INFLECTIONS = r"(?:s|es|'s|d|ed|ing)?"   # optional ending after a plain keyword
+
+
+def _trie_pattern(words):
+    """Regex alternation for `words` with common prefixes factored out."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def walk(node):
+        end = "" in node
+        branches = [re.escape(ch) + walk(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not end:
+            return branches[0]
+        body = "(?:" + "|".join(branches) + ")"
+        return body + "?" if end else body
+
+    return walk(trie)
+
+
+class KeywordMatcher:
+    def __init__(self, keywords):
+        self.keywords = []
+        exact, prefix = [], []
+        self._canonical = {}
+        for kw in keywords:
+            kw = str(kw).strip()
+            if not kw:
+                continue
+            is_prefix = kw.endswith("*")
+            base = kw.rstrip("*").lower()
+            if not base or base in self._canonical:
+                continue
+            self._canonical[base] = kw
+            self.keywords.append(kw)
+            (prefix if is_prefix else exact).append(base)
+
+        parts = []
+        if exact:
+            parts.append(r"(?P<exact>" + _trie_pattern(exact) + r")" + INFLECTIONS + r"(?!\w)")
+        if prefix:
+            parts.append(r"(?P<prefix>" + _trie_pattern(prefix) + r")\w*")
+        self.pattern = re.compile(r"(?<!\w)(?:" + "|".join(parts) + ")", re.IGNORECASE) if parts else None
+
+    @classmethod
+    def from_config(cls, path):
+        with open(path, "r") as f:
+            cfg = yaml.safe_load(f) or {}
+        return cls(cfg.get("keywords", []))
+
+    def find(self, *texts):
+        """
+        All whole-word matches (inflections included) as Match(keyword,
+        start, end), the span covering the whole word. With several
+        texts (title, summary) offsets index into "\\n".join(texts).
+        """
+        if self.pattern is None:
+            return []
+        text = "\n".join(t or "" for t in texts)
+        matches = []
+        for m in self.pattern.finditer(text):
+            # The trie only stops at the end of a keyword, so the named group
+            # holds exactly one (the longest that fits)
+            key = m.group(m.lastgroup).lower()
+            matches.append(Match(self._canonical[key], m.start(), m.end()))
+        return matches
+
+    def matched_keywords(self, *texts):
+        """Distinct keywords found, in order of first appearance."""
+        seen = []
+        for m in self.find(*texts):
+            if m.keyword not in seen:
+                seen.append(m.keyword)
+        return seen
+
+
+class ReloadingKeywordMatcher:
+    """KeywordMatcher plus the rest of the filter config, reloaded on change."""
+
+    def __init__(self, path, check_every=RELOAD_CHECK_SECONDS):
+        self.path = path
+        self.check_every = check_every
+        self._mtime = None
+        self._last_check = 0.0
+        self.config = {}
+        self.matcher = KeywordMatcher([])
+        self.reload()
+
+    def reload(self):
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, "r") as f:
+            cfg = yaml.safe_load(f) or {}
+        self.matcher = KeywordMatcher(cfg.get("keywords", []))
+        self.config = cfg
+        self._mtime = mtime
+        return True
+
+    def maybe_reload(self):
+        """Reload if the file changed; cheap enough to call every loop."""
+        now = time.monotonic()
+        if now - self._last_check < self.check_every:
+            return False
+        self._last_check = now
+        try:
+            if os.path.getmtime(self.path) != self._mtime:
+                return self.reload()
+        except (OSError, yaml.YAMLError) as e:
+            # Keep the last good keyword set if the file is mid-edit or broken
+            print(f"[keyword_matcher] reload failed, keeping previous config: {e}")
+        return False
+
+    def find(self, *texts):
+        return self.matcher.find(*texts)
+
+    def matched_keywords(self, *texts):
+        return self.matcher.matched_keywords(*texts)
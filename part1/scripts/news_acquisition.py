@@ -2,32 +2,41 @@
 """
 news_acquisition.py
 
-Loop every 120 seconds, fetch a fixed set of RSS feeds,
-dedupe by URL, count how many sources provided the same URL (weight),
-and insert new articles into SQLite (fetched_articles + raw_news_queue).
+Loop every FETCH_INTERVAL seconds, fetch a fixed set of RSS feeds
+concurrently (conditional GET, so unchanged feeds cost a 304 and no
+parse), dedupe by URL, group rewritten/syndicated copies of a story into
+clusters (story_clusters.py), weight each article by the number of
+distinct feeds carrying its story, and insert new articles into SQLite
+(fetched_articles + raw_news_queue).
 """
 
 import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 import time
-import hashlib
-import sqlite3
+import sys
+import aiohttp
 import feedparser
 from textwrap import shorten
 
+from news_signal import notify_new_rows
+from story_clusters import StoryClusterer, save_clusters, warm_start
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics, storage
+
 # === LOGGING SETUP ===
 log_file = "/home/tito/crypto_algotrader_part1/logs/part1/news_acquisition.log"
-os.makedirs(os.path.dirname(log_file), exist_ok=True)
-
-def log(message):
-    timestamp = datetime.now(timezone.utc).isoformat()
-    with open(log_file, "a") as f:
-        f.write(f"[{timestamp}] {message}\n")
+# Buffered: log() only queues the line, a background thread appends it.
+# Started in __main__ once the parser pool has forked (see there).
+log_writer = None
 
-log("Script execution started")
+def log(message, **fields):
+    log_writer.write(message, **fields)
 
 # === DB PATH ===
-DB_PATH = "/home/tito/crypto_algotrader_part1/part1/db/crypto.db"
+DB_PATH = storage.DB_PATH
 
 # === RSS FEEDS ===
 RSS_FEEDS = [
@@ -41,99 +50,282 @@ RSS_FEEDS = [
     "https://rss.feedspot.com/cryptonewsz.xml"
 ]
 
-FETCH_INTERVAL = 120  # seconds
+FETCH_INTERVAL = 30   # seconds; unchanged feeds answer 304, so polling is cheap
+FEED_TIMEOUT = 10     # seconds per feed; a slow feed only loses its own cycle
+PARSE_WORKERS = 4
+USER_AGENT = "crypto_algotrader-news/1.0"
+
+RETENTION_DAYS = 30         # dedup/queue rows older than this are pruned
+RETENTION_INTERVAL = 3600   # seconds between retention passes
+METRICS_PORT = 9103         # Prometheus text at http://127.0.0.1:9103/metrics
+
+CYCLE_SECONDS = metrics.histogram("news_cycle_seconds", "Fetch, parse and store cycle over all feeds")
+STORE_SECONDS = metrics.histogram("news_store_seconds", "Dedup, clustering and commit of one cycle")
+NEW_ARTICLES = metrics.counter("news_new_articles_total", "Articles added to raw_news_queue")
+FEED_ERRORS = metrics.counter("news_feed_errors_total", "Feed requests that failed or returned non-200/304")
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # One long-lived connection per process (see common/storage.py)
+    return storage.get_connection(DB_PATH)
+
+def load_feed_state(conn):
+    rows = conn.execute("SELECT feed_url, etag, last_modified FROM feed_state").fetchall()
+    return {r["feed_url"]: (r["etag"], r["last_modified"]) for r in rows}
+
+def save_feed_state(conn, updates):
+    now_ts = datetime.now(timezone.utc).isoformat()
+    conn.executemany(
+        """
+        INSERT INTO feed_state (feed_url, etag, last_modified, checked_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(feed_url) DO UPDATE SET
+            etag = excluded.etag,
+            last_modified = excluded.last_modified,
+            checked_at = excluded.checked_at
+        """,
+        [(url, etag, modified, now_ts) for url, (etag, modified) in updates.items()]
+    )
 
 def compute_article_id(url: str) -> str:
-    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return storage.article_id(url)
+
+def find_unseen(conn, article_ids):
+    """
+    Set-based dedup: load this cycle's IDs into a temp table and return the
+    ones missing from fetched_articles with a single join.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS cycle_ids (article_id TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM cycle_ids")
+    conn.executemany("INSERT OR IGNORE INTO cycle_ids (article_id) VALUES (?)",
+                     [(aid,) for aid in article_ids])
+    rows = conn.execute("""
+        SELECT c.article_id
+        FROM cycle_ids c
+        LEFT JOIN fetched_articles f ON f.article_id = c.article_id
+        WHERE f.article_id IS NULL
+    """).fetchall()
+    return {r[0] for r in rows}
+
+def store_new_articles(conn, url_map, now_ts, clusterer):
+    """
+    Dedup the cycle's URLs, assign new articles to story clusters and
+    bulk-insert them. Returns the new rows.
+    """
+    by_id = {compute_article_id(link): link for link in url_map}
+    unseen = find_unseen(conn, by_id)
+    now = time.time()
+
+    new_rows = []
+    touched = []
+    for article_id, link in by_id.items():
+        info = url_map[link]
+        if article_id not in unseen:
+            # Known URL picked up by another feed: it still adds a source
+            if article_id in clusterer.signatures:
+                touched.append(clusterer.assign(article_id, "", sources=info["sources"], ts=now).cluster_id)
+            continue
+        story = clusterer.assign(article_id, info["title"], info["summary"],
+                                 sources=info["sources"], ts=now)
+        touched.append(story.cluster_id)
+        new_rows.append((article_id, info["title"], info["summary"], link,
+                         info["published"], max(info["weight"], story.weight), story.cluster_id))
+
+    conn.executemany(
+        "INSERT INTO fetched_articles (article_id, fetched_at, weight) VALUES (?, ?, ?)",
+        [(r[0], now_ts, r[5]) for r in new_rows]
+    )
+    conn.executemany(
+        """
+        INSERT OR IGNORE INTO raw_news_queue
+          (article_id, title, summary, link, published_at, weight, cluster_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        new_rows
+    )
+    save_clusters(conn, clusterer, touched)
+    return new_rows
+
+def prune_old_articles(conn, retention_days=RETENTION_DAYS):
+    """
+    Drop dedup and queue rows fetched more than retention_days ago so the
+    lookup tables stop growing. fetched_at is ISO-8601 UTC, so string
+    comparison is chronological.
+    """
+    cutoff = storage.utc_iso(time.time() - retention_days * 86400)
+    expired = "SELECT article_id FROM fetched_articles WHERE fetched_at < ?"
+    with conn:
+        raw = conn.execute(f"DELETE FROM raw_news_queue WHERE article_id IN ({expired})", (cutoff,))
+        alerted = conn.execute(f"DELETE FROM alerted_articles WHERE article_id IN ({expired})", (cutoff,))
+        fetched = conn.execute("DELETE FROM fetched_articles WHERE fetched_at < ?", (cutoff,))
+        clusters = conn.execute("DELETE FROM story_clusters WHERE last_seen < ?", (cutoff,))
+    log(f"Retention: pruned {fetched.rowcount} fetched, {raw.rowcount} queued, "
+        f"{alerted.rowcount} alerted rows, {clusters.rowcount} story clusters "
+        f"older than {retention_days} days.")
 
-def fetch_all_feeds():
+def parse_feed(body):
+    """
+    Runs in the parser pool: parse raw feed bytes and return plain dicts
+    (cheap to send back across the process boundary).
     """
-    Parse each RSS feed, return a dict mapping URL -> dict(title, summary, published, weight).
+    d = feedparser.parse(body)
+    if d.bozo and not d.entries:
+        # feedparser tolerates most breakage; nothing usable means a bad body
+        raise ValueError(f"unparseable feed: {d.get('bozo_exception')!r}")
+    entries = []
+    for entry in d.entries:
+        entries.append({
+            "link": entry.get("link"),
+            "title": entry.get("title", "").strip(),
+            "summary": entry.get("summary", "") or entry.get("description", ""),
+            "published": entry.get("published") or entry.get("updated") or "",
+        })
+    return entries
+
+async def fetch_feed(session, feed_url, validators):
     """
-    url_map = {}  # url -> {title, summary, published, weight}
-    for feed_url in RSS_FEEDS:
-        d = feedparser.parse(feed_url)
-        log(f"Fetched feed: {feed_url} with {len(d.entries)} entries.")
-        for entry in d.entries:
-            link = entry.get("link")
+    Conditional GET for one feed. Returns (status, body, etag, last_modified);
+    body is None when the feed is unchanged (304) or the request failed.
+    """
+    started = time.perf_counter()
+    try:
+        return await _fetch_feed(session, feed_url, validators)
+    finally:
+        metrics.histogram("news_feed_fetch_seconds", "Conditional GET of one feed",
+                          feed=feed_url).observe(time.perf_counter() - started)
+
+async def _fetch_feed(session, feed_url, validators):
+    etag, modified = validators
+    headers = {"User-Agent": USER_AGENT}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    try:
+        async with session.get(feed_url, headers=headers,
+                               timeout=aiohttp.ClientTimeout(total=FEED_TIMEOUT)) as resp:
+            if resp.status == 304:
+                return 304, None, etag, modified
+            if resp.status != 200:
+                FEED_ERRORS.inc()
+                log(f"Feed {feed_url} returned HTTP {resp.status}")
+                return resp.status, None, etag, modified
+            body = await resp.read()
+            return 200, body, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        FEED_ERRORS.inc()
+        log(f"Feed {feed_url} failed: {e!r}")
+        return None, None, etag, modified
+
+async def fetch_all_feeds(session, pool, feed_state):
+    """
+    Fetch every feed concurrently, parse changed ones in the worker pool and
+    return (url_map, validator_updates). url_map maps URL ->
+    dict(title, summary, published, weight, sources). A feed that fails to
+    fetch or parse is logged and skipped; its validators are not updated,
+    so the next cycle downloads it again.
+    """
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        fetch_feed(session, url, feed_state.get(url, (None, None))) for url in RSS_FEEDS
+    ), return_exceptions=True)
+
+    changed = []
+    for feed_url, result in zip(RSS_FEEDS, results):
+        if isinstance(result, Exception):
+            FEED_ERRORS.inc()
+            log(f"Feed {feed_url} failed: {result!r}")
+            continue
+        status, body, etag, modified = result
+        if status == 304:
+            log(f"Feed unchanged: {feed_url}")
+        if body is not None:
+            changed.append((feed_url, body, etag, modified))
+
+    parsed = await asyncio.gather(*(
+        loop.run_in_executor(pool, parse_feed, body) for _, body, _, _ in changed
+    ), return_exceptions=True)
+
+    url_map = {}  # url -> {title, summary, published, weight, sources}
+    updates = {}
+    for (feed_url, _, etag, modified), entries in zip(changed, parsed):
+        if isinstance(entries, Exception):
+            FEED_ERRORS.inc()
+            log(f"Feed {feed_url} could not be parsed: {entries!r}")
+            continue
+        updates[feed_url] = (etag, modified)
+        log(f"Fetched feed: {feed_url} with {len(entries)} entries.")
+        for entry in entries:
+            link = entry["link"]
             if not link:
                 continue
-            title = entry.get("title", "").strip()
-            summary = entry.get("summary", "") or entry.get("description", "")
-            published = entry.get("published") or entry.get("updated") or ""
             if link not in url_map:
                 url_map[link] = {
-                    "title": title,
-                    "summary": summary,
-                    "published": published,
-                    "weight": 1
+                    "title": entry["title"],
+                    "summary": entry["summary"],
+                    "published": entry["published"],
+                    "weight": 1,
+                    "sources": {feed_url}
                 }
             else:
                 url_map[link]["weight"] += 1
-    return url_map
-
-def main_loop():
-    while True:
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            now_ts = datetime.now(timezone.utc).isoformat()
-            url_map = fetch_all_feeds()
-            log(f"Fetched {len(url_map)} unique URLs from {len(RSS_FEEDS)} feeds.")
-
-            new_articles = 0
-
-            for link, info in url_map.items():
-                article_id = compute_article_id(link)
-
-                # Skip if already seen
-                cursor.execute(
-                    "SELECT 1 FROM fetched_articles WHERE article_id = ?",
-                    (article_id,)
-                )
-                if cursor.fetchone():
-                    continue
-
-                weight = info["weight"]
-
-                # Insert into fetched_articles
-                cursor.execute(
-                    "INSERT INTO fetched_articles (article_id, fetched_at, weight) VALUES (?, ?, ?)",
-                    (article_id, now_ts, weight)
-                )
-
-                # Insert into raw_news_queue
-                cursor.execute(
-                    """
-                    INSERT OR IGNORE INTO raw_news_queue
-                      (article_id, title, summary, link, published_at, weight)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        article_id,
-                        info["title"],
-                        info["summary"],
-                        link,
-                        info["published"],
-                        weight
-                    )
-                )
-
-                log(f"New article queued: {shorten(info['title'], width=60)} (weight={weight})")
-                new_articles += 1
-
-            conn.commit()
-            conn.close()
-            log(f"Cycle complete: {new_articles} new articles added.")
-        except Exception as e:
-            error_ts = datetime.now(timezone.utc).isoformat()
-            log(f"ERROR: {e}")
-        time.sleep(FETCH_INTERVAL)
+                url_map[link]["sources"].add(feed_url)
+    return url_map, updates
+
+async def main_loop(pool):
+    metrics.serve(METRICS_PORT)
+    conn = get_db_connection()
+    feed_state = load_feed_state(conn)
+    clusterer = StoryClusterer()
+    restored = warm_start(conn, clusterer)
+    log(f"Story clusters: {restored} recent articles reloaded into "
+        f"{len(clusterer.clusters)} clusters.")
+
+    last_pruned = 0.0
+    connector = aiohttp.TCPConnector(limit=len(RSS_FEEDS), ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        while True:
+            cycle_start = time.monotonic()
+            try:
+                now_ts = storage.utc_iso()
+                url_map, updates = await fetch_all_feeds(session, pool, feed_state)
+                log(f"Fetched {len(url_map)} unique URLs from {len(updates)}/{len(RSS_FEEDS)} changed feeds.")
+
+                store_started = time.perf_counter()
+                new_rows = store_new_articles(conn, url_map, now_ts, clusterer)
+                for row in new_rows:
+                    log(f"New article queued: {shorten(row[1], width=60)} (weight={row[5]}, story={row[6][:8]})")
+                new_articles = len(new_rows)
+
+                # Validators are stored with the articles they produced, so a
+                # failed commit never hides an unprocessed feed version
+                save_feed_state(conn, updates)
+                conn.commit()
+                STORE_SECONDS.observe(time.perf_counter() - store_started)
+                NEW_ARTICLES.inc(new_articles)
+                feed_state.update(updates)
+                if new_articles:
+                    notify_new_rows()
+
+                CYCLE_SECONDS.observe(time.monotonic() - cycle_start)
+                log(f"Cycle complete: {new_articles} new articles added "
+                    f"in {time.monotonic() - cycle_start:.2f}s.")
+
+                if time.monotonic() - last_pruned >= RETENTION_INTERVAL:
+                    prune_old_articles(conn)
+                    last_pruned = time.monotonic()
+            except Exception as e:
+                error_ts = datetime.now(timezone.utc).isoformat()
+                log(f"ERROR: {e}")
+                # The connection outlives the cycle: drop its half-done transaction
+                conn.rollback()
+            await asyncio.sleep(max(0.0, FETCH_INTERVAL - (time.monotonic() - cycle_start)))
 
 if __name__ == "__main__":
-    main_loop()
+    # Fork the parser workers before any other thread exists (log writer,
+    # metrics server, the event loop's resolver threads): a forked child
+    # copies only the calling thread and can inherit a lock held by another
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as pool:
+        pool.submit(int).result()   # the first submit starts every worker
+        log_writer = metrics.LogWriter(log_file)
+        log("Script execution started")
+        asyncio.run(main_loop(pool))
@@ -2,80 +2,64 @@
 """
 news_filter_notify.py
 
-Loop every 5 seconds, check raw_news_queue for new articles.
-If weight >= min_weight OR keyword matches, batch them and send
-to Telegram without exceeding rate limits.
+Wait for a wake-up from news_acquisition (or at most 5 seconds), then
+read only the raw_news_queue rows added since the persisted seq cursor.
+If weight >= min_weight OR a keyword matches (whole word, see
+keyword_matcher.py), queue an alert in the Telegram outbox in the same
+transaction that marks the article handled; telegram_dispatcher.py
+delivers it. Each story cluster (story_clusters.py) is alerted at most
+once, so syndicated copies of a story stay quiet. news_filter_config.yaml
+is reloaded when it changes.
 """
 
-import time
-import sqlite3
 import yaml
-import requests
 from datetime import datetime, timezone
 import os
+import sys
+import time
+
+from keyword_matcher import ReloadingKeywordMatcher
+from news_signal import NewRowsListener
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics, storage
+from common.telegram_outbox import enqueue
 
 # Paths
 BASE_DIR = "/home/tito/crypto_algotrader_part1/part1"
-DB_PATH = os.path.join(BASE_DIR, "db/crypto.db")
+DB_PATH = storage.DB_PATH
 FILTER_CFG_PATH = os.path.join(BASE_DIR, "config/news_filter_config.yaml")
 TELEGRAM_CFG_PATH = os.path.join(BASE_DIR, "config/telegram_config.yaml")
 
-CHECK_INTERVAL = 5  # seconds
-BATCH_SIZE = 5
-RATE_LIMIT_SECONDS = 3.2  # Wait at least this long between messages
+CHECK_INTERVAL = 5  # seconds; fallback poll when no wake-up signal arrives
+FETCH_LIMIT = 500   # rows read per pass
+CURSOR_NAME = "news_filter_notify.last_seq"
+METRICS_PORT = 9104  # Prometheus text at http://127.0.0.1:9104/metrics
 
-# Load config
-with open(FILTER_CFG_PATH, "r") as f:
-    cfg = yaml.safe_load(f)
-KEYWORDS = [kw.lower() for kw in cfg.get("keywords", [])]
-MIN_WEIGHT = cfg.get("min_weight", 2)
+PASS_SECONDS = metrics.histogram("news_filter_pass_seconds", "One pass over new raw_news_queue rows")
+ROWS_READ = metrics.counter("news_filter_rows_total", "raw_news_queue rows handled")
+ALERTS = metrics.counter("news_filter_alerts_total", "Alerts queued in the Telegram outbox")
+
+# Load config (keywords and min_weight are hot-reloaded in main_loop)
+filter_cfg = ReloadingKeywordMatcher(FILTER_CFG_PATH)
 
 with open(TELEGRAM_CFG_PATH, "r") as f:
     tcfg = yaml.safe_load(f)
-BOT_TOKEN = tcfg["bot_token"]
 CHAT_ID = tcfg["chat_id"]
 PARSE_MODE = tcfg.get("parse_mode", "Markdown")
-TELEGRAM_URL = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-
-last_sent_time = 0
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def notify_telegram(text: str):
-    global last_sent_time
-
-    now = time.time()
-    wait_time = last_sent_time + RATE_LIMIT_SECONDS - now
-    if wait_time > 0:
-        time.sleep(wait_time)
-
-    payload = {
-        "chat_id": CHAT_ID,
-        "text": text,
-        "parse_mode": PARSE_MODE
-    }
-    try:
-        resp = requests.post(TELEGRAM_URL, json=payload, timeout=5)
-        resp.raise_for_status()
-        last_sent_time = time.time()
-        return True
-    except Exception as e:
-        now_ts = datetime.now(timezone.utc).isoformat()
-        print(f"[{now_ts}] ERROR sending Telegram: {e}")
-        return False
-
-def format_article(row):
+    # One long-lived connection per process (see common/storage.py)
+    return storage.get_connection(DB_PATH)
+
+def format_article(row, keywords):
     title = row["title"] or ""
-    summary = row["summary"] or ""
-    weight = row["weight"]
+    weight = row["story_weight"]
     link = row["link"]
     published = row["published_at"]
 
-    keyword_match = any(kw in title.lower() or kw in summary.lower() for kw in KEYWORDS)
-    match_text = "_Keyword match: yes_\n" if keyword_match else ""
+    # Prefix keywords end in "*", which would break Markdown
+    match_text = f"_Keywords: {', '.join(kw.rstrip('*') for kw in keywords)}_\n" if keywords else ""
 
     return (
         f"*{title.strip()}*\n"
@@ -85,79 +69,131 @@ def format_article(row):
         f"[Read more]({link})"
     )
 
+def load_cursor(conn):
+    row = conn.execute("SELECT value FROM filter_state WHERE name = ?", (CURSOR_NAME,)).fetchone()
+    if row is not None:
+        return row[0]
+    # First start with a cursor: resume just before the oldest unhandled
+    # article (a one-off full scan), or at the end of the queue
+    row = conn.execute("""
+      SELECT MIN(r.seq)
+      FROM raw_news_queue r
+      LEFT JOIN alerted_articles a
+        ON r.article_id = a.article_id
+      WHERE a.article_id IS NULL
+    """).fetchone()
+    if row[0] is not None:
+        start = row[0] - 1
+    else:
+        start = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM raw_news_queue").fetchone()[0]
+    save_cursor(conn, start)
+    conn.commit()
+    return start
+
+def save_cursor(conn, value):
+    conn.execute("""
+      INSERT INTO filter_state (name, value) VALUES (?, ?)
+      ON CONFLICT(name) DO UPDATE SET value = excluded.value
+    """, (CURSOR_NAME, value))
+
+def fetched_ts(value):
+    """fetched_at (ISO-8601) as a Unix timestamp, or None."""
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def mark_alerted(cursor, article_ids):
+    alerted_at = datetime.now(timezone.utc).isoformat()
+    cursor.executemany(
+        "INSERT OR IGNORE INTO alerted_articles(article_id, alerted_at) VALUES (?, ?)",
+        [(article_id, alerted_at) for article_id in article_ids]
+    )
+    return alerted_at
+
+def process_new_rows(conn, last_seq, min_weight):
+    """
+    Handle rows after last_seq: queue alerts for the qualifying ones and
+    mark every row handled. Returns (new_cursor, rows_read); the caller
+    commits, so alerts, alerted_articles and the cursor move together.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+      SELECT r.*,
+             MAX(r.weight, COALESCE(c.weight, 0)) AS story_weight,
+             c.alerted_at AS story_alerted_at,
+             a.alerted_at AS alerted_at,
+             f.fetched_at AS fetched_at
+      FROM raw_news_queue r
+      LEFT JOIN story_clusters c ON c.cluster_id = r.cluster_id
+      LEFT JOIN alerted_articles a ON a.article_id = r.article_id
+      LEFT JOIN fetched_articles f ON f.article_id = r.article_id
+      WHERE r.seq > ?
+      ORDER BY r.seq
+      LIMIT ?
+    """, (last_seq, FETCH_LIMIT))
+    rows = cursor.fetchall()
+    if not rows:
+        return last_seq, 0
+
+    alerts = 0
+    alerted_stories = set()
+    for row in rows:
+        if row["alerted_at"]:
+            continue  # already sent by its producer (Agent A via agent_B_ingest)
+        story = row["cluster_id"]
+        if story and (row["story_alerted_at"] or story in alerted_stories):
+            continue  # another copy of a story already alerted
+
+        title = row["title"] or ""
+        summary = row["summary"] or ""
+        weight = row["story_weight"]
+
+        # One pass over title + summary; the matches are reused for formatting
+        keywords = filter_cfg.matched_keywords(title, summary)
+
+        if weight >= min_weight or keywords:
+            # The dispatcher packs consecutive alerts into as few messages as fit
+            # origin_at lets the dispatcher measure fetch-to-Telegram latency
+            enqueue(cursor, CHAT_ID, format_article(row, keywords), PARSE_MODE,
+                    origin_at=fetched_ts(row["fetched_at"]))
+            alerts += 1
+            if story:
+                alerted_stories.add(story)
+
+    # Qualifying or not, every row read is now processed
+    alerted_at = mark_alerted(cursor, [row["article_id"] for row in rows])
+    cursor.executemany("UPDATE story_clusters SET alerted_at = ? WHERE cluster_id = ?",
+                       [(alerted_at, story) for story in alerted_stories])
+    if alerts:
+        print(f"[{alerted_at}] Queued {alerts} alert(s).")
+    ROWS_READ.inc(len(rows))
+    ALERTS.inc(alerts)
+    return rows[-1]["seq"], len(rows)
+
 def main_loop():
     conn = get_db_connection()
-    cursor = conn.cursor()
+    listener = NewRowsListener()
+    last_seq = load_cursor(conn)
+    metrics.serve(METRICS_PORT)
 
     while True:
-        # Get unalerted articles
-        cursor.execute("""
-          SELECT r.*
-          FROM raw_news_queue r
-          LEFT JOIN alerted_articles a
-            ON r.article_id = a.article_id
-          WHERE a.article_id IS NULL
-        """)
-        new_articles = cursor.fetchall()
-
-        batch = []
-        batch_ids = []
-
-        for row in new_articles:
-            aid = row["article_id"]
-            title = row["title"] or ""
-            summary = row["summary"] or ""
-            weight = row["weight"]
-
-            title_lower = title.lower()
-            summary_lower = summary.lower()
-            keyword_match = any(kw in title_lower or kw in summary_lower for kw in KEYWORDS)
-
-            if weight >= MIN_WEIGHT or keyword_match:
-                batch.append(format_article(row))
-                batch_ids.append(aid)
-
-                if len(batch) >= BATCH_SIZE:
-                    msg = "\n\n".join(batch)
-                    success = notify_telegram(msg)
-                    alerted_at = datetime.now(timezone.utc).isoformat()
-                    if success:
-                        for article_id in batch_ids:
-                            cursor.execute(
-                                "INSERT INTO alerted_articles(article_id, alerted_at) VALUES (?, ?)",
-                                (article_id, alerted_at)
-                            )
-                        print(f"[{alerted_at}] Alerted {len(batch)} article(s).")
-                    else:
-                        print(f"[{alerted_at}] Failed to alert batch.")
-                    conn.commit()
-                    batch = []
-                    batch_ids = []
-            else:
-                # Doesn't qualify for alerting, but mark as processed
-                alerted_at = datetime.now(timezone.utc).isoformat()
-                cursor.execute(
-                    "INSERT INTO alerted_articles(article_id, alerted_at) VALUES (?, ?)",
-                    (aid, alerted_at)
-                )
-
-        # Final leftover batch
-        if batch:
-            msg = "\n\n".join(batch)
-            success = notify_telegram(msg)
-            alerted_at = datetime.now(timezone.utc).isoformat()
-            if success:
-                for article_id in batch_ids:
-                    cursor.execute(
-                        "INSERT INTO alerted_articles(article_id, alerted_at) VALUES (?, ?)",
-                        (article_id, alerted_at)
-                    )
-                print(f"[{alerted_at}] Alerted final batch of {len(batch)} article(s).")
-            else:
-                print(f"[{alerted_at}] Failed to alert final batch.")
-            conn.commit()
+        filter_cfg.maybe_reload()
+        min_weight = filter_cfg.config.get("min_weight", 2)
 
-        time.sleep(CHECK_INTERVAL)
+        started = time.perf_counter()
+        new_cursor, rows_read = process_new_rows(conn, last_seq, min_weight)
+        if new_cursor != last_seq:
+            save_cursor(conn, new_cursor)
+            conn.commit()
+        if rows_read:
+            PASS_SECONDS.observe(time.perf_counter() - started)
+        last_seq = new_cursor
+
+        # More backlog waiting: go again right away; otherwise sleep until
+        # news_acquisition signals new rows (or the fallback interval passes)
+        if rows_read < FETCH_LIMIT:
+            listener.wait(CHECK_INTERVAL)
 
 if __name__ == "__main__":
     main_loop()
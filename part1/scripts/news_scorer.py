@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+news_scorer.py
+
+Sentiment stage between raw_news_queue and the trading side.
+
+Drains raw_news_queue from a persisted seq cursor in dynamic
+micro-batches (up to BATCH_MAX articles, or whatever arrived within
+BATCH_WINDOW seconds of the first one), scores them with a CPU sentiment
+model and writes the results to scored_news_queue. Articles that clear
+MIN_INTENSITY / MIN_RELEVANCE with a non-neutral label are promoted to
+tradable_news_queue in the same transaction.
+
+Inference is CPU-only: the model is int8 dynamically quantized (Linear
+layers), torch runs with SCORER_THREADS intra-op threads, and each batch
+is sorted by length so padding stays small. Results are memoized by a
+hash of the normalized text (in memory and in sentiment_cache), so
+syndicated copies of a headline are never scored twice.
+"""
+
+import hashlib
+import html
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from news_signal import NewRowsListener, consumer_socket
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics, storage
+
+DB_PATH = storage.DB_PATH
+
+MODEL_NAME = os.getenv("SCORER_MODEL", "ProsusAI/finbert")
+SCORER_THREADS = int(os.getenv("SCORER_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
+MAX_TOKENS = 128             # headline + lede; longer inputs are truncated
+
+BATCH_MAX = 32
+BATCH_WINDOW = 0.25          # seconds to wait for a batch to fill once news arrives
+IDLE_WAIT = 5                # seconds; fallback poll when no wake-up signal arrives
+SUMMARY_CHARS = 400
+CURSOR_NAME = "news_scorer.last_seq"
+CACHE_ITEMS = 20000
+METRICS_PORT = 9106          # Prometheus text at http://127.0.0.1:9106/metrics
+
+BATCH_SECONDS = metrics.histogram("scorer_batch_seconds", "Score, write and commit one micro-batch")
+INFER_SECONDS = metrics.histogram("scorer_inference_seconds", "Model forward pass over a batch's cache misses")
+ARTICLES = metrics.counter("scorer_articles_total", "Articles scored (cached or inferred)")
+CACHE_HITS = metrics.counter("scorer_cache_hits_total", "Articles answered from sentiment_cache")
+PROMOTED = metrics.counter("scorer_promoted_total", "Articles promoted to tradable_news_queue")
+
+# Promotion to tradable_news_queue
+MIN_INTENSITY = 0.6          # |P(positive) - P(negative)|
+MIN_RELEVANCE = 0.5          # 1 - P(neutral)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def log(msg):
+    print(f"[{datetime.now(timezone.utc).isoformat()}] {msg}", flush=True)
+
+
+def normalize_text(title, summary):
+    text = f"{title or ''}. {summary or ''}"
+    text = html.unescape(_TAG_RE.sub(" ", text))
+    return _SPACE_RE.sub(" ", text).strip()[:len(title or "") + 2 + SUMMARY_CHARS]
+
+
+def text_hash(text):
+    return hashlib.sha1(text.lower().encode("utf-8")).hexdigest()
+
+
+# === MODEL ===
+
+class SentimentScorer:
+    """int8-quantized sequence classifier; score() takes a list of texts."""
+
+    def __init__(self, model_name=MODEL_NAME, threads=SCORER_THREADS, quantize=True):
+        # Heavy imports stay here so the rest of the module loads instantly
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        model.eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.model_name = model_name
+        labels = {i: l.lower() for i, l in model.config.id2label.items()}
+        self.idx = {name: i for i, name in labels.items()}
+        for name in ("positive", "negative", "neutral"):
+            if name not in self.idx:
+                raise ValueError(f"{model_name} has no '{name}' label (labels: {labels})")
+
+    def score(self, texts):
+        """[(label, intensity, relevance)] in input order."""
+        torch = self.torch
+        # Length-sorted so each forward pass pads to similar lengths
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        results = [None] * len(texts)
+        with torch.inference_mode():
+            enc = self.tokenizer([texts[i] for i in order], padding=True, truncation=True,
+                                 max_length=MAX_TOKENS, return_tensors="pt")
+            probs = torch.softmax(self.model(**enc).logits, dim=-1).tolist()
+        for i, p in zip(order, probs):
+            pos, neg, neu = p[self.idx["positive"]], p[self.idx["negative"]], p[self.idx["neutral"]]
+            label = "positive" if pos >= max(neg, neu) else "negative" if neg >= neu else "neutral"
+            results[i] = (label, abs(pos - neg), 1.0 - neu)
+        return results
+
+
+# === DATABASE ===
+
+def get_db_connection():
+    # One long-lived connection per process (see common/storage.py)
+    return storage.get_connection(DB_PATH)
+
+
+def load_cursor(conn):
+    row = conn.execute("SELECT value FROM filter_state WHERE name = ?", (CURSOR_NAME,)).fetchone()
+    if row is not None:
+        return row[0]
+    # First start: score from the oldest article not scored yet
+    row = conn.execute("""
+        SELECT MIN(r.seq)
+        FROM raw_news_queue r
+        LEFT JOIN scored_news_queue s ON s.article_id = r.article_id
+        WHERE s.article_id IS NULL
+    """).fetchone()
+    if row[0] is not None:
+        return row[0] - 1
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM raw_news_queue").fetchone()[0]
+
+
+def save_cursor(conn, value):
+    conn.execute("""
+        INSERT INTO filter_state (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value
+    """, (CURSOR_NAME, value))
+
+
+# === SCORING WORKER ===
+
+class ScoringWorker:
+    def __init__(self, conn, scorer, model_name=MODEL_NAME):
+        self.conn = conn
+        self.scorer = scorer
+        self.model_name = model_name
+        self.cache = OrderedDict()   # text hash -> (label, intensity, relevance)
+        self.cursor = load_cursor(conn)
+        self.scored = 0
+        self.cache_hits = 0
+        self.promoted = 0
+        self.infer_seconds = 0.0
+
+    def fetch(self, limit=BATCH_MAX):
+        return self.conn.execute("""
+            SELECT seq, article_id, title, summary, link
+            FROM raw_news_queue
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+        """, (self.cursor, limit)).fetchall()
+
+    def _cached(self, hashes):
+        """Look hashes up in memory, then in sentiment_cache (one query)."""
+        found = {}
+        missing = []
+        for h in hashes:
+            if h in self.cache:
+                self.cache.move_to_end(h)
+                found[h] = self.cache[h]
+            else:
+                missing.append(h)
+        if missing:
+            marks = ",".join("?" * len(missing))
+            for row in self.conn.execute(
+                    f"SELECT text_hash, sentiment_label, intensity, relevance_score "
+                    f"FROM sentiment_cache WHERE text_hash IN ({marks}) AND model = ?",
+                    (*missing, self.model_name)):
+                found[row[0]] = (row[1], row[2], row[3])
+                self._remember(row[0], found[row[0]])
+        return found
+
+    def _remember(self, h, result):
+        self.cache[h] = result
+        if len(self.cache) > CACHE_ITEMS:
+            self.cache.popitem(last=False)
+
+    def process(self, rows):
+        """Score one micro-batch, write results and advance the cursor in one commit."""
+        texts = [normalize_text(r["title"], r["summary"]) for r in rows]
+        hashes = [text_hash(t) for t in texts]
+        results = self._cached(set(hashes))
+        hits = sum(1 for h in hashes if h in results)
+
+        # Unique texts only: duplicates inside the batch are scored once
+        todo = {}
+        for h, t in zip(hashes, texts):
+            if h not in results:
+                todo.setdefault(h, t)
+        now_iso = datetime.now(timezone.utc).isoformat()
+        new_cache = []
+        if todo:
+            started = time.perf_counter()
+            scored = self.scorer.score(list(todo.values()))
+            elapsed = time.perf_counter() - started
+            self.infer_seconds += elapsed
+            INFER_SECONDS.observe(elapsed)
+            for h, result in zip(todo, scored):
+                results[h] = result
+                self._remember(h, result)
+                new_cache.append((h, *result, self.model_name, now_iso))
+
+        scored_rows = []
+        tradable = []
+        for row, h in zip(rows, hashes):
+            label, intensity, relevance = results[h]
+            record = (row["article_id"], now_iso, row["title"] or "", row["link"] or "",
+                      label, round(intensity, 4), round(relevance, 4))
+            scored_rows.append(record)
+            if label != "neutral" and intensity >= MIN_INTENSITY and relevance >= MIN_RELEVANCE:
+                tradable.append(record)
+
+        with self.conn:
+            self.conn.executemany("""
+                INSERT OR IGNORE INTO sentiment_cache
+                  (text_hash, sentiment_label, intensity, relevance_score, model, scored_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, new_cache)
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO scored_news_queue
+                  (article_id, timestamp, headline, url, sentiment_label, intensity, relevance_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, scored_rows)
+            self.conn.executemany("""
+                INSERT OR IGNORE INTO tradable_news_queue
+                  (article_id, timestamp, headline, url, sentiment_label, intensity, relevance_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, tradable)
+            save_cursor(self.conn, rows[-1]["seq"])
+        self.cursor = rows[-1]["seq"]
+
+        self.scored += len(rows)
+        self.cache_hits += hits
+        self.promoted += len(tradable)
+        ARTICLES.inc(len(rows))
+        CACHE_HITS.inc(hits)
+        PROMOTED.inc(len(tradable))
+        return len(rows), len(todo), len(tradable)
+
+    def stats(self):
+        inferred = self.scored - self.cache_hits
+        return (f"scored {self.scored} ({self.cache_hits} from cache), promoted {self.promoted}, "
+                f"{inferred / self.infer_seconds if self.infer_seconds else 0:.1f} inferences/s")
+
+
+def main_loop():
+    metrics.serve(METRICS_PORT)
+    conn = get_db_connection()
+    log(f"Loading {MODEL_NAME} (int8 dynamic quantization, {SCORER_THREADS} threads)")
+    worker = ScoringWorker(conn, SentimentScorer())
+    listener = NewRowsListener(consumer_socket("scorer"))
+    log(f"News scorer started at seq {worker.cursor}")
+
+    last_stats = time.monotonic()
+    while True:
+        rows = worker.fetch()
+        if not rows:
+            listener.wait(IDLE_WAIT)
+            continue
+        if len(rows) < BATCH_MAX:
+            # News tends to arrive in bursts: give the batch a moment to fill
+            listener.wait(BATCH_WINDOW)
+            rows = worker.fetch()
+        with BATCH_SECONDS.time():
+            n, inferred, promoted = worker.process(rows)
+        log(f"Batch of {n}: {inferred} inferred, {n - inferred} cached/duplicate, {promoted} promoted")
+
+        if time.monotonic() - last_stats >= 600:
+            log(worker.stats())
+            last_stats = time.monotonic()
+
+
+if __name__ == "__main__":
+    main_loop()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+news_signal.py
+
+Wake-up channel between news_acquisition (producer) and the services
+that read raw_news_queue.
+
+Each consumer binds its own Unix datagram socket in SIGNAL_DIR
+(raw_news.<name>.sock); the producer sends one tiny datagram to every
+such socket after committing new rows. Nothing is carried in the message
+itself, the database stays the source of truth. If no consumer is
+listening the send is silently dropped, and if the socket cannot be
+bound the consumer degrades to plain polling.
+"""
+
+import glob
+import os
+import select
+import socket
+import time
+
+SIGNAL_DIR = "/home/tito/crypto_algotrader_part1/part1/run"
+NEWS_SOCKET = os.path.join(SIGNAL_DIR, "raw_news.sock")
+
+
+def consumer_socket(name):
+    return os.path.join(SIGNAL_DIR, f"raw_news.{name}.sock")
+
+
+def notify_new_rows(path=None):
+    """
+    Best-effort, non-blocking nudge to whoever listens on path (default:
+    every raw_news socket in SIGNAL_DIR). Returns how many were reached.
+    """
+    paths = [path] if path else glob.glob(os.path.join(SIGNAL_DIR, "raw_news*.sock"))
+    reached = 0
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+        s.setblocking(False)
+        for p in paths:
+            try:
+                s.sendto(b"1", p)
+                reached += 1
+            except OSError:
+                # No listener (or its buffer is full, which means it is already awake)
+                pass
+    return reached
+
+
+class NewRowsListener:
+    def __init__(self, path=NEWS_SOCKET):
+        self.path = path
+        self.sock = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.unlink(path)  # stale socket from a previous run
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(path)
+            self.sock.setblocking(False)
+        except OSError as e:
+            print(f"[news_signal] cannot bind {path} ({e}); falling back to polling")
+            self.sock = None
+
+    def wait(self, timeout):
+        """
+        Block until a producer signals or `timeout` seconds pass.
+        Returns True if woken by a signal. Pending signals are drained so a
+        burst of commits causes a single wake-up.
+        """
+        if self.sock is None:
+            time.sleep(timeout)
+            return False
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while True:
+                self.sock.recv(64)
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+telegram_dispatcher.py
+
+Delivers everything queued in the telegram_outbox table (news alerts from
+news_filter_notify and any other producer sharing crypto.db) to the Bot
+API, paced to Telegram's limits. See common/telegram_outbox.py.
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics, storage
+from common.telegram_outbox import TelegramDispatcher, GLOBAL_RATE, CHAT_RATE, CHAT_BURST
+
+# Paths
+BASE_DIR = "/home/tito/crypto_algotrader_part1/part1"
+DB_PATH = storage.DB_PATH
+TELEGRAM_CFG_PATH = os.path.join(BASE_DIR, "config/telegram_config.yaml")
+
+STATS_INTERVAL = 60  # seconds
+METRICS_PORT = 9105  # Prometheus text at http://127.0.0.1:9105/metrics
+
+def log(msg):
+    print(f"[{datetime.now(timezone.utc).isoformat()}] {msg}", flush=True)
+
+async def report_stats(dispatcher):
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        log(f"Dispatcher stats: {dispatcher.stats()}")
+
+async def main():
+    with open(TELEGRAM_CFG_PATH, "r") as f:
+        tcfg = yaml.safe_load(f)
+    limits = tcfg.get("rate_limits", {}) or {}
+
+    dispatcher = TelegramDispatcher(
+        DB_PATH,
+        tcfg["bot_token"],
+        global_rate=limits.get("global_per_second", GLOBAL_RATE),
+        chat_rate=limits.get("chat_per_second", CHAT_RATE),
+        chat_burst=limits.get("chat_burst", CHAT_BURST),
+    )
+    metrics.serve(METRICS_PORT)
+    log("Telegram dispatcher started")
+    stats_task = asyncio.create_task(report_stats(dispatcher))
+    try:
+        await dispatcher.run()
+    finally:
+        stats_task.cancel()
+
+if __name__ == "__main__":
+    asyncio.run(main())
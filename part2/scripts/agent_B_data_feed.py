@@ -1,82 +1,254 @@
+import time
+STARTED = time.perf_counter()  # taken before the other imports so the startup report includes them
+
 import asyncio
 import json
-import sqlite3
+import os
+import random
+import sys
 import websockets
-import yaml
 from datetime import datetime
 
-BINANCE_WS = "wss://stream.binance.com:9443/ws"
+import exchange_cache
+import kline_backfill
+from candle_writer import CandleWriter
+from live_bar_cache import LiveBarCache
+from ohlcv_ring import OHLCVRing
+from resampler import StreamingResampler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics, storage
 
-DB_PATH = "/home/tito/crypto_algotrader_part1/part1/db/crypto.db"
+BINANCE_WS = "wss://stream.binance.com:9443/stream"  # combined-stream endpoint
+BINANCE_REST = kline_backfill.REST_BASE
+
+DB_PATH = storage.DB_PATH
 CONFIG_PATH = "/home/tito/crypto_algotrader_part1/part2/config/binance_keys.yaml"
 
-def load_config():
-    with open(CONFIG_PATH, 'r') as f:
-        return yaml.safe_load(f)
+STATS_INTERVAL = 60     # seconds between writer stats reports
+SNAPSHOT_INTERVAL = 15  # seconds between open-bar snapshots; 0 disables them
+
+METRICS_PORT = 9101    # Prometheus text at http://127.0.0.1:9101/metrics
+
+STREAMS_PER_CONNECTION = 100  # kline streams multiplexed on one websocket
+RECONNECT_BASE_DELAY = 1      # seconds; doubled after every failed attempt
+RECONNECT_MAX_DELAY = 60
+CATCHUP_ATTEMPTS = 3          # resampler history rebuilds tried before streaming without it
+CATCHUP_RETRY_DELAY = 5       # seconds between them
+CATCHUP_BACKFILL_WAIT = 300   # seconds catch-up waits for every shard's first gap backfill
+
+KLINE_MESSAGES = metrics.counter("feed_kline_messages_total", "Kline events received over websockets")
+CLOSED_BARS = metrics.counter("feed_closed_bars_total", "Closed 1m bars received over websockets")
+RECONNECTS = metrics.counter("feed_reconnects_total", "Websocket reconnect attempts")
+
+class StartupTimer:
+    """Wall time of each startup phase, reported once the first kline arrives."""
+
+    def __init__(self, started=STARTED):
+        self.started = started
+        self.last = started
+        self.phases = []
+        self.reported = False
+
+    def mark(self, phase):
+        """Close the current phase; repeated marks of the same phase are ignored."""
+        if any(name == phase for name, _ in self.phases):
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        if self.reported:
+            return
+        self.reported = True
+        total = (self.last - self.started) * 1000
+        phases = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases)
+        print(f"[{datetime.utcnow()}] Startup: live after {total:.0f} ms ({phases})")
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS market_data_1m (
-            symbol TEXT,
-            timestamp INTEGER,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            volume REAL,
-            PRIMARY KEY(symbol, timestamp)
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-async def handle_stream(symbols):
-    stream_name = '/'.join([f"{s.lower()}@kline_1m" for s in symbols])
-    url = f"{BINANCE_WS}/{stream_name}"
-
-    async with websockets.connect(url) as websocket:
-        while True:
-            try:
-                msg = await websocket.recv()
-                data = json.loads(msg)
-                k = data['k']
-                save_candle(
-                    symbol=k['s'],
-                    timestamp=k['t'],
-                    o=k['o'], h=k['h'], l=k['l'], c=k['c'], v=k['v']
+    # market_data_1m and market_data_live (the forming bar per symbol, for
+    # crash recovery) are created by the shared migrations
+    storage.connect(DB_PATH).close()
+
+def shard_symbols(symbols, per_connection=STREAMS_PER_CONNECTION):
+    return [symbols[i:i + per_connection] for i in range(0, len(symbols), per_connection)]
+
+async def handle_message(msg, writer, cache, ring=None, resampler=None):
+    received = time.perf_counter()
+    data = json.loads(msg)
+    payload = data.get('data', data)  # combined streams wrap the event
+    bar = cache.update(payload['k'], event_time=payload.get('E'))
+    KLINE_MESSAGES.inc()
+    # Only finalized candles are persisted; the forming bar lives in the cache
+    if bar.closed:
+        CLOSED_BARS.inc()
+        row = (bar.symbol, bar.timestamp, bar.open, bar.high, bar.low, bar.close, bar.volume)
+        await writer.put(row, received)
+        if ring is not None:
+            ring.append(*row)
+        if resampler is not None:
+            resampler.add_1m(*row)
+
+async def handle_stream(shard_id, symbols, writer, cache, session,
+                        ws_base=BINANCE_WS, rest_base=BINANCE_REST, ring=None, resampler=None,
+                        limiter=None, timer=None, backfilled=None):
+    """
+    Keep one combined-stream connection alive for this shard of symbols.
+    `backfilled` (an asyncio.Event) is set once a gap backfill has finished.
+    """
+    streams = '/'.join([f"{s.lower()}@kline_1m" for s in symbols])
+    url = f"{ws_base}?streams={streams}"
+    delay = RECONNECT_BASE_DELAY
+    backfills = set()
+
+    while True:
+        try:
+            async with websockets.connect(url, ping_interval=20, ping_timeout=20) as websocket:
+                print(f"[{datetime.utcnow()}] Shard {shard_id}: connected ({len(symbols)} symbols)")
+                delay = RECONNECT_BASE_DELAY
+                if timer is not None:
+                    timer.mark("websocket connect")
+
+                # Anything missed while we were disconnected (or down) comes from REST
+                task = asyncio.create_task(
+                    kline_backfill.backfill_gaps(session, symbols, DB_PATH, rest_base,
+                                                 ring=ring, limiter=limiter, resampler=resampler)
                 )
-            except Exception as e:
-                print(f"[{datetime.utcnow()}] Error: {e}")
+                backfills.add(task)
+                task.add_done_callback(backfills.discard)
+                if backfilled is not None:
+                    task.add_done_callback(lambda _: backfilled.set())
+
+                async for msg in websocket:
+                    try:
+                        await handle_message(msg, writer, cache, ring, resampler)
+                    except Exception as e:
+                        print(f"[{datetime.utcnow()}] Shard {shard_id}: bad message: {e}")
+                    if timer is not None and not timer.reported:
+                        timer.mark("first kline")
+                        timer.report()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[{datetime.utcnow()}] Shard {shard_id}: connection error: {e}")
+
+        RECONNECTS.inc()
+        sleep_for = delay * random.uniform(0.5, 1.0)
+        print(f"[{datetime.utcnow()}] Shard {shard_id}: reconnecting in {sleep_for:.1f}s")
+        await asyncio.sleep(sleep_for)
+        delay = min(delay * 2, RECONNECT_MAX_DELAY)
 
-def save_candle(symbol, timestamp, o, h, l, c, v):
+async def snapshot_open_bars(writer, cache):
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        writer.request_snapshot(cache.snapshot_rows())
+
+async def report_stats(writer, cache, resampler):
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        print(f"[{datetime.utcnow()}] Writer stats: {writer.stats()} "
+              f"(kline updates={cache.updates}, closed={cache.closed}, "
+              f"htf bars closed={resampler.closed_bars})")
+
+async def catch_up_resampler(resampler, backfilled=()):
+    caught_up = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO market_data_1m 
-            (symbol, timestamp, open, high, low, close, volume)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (symbol, timestamp, o, h, l, c, v))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"[{datetime.utcnow()}] DB Error: {e}")
+        # Rebuild from market_data_1m only once the first gap backfill of every
+        # shard is in, so history and the seeded partial bars are not gappy
+        try:
+            await asyncio.wait_for(asyncio.gather(*(event.wait() for event in backfilled)),
+                                   CATCHUP_BACKFILL_WAIT)
+        except asyncio.TimeoutError:
+            print(f"[{datetime.utcnow()}] Resampler catch-up starting before every shard's "
+                  f"first backfill finished")
+        for attempt in range(1, CATCHUP_ATTEMPTS + 1):
+            try:
+                caught_up = await asyncio.to_thread(resampler.catch_up, DB_PATH)
+                break
+            except Exception as e:
+                print(f"[{datetime.utcnow()}] Resampler catch-up failed "
+                      f"(attempt {attempt}/{CATCHUP_ATTEMPTS}): {e!r}")
+                if attempt < CATCHUP_ATTEMPTS:
+                    await asyncio.sleep(CATCHUP_RETRY_DELAY)
+    finally:
+        # Live bars are held back until this point; never leave them queued
+        replayed = resampler.resume()
+    # Backfills that landed while catch-up was pending (a reconnect) are folded in now
+    repaired = await kline_backfill.repair_resampler(resampler, DB_PATH, resampler.take_deferred_repairs())
+    if repaired:
+        print(f"[{datetime.utcnow()}] Resampler repaired {repaired} HTF bars from backfills")
+    if caught_up is None:
+        print(f"[{datetime.utcnow()}] Resampler continuing without history "
+              f"({replayed} live bars replayed)")
+    else:
+        print(f"[{datetime.utcnow()}] Resampler caught up from {caught_up} 1m rows "
+              f"({replayed} live bars replayed)")
 
-def get_symbols():
-    from binance.client import Client
+async def run_feed(symbols, ws_base=BINANCE_WS, rest_base=BINANCE_REST, timer=None):
+    timer = timer or StartupTimer()
+    cache = LiveBarCache()
+    restored = cache.restore(DB_PATH)
+    if restored:
+        print(f"Restored {restored} open bars from snapshot")
+    timer.mark("open bar restore")
+
+    # Shared columnar store of closed bars for other processes (see ohlcv_ring.py)
+    ring = OHLCVRing.open_writer()
+    timer.mark("ring open")
+
+    # Higher timeframes (15m/30m/2h/4h) rebuilt once, then kept current per closed 1m bar.
+    # The rebuild reads days of 1m rows, so it runs in the background and
+    # live bars are held back until it is done instead of delaying the streams.
+    # It waits for each shard's first gap backfill; later backfills repair().
+    resampler = StreamingResampler()
+    resampler.defer()
+    shards = shard_symbols(symbols)
+    backfilled = [asyncio.Event() for _ in shards]
 
-    cfg = load_config()
-    client = Client(cfg['binance']['api_key'], cfg['binance']['api_secret'])
-    all_symbols = [
-        s['symbol'] for s in client.futures_exchange_info()['symbols']
-        if s['contractType'] == 'PERPETUAL' and s['quoteAsset'] == 'USDT'
+    writer = CandleWriter(DB_PATH)
+    writer.open()
+    metrics.gauge("candle_writer_queue_depth", "Rows waiting for the candle writer").set_function(writer.queue.qsize)
+    tasks = [
+        asyncio.create_task(catch_up_resampler(resampler, backfilled)),
+        asyncio.create_task(report_stats(writer, cache, resampler)),
+        asyncio.create_task(exchange_cache.refresh_loop(current=symbols)),
     ]
-    return [s for s in all_symbols if s not in cfg['binance']['symbols_excluded']]
+    if SNAPSHOT_INTERVAL > 0:
+        tasks.append(asyncio.create_task(snapshot_open_bars(writer, cache)))
+    writer_task = asyncio.create_task(writer.run())
+    session = kline_backfill.new_session()
+    limiter = kline_backfill.WeightLimiter()  # shared by every shard's backfills
+    print(f"Streaming {len(symbols)} symbols over {len(shards)} connections")
+    try:
+        await asyncio.gather(*(
+            handle_stream(i, shard, writer, cache, session, ws_base, rest_base, ring, resampler,
+                          limiter, timer, backfilled[i])
+            for i, shard in enumerate(shards)
+        ))
+    finally:
+        for task in tasks:
+            task.cancel()
+        await session.close()
+        writer.stop()
+        await writer_task
+        ring.close()
+
+def get_symbols():
+    # Served from the on-disk exchange snapshot; stale ones are refreshed by
+    # run_feed in the background (see exchange_cache.py)
+    symbols, age, stale = exchange_cache.get_universe(keys_path=CONFIG_PATH)
+    if stale:
+        print(f"[{datetime.utcnow()}] Exchange snapshot is {age / 3600:.1f}h old, refreshing in background")
+    return symbols
 
 if __name__ == "__main__":
+    timer = StartupTimer()
+    timer.mark("imports")
+    metrics.serve(METRICS_PORT)
     init_db()
+    timer.mark("db init")
     symbols = get_symbols()
+    timer.mark("universe")
     print(f"Tracking {len(symbols)} symbols...")
-    asyncio.run(handle_stream(symbols))
+    asyncio.run(run_feed(symbols, timer=timer))
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+agent_B_ingest.py
+
+Receiver for the headlines Agent A POSTs to /ingest.
+
+Accepts a single item {"headline": ..., "link": ...} or a batch
+{"items": [...]} (a bare JSON list also works). Items are deduplicated
+(recent-ID memory + the table's primary key) and written to
+raw_news_queue (plus fetched_articles, which dedup and retention key on)
+by one writer task that group-commits whatever arrived in the last few
+milliseconds; each request is answered once its rows are committed.
+From there news_scorer.py scores them like fetched articles and promotes
+the tradable ones, so tradable_news_queue only ever holds scored rows.
+
+New items are assigned to story clusters (story_clusters.py) like the
+RSS articles. Agent A has already sent them to Telegram, so the same
+transaction records them in alerted_articles and marks their clusters
+alerted; news_filter_notify.py does not alert them a second time.
+
+Right after each commit the items actually inserted are published on a
+Unix socket (NEWS_SOCKET, newline-delimited JSON) and to in-process
+subscribers, so the Agent B core sees a headline immediately instead of
+after scoring. subscribe_news() is the client side.
+
+GET /stats returns the writer counters as JSON; GET /metrics serves the
+latency histograms in Prometheus text format (see common/metrics.py).
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics, storage
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                "part1", "scripts"))
+from story_clusters import StoryClusterer, save_clusters, warm_start
+
+DB_PATH = storage.DB_PATH
+NEWS_SOCKET = "/home/tito/crypto_algotrader_part1/part2/run/news.sock"
+HOST = "127.0.0.1"
+PORT = 8000
+
+SUBMIT_TO_COMMIT = metrics.histogram("ingest_submit_to_commit_seconds",
+                                     "POST /ingest received until its items were committed")
+COMMIT_SECONDS = metrics.histogram("ingest_commit_seconds", "raw_news_queue group commit")
+ITEMS_ACCEPTED = metrics.counter("ingest_items_accepted_total", "Items inserted and published")
+ITEMS_DUPLICATE = metrics.counter("ingest_items_duplicate_total", "Items dropped as already seen")
+
+COMMIT_WINDOW = 0.005     # seconds a group commit waits for more items
+COMMIT_MAX_ITEMS = 1000
+RECENT_IDS = 100000       # IDs remembered for dedup without touching the DB
+SUBSCRIBER_BACKLOG = 10000
+
+
+def article_id_for(item):
+    # Same key as the RSS fetchers when there is a link
+    return storage.article_id(item.get("link") or item.get("headline", ""))
+
+
+def source_for(link):
+    # The site stands in for the feed, so a story Agent A sees on two sites weighs 2
+    return urlsplit(link).netloc or "agent_a"
+
+
+def parse_payload(payload):
+    """Normalize a request body to a list of {headline, link} dicts."""
+    if isinstance(payload, dict) and "items" in payload:
+        payload = payload["items"]
+    if isinstance(payload, dict):
+        payload = [payload]
+    if not isinstance(payload, list):
+        raise ValueError("expected an object, {\"items\": [...]} or a list")
+    items = []
+    for raw in payload:
+        if not isinstance(raw, dict):
+            raise ValueError("every item must be an object")
+        headline = str(raw.get("headline") or "").strip()
+        link = str(raw.get("link") or raw.get("url") or "").strip()
+        if not headline:
+            raise ValueError("item without a headline")
+        items.append({"headline": headline, "link": link})
+    return items
+
+
+# === PUB/SUB ===
+
+class NewsBus:
+    """
+    Fan-out of committed news items to in-process queues and to clients
+    connected on a Unix socket. Slow subscribers lose their oldest items
+    instead of holding up ingestion.
+    """
+
+    def __init__(self, socket_path=NEWS_SOCKET):
+        self.socket_path = socket_path
+        self.queues = []
+        self.writers = set()
+        self.server = None
+        self.dropped = 0
+
+    async def start(self):
+        if not self.socket_path:
+            return
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # stale socket from a previous run
+        self.server = await asyncio.start_unix_server(self._on_connect, path=self.socket_path)
+
+    async def _on_connect(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            await reader.read()  # subscribers never send; EOF means they left
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_BACKLOG)
+        self.queues.append(queue)
+        return queue
+
+    def publish(self, items):
+        if not items:
+            return
+        for queue in self.queues:
+            for item in items:
+                if queue.full():
+                    queue.get_nowait()
+                    self.dropped += 1
+                queue.put_nowait(item)
+        if self.writers:
+            data = "".join(json.dumps(item) + "\n" for item in items).encode("utf-8")
+            for writer in list(self.writers):
+                if writer.transport.get_write_buffer_size() > 4 * 1024 * 1024:
+                    self.dropped += len(items)
+                    continue
+                writer.write(data)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            for writer in list(self.writers):
+                writer.close()
+            await self.server.wait_closed()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+
+async def subscribe_news(socket_path=NEWS_SOCKET, retry_delay=1.0):
+    """Async iterator over items published by the ingest server; reconnects."""
+    while True:
+        try:
+            reader, writer = await asyncio.open_unix_connection(socket_path, limit=1 << 20)
+        except OSError:
+            await asyncio.sleep(retry_delay)
+            continue
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                yield json.loads(line)
+        finally:
+            writer.close()
+        await asyncio.sleep(retry_delay)
+
+
+# === GROUP-COMMIT WRITER ===
+
+class IngestWriter:
+    def __init__(self, db_path, bus):
+        self.db_path = db_path
+        self.bus = bus
+        self.queue = asyncio.Queue()
+        self.recent = OrderedDict()
+        self.conn = None
+        self.clusterer = StoryClusterer()
+        self.commits = 0
+        self.accepted = 0
+        self.duplicates = 0
+
+    def open(self):
+        # raw_news_queue and fetched_articles come from the shared migrations
+        self.conn = storage.connect(self.db_path, check_same_thread=False)
+        warm_start(self.conn, self.clusterer)
+
+    async def submit(self, items):
+        """Queue items; resolves to (accepted, duplicates) once committed."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((items, future))
+        return await future
+
+    def _insert(self, rows):
+        """
+        Insert (article_id, now_iso, headline, link) rows in one transaction;
+        returns the indexes of the rows that were new (the table may know an
+        ID the recent-ID memory has forgotten, e.g. after a restart). New
+        rows get their story cluster and are recorded as already alerted.
+        """
+        started = time.perf_counter()
+        now = time.time()
+        inserted, stored, touched = [], [], []
+        with self.conn:
+            cursor = self.conn.cursor()
+            for i, (article_id, now_iso, headline, link) in enumerate(rows):
+                cursor.execute("""
+                    INSERT OR IGNORE INTO raw_news_queue (article_id, title, link, published_at)
+                    VALUES (?, ?, ?, ?)
+                """, (article_id, headline, link, now_iso))
+                if cursor.rowcount != 1:
+                    continue
+                # Cluster only rows that are really new, or a duplicate would join the window
+                story = self.clusterer.assign(article_id, headline, sources=(source_for(link),), ts=now)
+                cursor.execute("UPDATE raw_news_queue SET weight = ?, cluster_id = ? WHERE article_id = ?",
+                               (story.weight, story.cluster_id, article_id))
+                inserted.append(i)
+                stored.append((article_id, now_iso, story.weight))
+                touched.append(story.cluster_id)
+            cursor.executemany("INSERT OR IGNORE INTO fetched_articles (article_id, fetched_at, weight) "
+                               "VALUES (?, ?, ?)", stored)
+            # Agent A sends its headlines to Telegram itself (agent_a.py)
+            cursor.executemany("INSERT OR IGNORE INTO alerted_articles (article_id, alerted_at) VALUES (?, ?)",
+                               [(article_id, now_iso) for article_id, now_iso, _ in stored])
+            save_clusters(self.conn, self.clusterer, touched)
+            cursor.executemany("UPDATE story_clusters SET alerted_at = COALESCE(alerted_at, ?) WHERE cluster_id = ?",
+                               [(storage.utc_iso(now), cid) for cid in set(touched)])
+        COMMIT_SECONDS.observe(time.perf_counter() - started)
+        return inserted
+
+    def _remember(self, article_id):
+        self.recent[article_id] = None
+        if len(self.recent) > RECENT_IDS:
+            self.recent.popitem(last=False)
+
+    async def run(self):
+        while True:
+            requests = [await self.queue.get()]
+            n_items = len(requests[0][0])
+            deadline = time.monotonic() + COMMIT_WINDOW
+            while n_items < COMMIT_MAX_ITEMS:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                n_items += len(request[0])
+
+            now_iso = storage.utc_iso()
+            rows, fresh, owners = [], [], []
+            for k, (items, _) in enumerate(requests):
+                for item in items:
+                    article_id = article_id_for(item)
+                    if article_id in self.recent:
+                        continue
+                    self._remember(article_id)
+                    rows.append((article_id, now_iso, item["headline"], item["link"]))
+                    fresh.append(dict(item, article_id=article_id, ingested_at=time.time()))
+                    owners.append(k)
+
+            try:
+                new = await asyncio.to_thread(self._insert, rows) if rows else []
+            except sqlite3.Error as e:
+                for article_id, *_ in rows:
+                    self.recent.pop(article_id, None)
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.commits += 1
+            counts = [0] * len(requests)
+            for i in new:
+                counts[owners[i]] += 1
+            self.accepted += len(new)
+            self.duplicates += n_items - len(new)
+            ITEMS_ACCEPTED.inc(len(new))
+            ITEMS_DUPLICATE.inc(n_items - len(new))
+            self.bus.publish([fresh[i] for i in new])
+            for (items, future), accepted in zip(requests, counts):
+                if not future.done():
+                    future.set_result((accepted, len(items) - accepted))
+
+    def stats(self):
+        return {"commits": self.commits, "accepted": self.accepted,
+                "duplicates": self.duplicates, "queued": self.queue.qsize()}
+
+
+# === HTTP SERVER ===
+
+async def handle_ingest(request):
+    started = time.perf_counter()
+    try:
+        items = parse_payload(await request.json())
+    except (ValueError, json.JSONDecodeError) as e:
+        return web.json_response({"ok": False, "error": str(e)}, status=400)
+    try:
+        accepted, duplicates = await request.app["writer"].submit(items)
+    except sqlite3.Error as e:
+        return web.json_response({"ok": False, "error": str(e)}, status=503)
+    SUBMIT_TO_COMMIT.observe(time.perf_counter() - started)
+    return web.json_response({"ok": True, "accepted": accepted, "duplicates": duplicates})
+
+
+async def handle_stats(request):
+    stats = request.app["writer"].stats()
+    stats["subscribers"] = len(request.app["bus"].writers) + len(request.app["bus"].queues)
+    stats["dropped"] = request.app["bus"].dropped
+    return web.json_response(stats)
+
+
+async def handle_metrics(request):
+    return web.Response(text=metrics.REGISTRY.render(), content_type="text/plain")
+
+
+def create_app(db_path=DB_PATH, socket_path=NEWS_SOCKET):
+    app = web.Application(client_max_size=4 * 1024 * 1024)
+    bus = NewsBus(socket_path)
+    writer = IngestWriter(db_path, bus)
+    app["bus"] = bus
+    app["writer"] = writer
+    app.router.add_post("/ingest", handle_ingest)
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_get("/metrics", handle_metrics)
+    metrics.gauge("ingest_queue_depth", "Requests waiting for a group commit").set_function(writer.queue.qsize)
+
+    async def lifecycle(app):
+        await asyncio.to_thread(writer.open)
+        await bus.start()
+        task = asyncio.create_task(writer.run())
+        yield
+        task.cancel()
+        await bus.close()
+        writer.conn.close()
+
+    app.cleanup_ctx.append(lifecycle)
+    return app
+
+
+if __name__ == "__main__":
+    print(f"[{datetime.utcnow()}] Agent B ingest listening on http://{HOST}:{PORT}/ingest, "
+          f"publishing on {NEWS_SOCKET}")
+    web.run_app(create_app(), host=HOST, port=PORT, access_log=None, print=None)
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+backtest_engine.py
+
+Vectorized backtests for `mode: backtest` in agent_b_config.yaml.
+
+For each symbol the 1m history is resampled to the LTF timeframe, the
+configured indicators are computed over the whole series at once, and
+entry signals come out as boolean arrays. Exits (stop-loss, take-profit,
+stagnant timeout) are resolved per candidate entry with array searches
+over the 1m highs/lows, so the Python-level loop runs once per trade,
+not per bar.
+
+Symbols are fanned out over a process pool; every worker loads a
+symbol once and resolves its candidates for the whole parameter grid.
+The parent then walks each grid point's candidates of all symbols in
+time order as one portfolio (one open position per symbol), applying
+risk.daily_trade_limit to trades opened per UTC day across the book and
+halting new entries once portfolio drawdown reaches
+risk.max_drawdown_percent. Each trade's return compounds the portfolio
+equity when it closes; positions are not sized against each other.
+Results go to <output_dir>/<run_stamp>/trades.csv and summary.csv (one
+row per grid point for the portfolio, symbol ALL, and one per symbol).
+
+Usage: python backtest_engine.py [config_path]
+"""
+
+import csv
+import heapq
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import yaml
+
+import kline_archive
+import market_data_tiers
+from resampler import resample_arrays, timeframe_ms
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import storage
+
+DB_PATH = storage.DB_PATH
+CONFIG_PATH = "/home/tito/crypto_algotrader_part1/part2/config/agent_b_config.yaml"
+
+MINUTE_MS = 60000
+DAY_MS = 86400000
+
+# Exit reasons; end_of_data closes a trade cut off by the end of the range
+REASONS = ("stop_loss", "take_profit", "stagnant", "end_of_data")
+
+TRADE_FIELDS = ["run_id", "symbol", "direction", "entry_time", "exit_time", "entry_price",
+                "exit_price", "exit_reason", "return_pct", "equity_after"]
+SUMMARY_FIELDS = ["run_id", "symbol", "stop_loss_percent", "take_profit_percent",
+                  "stagnant_minutes", "trades", "win_rate", "total_return_pct",
+                  "max_drawdown_pct", "profit_factor", "avg_return_pct",
+                  "avg_minutes_held", "halted_by_drawdown", "skipped_by_daily_limit",
+                  "skipped_missing_bar"]
+
+
+def load_config(path=CONFIG_PATH):
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
+
+
+def to_ms(date_str):
+    dt = datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+# === DATA ===
+
+def load_series(db_path, symbol, start_ms, end_ms, source="auto"):
+    """
+    1m bars for symbol in [start_ms, end_ms) as a dict of NumPy arrays.
+    "auto" stitches the columnar archive and market_data_1m
+    (market_data_tiers.bars_1m), "archive" reads the archive only and
+    "sqlite" market_data_1m only.
+    """
+    if source == "archive":
+        return kline_archive.read_range(symbol, start_ms, end_ms)
+
+    conn = storage.connect(db_path)
+    try:
+        if source == "auto":
+            return market_data_tiers.bars_1m(conn, symbol, start_ms, end_ms)
+        rows = conn.execute("""
+            SELECT timestamp, open, high, low, close, volume
+            FROM market_data_1m
+            WHERE symbol = ? AND timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp
+        """, (symbol, start_ms, end_ms)).fetchall()
+    finally:
+        conn.close()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 6)
+    return {
+        "timestamp": data[:, 0].astype(np.int64),
+        "open": data[:, 1],
+        "high": data[:, 2],
+        "low": data[:, 3],
+        "close": data[:, 4],
+        "volume": data[:, 5],
+    }
+
+
+def list_symbols(db_path):
+    conn = storage.connect(db_path)
+    try:
+        return [r[0] for r in conn.execute("SELECT DISTINCT symbol FROM market_data_1m")]
+    finally:
+        conn.close()
+
+
+# === INDICATORS (whole series) ===
+
+def _ema(series, length):
+    # SMA-seeded like indicator_engine
+    values = series.copy()
+    first = values.first_valid_index()
+    if first is None:
+        return values
+    start = values.index.get_loc(first)
+    if len(values) - start < length:
+        return pd.Series(np.nan, index=values.index)
+    seed = values.iloc[start:start + length].mean()
+    values.iloc[:start + length - 1] = np.nan
+    values.iloc[start + length - 1] = seed
+    return values.ewm(span=length, adjust=False).mean()
+
+
+def _rma(series, length):
+    return series.ewm(alpha=1.0 / length, min_periods=length, adjust=False).mean()
+
+
+def compute_indicators(high, low, close, ind_cfg):
+    h, l, c = pd.Series(high), pd.Series(low), pd.Series(close)
+
+    diff = c.diff()
+    gain = _rma(diff.clip(lower=0), 14)
+    loss = _rma((-diff).clip(lower=0), 14)
+    rsi = 100.0 * gain / (gain + loss)
+
+    macd = _ema(c, 12) - _ema(c, 26)
+    macd_hist = macd - _ema(macd, 9)
+
+    prev_close = c.shift()
+    tr = pd.concat([h - l, (h - prev_close).abs(), (l - prev_close).abs()], axis=1).max(axis=1)
+    tr.iloc[0] = np.nan
+    up, dn = h.diff(), -l.diff()
+    plus_dm = ((up > dn) & (up > 0)) * up
+    minus_dm = ((dn > up) & (dn > 0)) * dn
+    plus_dm[up.isna()] = np.nan
+    minus_dm[up.isna()] = np.nan
+    plus, minus = _rma(plus_dm, 14), _rma(minus_dm, 14)
+    adx = _rma(100.0 * (plus - minus).abs() / (plus + minus), 14)
+
+    ema_cfg = ind_cfg.get("ema", {})
+    return {
+        "rsi": rsi.to_numpy(),
+        "macd_hist": macd_hist.to_numpy(),
+        "adx": adx.to_numpy(),
+        "ema_short": _ema(c, ema_cfg.get("short", 20)).to_numpy(),
+        "ema_long": _ema(c, ema_cfg.get("long", 50)).to_numpy(),
+    }
+
+
+def entry_signals(ind, ind_cfg):
+    """Boolean long/short entry arrays (signal must switch on to count)."""
+    rsi_cfg = ind_cfg.get("rsi", {})
+    overbought = rsi_cfg.get("overbought", 70)
+    oversold = rsi_cfg.get("oversold", 30)
+    adx_threshold = ind_cfg.get("adx", {}).get("threshold", 20)
+    confirm = ind_cfg.get("macd", {}).get("signal_confirm", True)
+
+    with np.errstate(invalid="ignore"):
+        trending = ind["adx"] >= adx_threshold
+        long_ok = (ind["ema_short"] > ind["ema_long"]) & trending & (ind["rsi"] < overbought)
+        short_ok = (ind["ema_short"] < ind["ema_long"]) & trending & (ind["rsi"] > oversold)
+        if confirm:
+            long_ok &= ind["macd_hist"] > 0
+            short_ok &= ind["macd_hist"] < 0
+
+    long_entry = long_ok & ~np.concatenate(([False], long_ok[:-1]))
+    short_entry = short_ok & ~np.concatenate(([False], short_ok[:-1]))
+    return long_entry, short_entry
+
+
+# === SIMULATION ===
+
+def resolve_trades(bars, entry_idx, directions, exits, fee_pct):
+    """
+    Resolve every candidate entry (1m indices, +1 long / -1 short) on its
+    own: exit index, price, reason code (index into REASONS) and return
+    after fees. Which candidates are taken is decided across the
+    portfolio by simulate(). Candidates on the last bar are dropped.
+    """
+    ts, high, low, close = bars["timestamp"], bars["high"], bars["low"], bars["close"]
+    sl_pct = exits["stop_loss_percent"] / 100.0
+    tp_pct = exits["take_profit_percent"] / 100.0
+    horizon = int(exits["stagnant_minutes"]) * MINUTE_MS
+    fee = 2 * fee_pct / 100.0
+    # Stagnation is measured in minutes, not bars, so gaps do not stretch it
+    ends = np.searchsorted(ts, ts[entry_idx] + horizon, side="right")
+
+    taken, exit_idx, exit_price, reason = [], [], [], []
+    for k, (i, direction, end) in enumerate(zip(entry_idx.tolist(), directions.tolist(), ends.tolist())):
+        if end <= i + 1:
+            continue  # no data left after the entry
+        entry = close[i]
+        if direction > 0:
+            sl, tp = entry * (1 - sl_pct), entry * (1 + tp_pct)
+            sl_hit, tp_hit = low[i + 1:end] <= sl, high[i + 1:end] >= tp
+        else:
+            sl, tp = entry * (1 + sl_pct), entry * (1 - tp_pct)
+            sl_hit, tp_hit = high[i + 1:end] >= sl, low[i + 1:end] <= tp
+        sl_at = int(np.argmax(sl_hit)) if sl_hit.any() else None
+        tp_at = int(np.argmax(tp_hit)) if tp_hit.any() else None
+
+        # Same bar touching both levels counts as a stop (conservative)
+        if sl_at is not None and (tp_at is None or sl_at <= tp_at):
+            exit_i, price, code = i + 1 + sl_at, sl, 0
+        elif tp_at is not None:
+            exit_i, price, code = i + 1 + tp_at, tp, 1
+        else:
+            # Stagnant only if the data reaches the deadline; otherwise the
+            # range ended under the open trade
+            exit_i, price = end - 1, close[end - 1]
+            code = 2 if ts[i] + horizon <= ts[-1] else 3
+        taken.append(k)
+        exit_idx.append(exit_i)
+        exit_price.append(price)
+        reason.append(code)
+
+    taken = np.array(taken, dtype=np.int64)
+    entry_i = entry_idx[taken]
+    exit_i = np.array(exit_idx, dtype=np.int64)
+    entry_price = close[entry_i]
+    exit_price = np.array(exit_price, dtype=np.float64)
+    direction = directions[taken].astype(np.int64)
+    return {
+        "direction": direction,
+        "entry_time": ts[entry_i].astype(np.int64),
+        "exit_time": ts[exit_i].astype(np.int64),
+        "entry_price": entry_price,
+        "exit_price": exit_price,
+        "reason": np.array(reason, dtype=np.int64),
+        "ret": direction * (exit_price - entry_price) / entry_price - fee,
+    }
+
+
+def simulate(candidates, risk, initial_equity):
+    """
+    Walk the candidates of every symbol ({symbol: resolve_trades() dict})
+    in time order as one portfolio. A symbol holds one position at a
+    time; risk.daily_trade_limit caps trades opened per UTC day across
+    all symbols; a close that takes drawdown to risk.max_drawdown_percent
+    stops new entries (open positions still run to their exit).
+    Returns (trades in closing order, per-symbol skip counts, halted).
+    """
+    max_dd = risk.get("max_drawdown_percent", 100)
+    daily_limit = risk.get("daily_trade_limit", 0) or None
+
+    symbols = list(candidates)
+    if not symbols:
+        return [], {}, False
+    columns = {f: np.concatenate([candidates[s][f] for s in symbols])
+               for f in ("direction", "entry_time", "exit_time", "entry_price", "exit_price", "reason", "ret")}
+    owner = np.concatenate([np.full(len(candidates[s]["ret"]), j) for j, s in enumerate(symbols)])
+    order = np.argsort(columns["entry_time"], kind="stable")
+
+    trades = []
+    equity = peak = float(initial_equity)
+    halted = False
+    skipped = dict.fromkeys(symbols, 0)
+    busy_until = {}
+    day_counts = {}
+    pending = []            # heap of (exit_time, candidate) for open positions
+
+    def settle(until):
+        nonlocal equity, peak, halted
+        while pending and pending[0][0] <= until:
+            _, c = heapq.heappop(pending)
+            equity *= 1 + columns["ret"][c]
+            peak = max(peak, equity)
+            if (peak - equity) / peak * 100.0 >= max_dd:
+                halted = True
+            trades.append((symbols[owner[c]], int(columns["direction"][c]), int(columns["entry_time"][c]),
+                           int(columns["exit_time"][c]), float(columns["entry_price"][c]),
+                           float(columns["exit_price"][c]), REASONS[columns["reason"][c]],
+                           float(columns["ret"][c]) * 100.0, equity))
+
+    for c in order.tolist():
+        entry_time = int(columns["entry_time"][c])
+        # Positions closing at or before this entry settle first
+        settle(entry_time)
+        if halted:
+            break
+        symbol = symbols[owner[c]]
+        if entry_time <= busy_until.get(symbol, -1):
+            continue
+        day = entry_time // DAY_MS
+        if daily_limit is not None and day_counts.get(day, 0) >= daily_limit:
+            skipped[symbol] += 1
+            continue
+        day_counts[day] = day_counts.get(day, 0) + 1
+        busy_until[symbol] = int(columns["exit_time"][c])
+        heapq.heappush(pending, (busy_until[symbol], c))
+    settle(float("inf"))
+    return trades, skipped, halted
+
+
+def trade_stats(trades, initial_equity):
+    """Summary stats for trades (closing order), compounding from initial_equity."""
+    returns = np.array([t[7] for t in trades])
+    held = np.array([(t[3] - t[2]) / MINUTE_MS for t in trades])
+    equity = initial_equity * np.cumprod(1 + returns / 100.0)
+    peak = np.maximum.accumulate(np.concatenate(([initial_equity], equity)))[1:]
+    gains, losses = returns[returns > 0].sum(), -returns[returns < 0].sum()
+    return {
+        "trades": len(trades),
+        "win_rate": round(float((returns > 0).mean()) * 100, 2) if len(returns) else 0.0,
+        "total_return_pct": round((equity[-1] / initial_equity - 1) * 100, 4) if len(equity) else 0.0,
+        "max_drawdown_pct": round(float(((peak - equity) / peak).max() * 100), 4) if len(equity) else 0.0,
+        "profit_factor": round(gains / losses, 4) if losses > 0 else None,
+        "avg_return_pct": round(float(returns.mean()), 4) if len(returns) else 0.0,
+        "avg_minutes_held": round(float(held.mean()), 1) if len(held) else 0.0,
+    }
+
+
+def run_symbol(task):
+    """
+    Worker: load one symbol, compute signals once and resolve its
+    candidates for every grid point. Returns (symbol, [candidates per
+    grid point], signals dropped for a missing entry bar).
+    """
+    db_path, symbol, start_ms, end_ms, cfg, grid = task
+    bars = load_series(db_path, symbol, start_ms, end_ms,
+                       cfg["backtest"].get("data_source", "auto"))
+    if len(bars["timestamp"]) == 0:
+        return symbol, [], 0
+
+    ind_cfg = cfg.get("indicators", {})
+    ltf_ms = timeframe_ms(cfg.get("timeframes", {}).get("LTF", "15m"))
+    ltf = resample_arrays(bars["timestamp"], bars["open"], bars["high"], bars["low"],
+                          bars["close"], bars["volume"], ltf_ms)
+    ind = compute_indicators(ltf["high"], ltf["low"], ltf["close"], ind_cfg)
+    long_entry, short_entry = entry_signals(ind, ind_cfg)
+
+    # A signal is known when its LTF bar closes: enter on that bucket's last
+    # 1m bar. If that minute is missing there is no price at the signal time,
+    # and an earlier bar's close would be a fill from before the signal.
+    signal_mask = long_entry | short_entry
+    close_times = ltf["timestamp"][signal_mask] + ltf_ms - MINUTE_MS
+    entry_idx = np.searchsorted(bars["timestamp"], close_times)
+    found = entry_idx < len(bars["timestamp"])
+    found[found] = bars["timestamp"][entry_idx[found]] == close_times[found]
+    directions = np.where(long_entry[signal_mask], 1, -1)
+    entry_idx, directions = entry_idx[found], directions[found]
+    missing = int((~found).sum())
+
+    fee_pct = cfg["backtest"].get("fee_percent", 0.0)
+    return symbol, [resolve_trades(bars, entry_idx, directions, params, fee_pct) for params in grid], missing
+
+
+def parameter_grid(bt_cfg):
+    base = dict(bt_cfg.get("exits", {}))
+    grid = bt_cfg.get("grid") or {}
+    keys = list(grid)
+    if not keys:
+        return [base]
+    return [dict(base, **dict(zip(keys, combo))) for combo in itertools.product(*grid.values())]
+
+
+def run_backtest(cfg, db_path=DB_PATH):
+    bt = cfg["backtest"]
+    start_ms, end_ms = to_ms(bt["start"]), to_ms(bt["end"])
+    symbols = bt.get("symbols") or list_symbols(db_path)
+    grid = parameter_grid(bt)
+    workers = bt.get("workers") or os.cpu_count()
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    out_dir = os.path.join(bt.get("output_dir", "backtests"), stamp)
+    os.makedirs(out_dir, exist_ok=True)
+
+    print(f"Backtesting {len(symbols)} symbols x {len(grid)} parameter sets on {workers} workers")
+    started = time.perf_counter()
+    tasks = [(db_path, s, start_ms, end_ms, cfg, grid) for s in symbols]
+
+    candidates = [{} for _ in grid]      # grid point -> {symbol: resolved candidates}
+    missing = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_symbol, t) for t in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            symbol, resolved, missing[symbol] = future.result()
+            for grid_i, cands in enumerate(resolved):
+                candidates[grid_i][symbol] = cands
+            print(f"[{done}/{len(tasks)}] {symbol} done")
+
+    risk = cfg.get("risk", {})
+    initial_equity = bt.get("initial_equity", 10000)
+    with open(os.path.join(out_dir, "trades.csv"), "w", newline="") as tf, \
+            open(os.path.join(out_dir, "summary.csv"), "w", newline="") as sf:
+        trade_writer = csv.writer(tf)
+        trade_writer.writerow(TRADE_FIELDS)
+        summary_writer = csv.DictWriter(sf, fieldnames=SUMMARY_FIELDS)
+        summary_writer.writeheader()
+
+        for grid_i, params in enumerate(grid):
+            trades, skipped, halted = simulate(candidates[grid_i], risk, initial_equity)
+            run_id = f"grid-{grid_i}"
+            by_symbol = {}
+            for t in trades:
+                trade_writer.writerow([run_id, t[0], "long" if t[1] > 0 else "short", *t[2:]])
+                by_symbol.setdefault(t[0], []).append(t)
+            rows = [("ALL", trades, sum(skipped.values()), sum(missing.values()))]
+            rows += [(s, by_symbol.get(s, []), skipped[s], missing[s]) for s in sorted(candidates[grid_i])]
+            for symbol, symbol_trades, symbol_skipped, symbol_missing in rows:
+                summary_writer.writerow({
+                    "run_id": run_id,
+                    "symbol": symbol,
+                    "stop_loss_percent": params["stop_loss_percent"],
+                    "take_profit_percent": params["take_profit_percent"],
+                    "stagnant_minutes": params["stagnant_minutes"],
+                    **trade_stats(symbol_trades, initial_equity),
+                    "halted_by_drawdown": halted,
+                    "skipped_by_daily_limit": symbol_skipped,
+                    "skipped_missing_bar": symbol_missing,
+                })
+
+    print(f"Backtest finished in {time.perf_counter() - started:.1f}s -> {out_dir}")
+    return out_dir
+
+
+if __name__ == "__main__":
+    config = load_config(sys.argv[1] if len(sys.argv) > 1 else CONFIG_PATH)
+    if config.get("mode") != "backtest":
+        print(f"Note: config mode is '{config.get('mode')}', running backtest anyway")
+    run_backtest(config)
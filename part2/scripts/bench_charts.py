@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+bench_charts.py
+
+Chart rendering for trade alerts, inline in the caller versus through
+ChartService, on a temporary market_data_1m with SYMBOLS x DAYS of bars:
+
+  * throughput: charts/s for distinct jobs (every one a cache miss)
+  * alert replay: ALERTS trades, each asking for its 15m and 4h chart,
+    with a share of repeated alerts, while the caller's event loop runs
+    a 5 ms heartbeat. Reports the p95 time a render call holds the
+    caller (the latency it adds to the trading loop), the p95 heartbeat
+    lag, and how many requests needed no new drawing (cache hits and
+    requests joining a render in flight).
+
+--fake-ms N replaces the mplfinance renderer with a stand-in that still
+reads the bars but then burns N ms of CPU under the GIL, to check the
+pool and cache behaviour without matplotlib.
+
+Usage: python bench_charts.py [ALERTS] [--workers N] [--fake-ms N]
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import chart_service
+from chart_service import ChartService, chart_job, load_bars, render_chart
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import storage
+
+SYMBOLS = 20
+DAYS = 30
+MINUTE_MS = 60000
+REPEAT_SHARE = 0.3      # alerts that repeat an earlier trade's charts
+HEARTBEAT = 0.005
+OVERLAYS = ("ema:21", "ema:55", "bb:20")
+
+
+def _stand_in_render(ms, conn, job):
+    load_bars(conn, job)
+    stop = time.perf_counter() + ms / 1000
+    while time.perf_counter() < stop:
+        pass
+    return bytes(60 * 1024)
+
+
+def seed(db_path, end_ms):
+    conn = storage.connect(db_path)
+    rng = np.random.default_rng(3)
+    n = DAYS * 1440
+    ts = end_ms - np.arange(n, 0, -1, dtype=np.int64) * MINUTE_MS
+    for s in range(SYMBOLS):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+        rows = zip([f"S{s}USDT"] * n, ts.tolist(), close.tolist(), (close * 1.001).tolist(),
+                   (close * 0.999).tolist(), close.tolist(), rng.uniform(1, 10, n).tolist())
+        conn.executemany("INSERT INTO market_data_1m VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def alert_jobs(end_ms, alerts, rng):
+    """Per alert: its 15m and 4h charts with an entry level; some alerts repeat."""
+    trades = []
+    for i in range(alerts):
+        if trades and rng.random() < REPEAT_SHARE:
+            trades.append(rng.choice(trades))
+            continue
+        symbol = f"S{rng.randrange(SYMBOLS)}USDT"
+        at = end_ms - rng.randrange(DAYS // 2 * 1440) * MINUTE_MS
+        trades.append((symbol, at, f"level:{100 + i % 7}"))
+    return [[chart_job(symbol, tf, end_ms=at, overlays=OVERLAYS + (level,)) for tf in ("15m", "4h")]
+            for symbol, at, level in trades]
+
+
+async def replay(alerts, start):
+    """Run alerts through start(job) -> awaitable under a heartbeat; returns (hold times, lags) in ms."""
+    lags, holds = [], []
+    done = asyncio.Event()
+
+    async def heartbeat():
+        while not done.is_set():
+            expected = time.perf_counter() + HEARTBEAT
+            await asyncio.sleep(HEARTBEAT)
+            lags.append(max(0.0, time.perf_counter() - expected))
+
+    beat = asyncio.create_task(heartbeat())
+    tasks = []
+    for jobs in alerts:
+        for job in jobs:
+            started = time.perf_counter()
+            tasks.append(start(job))
+            holds.append(time.perf_counter() - started)
+        await asyncio.sleep(0.02)
+    await asyncio.gather(*tasks)
+    done.set()
+    await beat
+    return np.array(holds) * 1000, np.array(lags) * 1000
+
+
+def main(n_alerts, workers, fake_ms):
+    renderer = render_chart if fake_ms is None else functools.partial(_stand_in_render, fake_ms)
+    end_ms = int(time.time() // 60) * MINUTE_MS
+    rng = random.Random(5)
+    alerts = alert_jobs(end_ms, n_alerts, rng)
+    distinct = list(dict.fromkeys(job for jobs in alerts for job in jobs))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "crypto.db")
+        seed(db_path, end_ms)
+        print(f"{SYMBOLS} symbols x {DAYS} days of 1m bars, {len(alerts)} alerts, "
+              f"{len(distinct)} distinct charts, {workers} workers"
+              + (f", stand-in renderer {fake_ms} ms" if fake_ms is not None else ""))
+
+        # Inline: the caller draws every chart itself
+        conn = sqlite3.connect(db_path)
+        if fake_ms is None:
+            chart_service.warm_up()
+        started = time.perf_counter()
+        for job in distinct:
+            renderer(conn, job)
+        inline_rate = len(distinct) / (time.perf_counter() - started)
+
+        def inline(job):
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(renderer(conn, job))
+            return future
+
+        holds, lags = asyncio.run(replay(alerts, inline))
+        conn.close()
+        print(f"inline   {inline_rate:6.1f} charts/s  call holds caller p95 {np.percentile(holds, 95):8.2f} ms  "
+              f"loop lag p95 {np.percentile(lags, 95):7.2f} ms  max {lags.max():7.1f} ms")
+
+        service = ChartService(db_path, workers=workers, renderer=renderer, warm=fake_ms is None)
+        try:
+            print(f"pool ready in {service.start():.2f}s")
+            started = time.perf_counter()
+            for future in [service.submit(job) for job in distinct]:
+                future.result()
+            pool_rate = len(distinct) / (time.perf_counter() - started)
+
+            service.cache.clear()
+            service.cached_bytes = service.renders = 0
+            service.requests = service.cache_hits = service.coalesced = 0
+            holds, lags = asyncio.run(replay(alerts, lambda job: asyncio.wrap_future(service.submit(job))))
+            stats = service.stats()
+            saved = 1 - stats["renders"] / stats["requests"]
+        finally:
+            service.close()
+        print(f"service  {pool_rate:6.1f} charts/s  call holds caller p95 {np.percentile(holds, 95):8.2f} ms  "
+              f"loop lag p95 {np.percentile(lags, 95):7.2f} ms  max {lags.max():7.1f} ms  "
+              f"not redrawn {saved:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("alerts", nargs="?", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=chart_service.CHART_WORKERS)
+    parser.add_argument("--fake-ms", type=float, default=None)
+    args = parser.parse_args()
+    main(args.alerts, args.workers, args.fake_ms)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+bench_conviction.py
+
+Scores a full symbol universe through ConvictionService the way the
+decision loop would at a bar close: a cold pass (empty cache), then
+several "next bar" passes where a fraction of symbols changed state.
+Reports wall time per pass against the 60 s budget of a 1m bar, the
+cache hit rate and batch latency percentiles.
+
+--fake-ms N replaces the model with a stand-in that costs N ms per
+prompt, to check batching and caching behaviour without torch.
+
+Usage: python bench_conviction.py [N_SYMBOLS] [--fake-ms N]
+"""
+
+import asyncio
+import random
+import sys
+import time
+
+import numpy as np
+
+from conviction_server import ConvictionModel, ConvictionService
+
+CHANGE_PER_BAR = 0.15   # share of symbols whose discretized state moves each bar
+
+
+class _StandInModel:
+    def __init__(self, ms_per_prompt):
+        self.ms = ms_per_prompt
+
+    def score(self, prompts):
+        time.sleep(self.ms * len(prompts) / 1000)
+        return np.tile([0.2, 0.3, 0.5], (len(prompts), 1))
+
+
+def random_state(rng):
+    def tf():
+        close = 100 * (1 + rng.uniform(-0.05, 0.05))
+        mid = 100.0
+        return {"close": close, "rsi": rng.uniform(20, 80), "macd_hist": rng.uniform(-1, 1),
+                "adx": rng.uniform(10, 45), "plus_di": rng.uniform(10, 35), "minus_di": rng.uniform(10, 35),
+                "ema_short": mid + rng.uniform(-1, 1), "ema_long": mid, "bb_upper": mid * 1.03,
+                "bb_lower": mid * 0.97, "vwap": mid + rng.uniform(-1, 1)}
+    return {"4h": tf(), "15m": tf()}
+
+
+async def main(n_symbols, fake_ms):
+    # Latency does not depend on the weights, so the untuned model will do
+    model = _StandInModel(fake_ms) if fake_ms is not None else ConvictionModel(base_model=True)
+    service = ConvictionService(model)
+    runner = asyncio.create_task(service.run())
+    rng = random.Random(11)
+    states = [random_state(rng) for _ in range(n_symbols)]
+
+    for bar in range(6):
+        if bar:
+            for i in rng.sample(range(n_symbols), int(n_symbols * CHANGE_PER_BAR)):
+                states[i] = random_state(rng)
+        started = time.perf_counter()
+        await service.score_many(states)
+        elapsed = time.perf_counter() - started
+        print(f"bar {bar}: {n_symbols} symbols scored in {elapsed:.2f}s "
+              f"({elapsed / 60:.1%} of a 1m bar)")
+
+    runner.cancel()
+    print(service.stats())
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    fake = None
+    if "--fake-ms" in args:
+        k = args.index("--fake-ms")
+        fake = float(args[k + 1])
+        del args[k:k + 2]
+    asyncio.run(main(int(args[0]) if args else 300, fake))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+bench_execution_gateway.py
+
+ExecutionGateway and PaperGateway against a local fake fapi server
+(FakeExchange below: verifies the API key and HMAC signature, counts
+request weight and orders in clock-aligned windows, returns the
+X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-* headers and answers 429 with
+Retry-After past a limit, after --latency-ms of simulated exchange time):
+
+  * signing: microseconds per signature, hmac.new() per request versus
+    copying the precomputed keyed object
+  * throughput, limits raised out of the way: ORDERS market orders from
+    --concurrency callers, sent
+      adhoc    a new session and connection per order, no limit tracking
+               (how a client built on demand behaves)
+      single   the gateway, one order per call
+      batched  the gateway, place_orders() in batchOrders calls
+    reporting orders/s, p50/p95/p99 call round trip and the connections
+    the server saw
+  * limits, at the real fapi limits (300 orders / 10 s): a burst of
+    --burst orders, adhoc versus gateway, counting 429s, limiter waits
+    and orders accepted
+  * paper: ORDERS market orders through PaperGateway at the configured
+    latency, checking the round-trip distribution
+
+Usage: python bench_execution_gateway.py [ORDERS] [--concurrency N] [--latency-ms N] [--burst N]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import math
+import time
+from urllib.parse import parse_qsl, urlencode
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+from yarl import URL
+
+import execution_gateway as eg
+from live_bar_cache import LiveBarCache
+
+API_KEY = "bench-key"
+API_SECRET = "bench-secret"
+OPEN_LIMITS = tuple((header, seconds, 10 ** 9) for header, seconds, _ in eg.FAPI_LIMITS)
+
+
+class FakeExchange:
+    def __init__(self, limits=eg.FAPI_LIMITS, latency_ms=0.0):
+        self.limits = limits
+        self.latency = latency_ms / 1000
+        self.used = {header: [0, 0] for header, _, _ in limits}     # header -> [window, used]
+        self.routes = {(method, path): name for name, (method, path, _) in eg.ENDPOINTS.items()}
+        self.ids = itertools.count(1)
+        self.open = {}
+        self.transports = set()
+        self.requests = 0
+        self.rejected_429 = 0
+        self.orders_accepted = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        return app
+
+    def _headers(self, now):
+        headers = {}
+        for header, seconds, _ in self.limits:
+            window, used = self.used[header]
+            headers[header] = str(used if window == int(now // seconds) else 0)
+        return headers
+
+    def _charge(self, cost, now):
+        """Count the request; seconds until the violated window rolls over, or 0 if allowed."""
+        for (header, seconds, limit), amount in zip(self.limits, cost):
+            state = self.used[header]
+            if state[0] != int(now // seconds):
+                state[:] = [int(now // seconds), 0]
+            if amount and state[1] + amount > limit:
+                return math.ceil(seconds - now % seconds)
+        for (header, _, _), amount in zip(self.limits, cost):
+            self.used[header][1] += amount
+        return 0
+
+    def _fill(self, params):
+        order = {"orderId": next(self.ids), "clientOrderId": params.get("newClientOrderId"),
+                 "symbol": params["symbol"], "side": params["side"], "type": params["type"],
+                 "origQty": params["quantity"], "updateTime": int(time.time() * 1000)}
+        if params["type"] == "MARKET":
+            order.update(status="FILLED", avgPrice="100", executedQty=params["quantity"])
+        else:
+            order.update(status="NEW", price=params["price"], avgPrice="0", executedQty="0")
+            self.open[order["orderId"]] = order
+        return order
+
+    async def handle(self, request):
+        self.requests += 1
+        self.transports.add(request.transport)     # held, so ids are not reused
+        now = time.time()
+        name = self.routes.get((request.method, request.path))
+        if name is None:
+            return web.json_response({"code": -1000, "msg": "Unknown endpoint"}, status=404)
+        raw = request.raw_path.partition("?")[2]
+        if name != "time":
+            query, _, signature = raw.rpartition("&signature=")
+            expected = hmac.new(API_SECRET.encode(), query.encode(), hashlib.sha256).hexdigest()
+            if request.headers.get("X-MBX-APIKEY") != API_KEY or signature != expected:
+                return web.json_response({"code": -1022, "msg": "Signature for this request is not valid."},
+                                         status=400)
+        params = dict(parse_qsl(raw))
+        cost = eg.ENDPOINTS[name][2]
+        retry_after = self._charge(cost, now)
+        if retry_after:
+            self.rejected_429 += 1
+            headers = self._headers(now)
+            headers["Retry-After"] = str(retry_after)
+            return web.json_response({"code": -1003, "msg": "Too many requests."}, status=429, headers=headers)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if name == "time":
+            body = {"serverTime": int(time.time() * 1000)}
+        elif name == "order":
+            body = self._fill(params)
+            self.orders_accepted += 1
+        elif name == "batch_orders":
+            body = [self._fill(p) for p in json.loads(params["batchOrders"])]
+            self.orders_accepted += len(body)
+        elif name == "cancel_all":
+            self.open = {k: o for k, o in self.open.items() if o["symbol"] != params["symbol"]}
+            body = {"code": 200, "msg": "The operation of cancel all open order is done."}
+        elif name == "cancel_batch":
+            body = [dict(self.open.pop(i), status="CANCELED") if i in self.open
+                    else {"code": -2011, "msg": "Unknown order sent."} for i in json.loads(params["orderIdList"])]
+        elif name == "open_orders":
+            body = [o for o in self.open.values() if o["symbol"] == params.get("symbol", o["symbol"])]
+        else:
+            body = {"code": -1000, "msg": "Not simulated"}
+        return web.json_response(body, headers=self._headers(time.time()))
+
+
+async def serve(exchange):
+    runner = web.AppRunner(exchange.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def adhoc_order(base_url):
+    """One order the on-demand way: fresh session, key derived, no limit tracking."""
+    query = urlencode(eg.order_params("S1USDT", "BUY", 1) | {"recvWindow": 5000,
+                                                              "timestamp": int(time.time() * 1000)})
+    signature = hmac.new(API_SECRET.encode(), query.encode(), hashlib.sha256).hexdigest()
+    async with aiohttp.ClientSession(headers={"X-MBX-APIKEY": API_KEY}) as session:
+        async with session.post(URL(f"{base_url}/fapi/v1/order?{query}&signature={signature}",
+                                    encoded=True)) as resp:
+            await resp.read()
+            return resp.status
+
+
+async def drive(calls, concurrency):
+    """Run the call coroutine factories with `concurrency` workers; returns (seconds, per-call ms, results)."""
+    queue = list(reversed(calls))
+    rtts, results = [], []
+
+    async def worker():
+        while queue:
+            call = queue.pop()
+            started = time.perf_counter()
+            try:
+                results.append(await call())
+            except eg.ExchangeError as e:
+                results.append(e)
+            rtts.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, np.array(rtts) * 1000, results
+
+
+def report(label, n_orders, elapsed, rtts, extra=""):
+    print(f"{label:<8} {n_orders / elapsed:8,.0f} orders/s  call p50 {np.percentile(rtts, 50):7.2f} ms  "
+          f"p95 {np.percentile(rtts, 95):7.2f} ms  p99 {np.percentile(rtts, 99):7.2f} ms  {extra}")
+
+
+def bench_signing(n=100000):
+    key = API_SECRET.encode()
+    query = urlencode(eg.order_params("S1USDT", "BUY", 1.5, "LIMIT", 101.25)
+                      | {"recvWindow": 5000, "timestamp": int(time.time() * 1000)}).encode()
+    started = time.perf_counter()
+    for _ in range(n):
+        hmac.new(key, query, hashlib.sha256).hexdigest()
+    fresh = (time.perf_counter() - started) / n * 1e6
+    gateway = eg.ExecutionGateway(API_KEY, API_SECRET)
+    query = query.decode()
+    started = time.perf_counter()
+    for _ in range(n):
+        gateway.sign(query)
+    pre = (time.perf_counter() - started) / n * 1e6
+    print(f"signing  hmac.new per request {fresh:5.2f} us, precomputed key copy {pre:5.2f} us")
+
+
+async def bench_throughput(n_orders, concurrency, latency_ms):
+    for mode in ("adhoc", "single", "batched"):
+        exchange = FakeExchange(OPEN_LIMITS, latency_ms)
+        runner, base_url = await serve(exchange)
+        try:
+            if mode == "adhoc":
+                calls = [lambda: adhoc_order(base_url)] * n_orders
+                elapsed, rtts, _ = await drive(calls, concurrency)
+            else:
+                limiter = eg.RateLimiter(OPEN_LIMITS)
+                async with eg.ExecutionGateway(API_KEY, API_SECRET, base_url, limiter=limiter,
+                                               max_connections=concurrency) as gateway:
+                    if mode == "single":
+                        calls = [lambda: gateway.place_order("S1USDT", "BUY", 1)] * n_orders
+                    else:
+                        batch = [eg.order_params("S1USDT", "BUY", 1) for _ in range(eg.BATCH_ORDERS_MAX)]
+                        calls = [lambda: gateway.place_orders(batch)] * (n_orders // eg.BATCH_ORDERS_MAX)
+                    elapsed, rtts, _ = await drive(calls, concurrency)
+        finally:
+            await runner.cleanup()
+        report(mode, exchange.orders_accepted, elapsed, rtts, f"connections {len(exchange.transports)}")
+
+
+async def bench_limits(burst, concurrency):
+    for mode in ("adhoc", "gateway"):
+        exchange = FakeExchange(eg.FAPI_LIMITS)
+        runner, base_url = await serve(exchange)
+        # Start just after a 10 s boundary so the burst meets one full order window
+        await asyncio.sleep(10.2 - time.time() % 10)
+        try:
+            if mode == "adhoc":
+                elapsed, _, results = await drive([lambda: adhoc_order(base_url)] * burst, concurrency)
+                waits = 0
+            else:
+                async with eg.ExecutionGateway(API_KEY, API_SECRET, base_url) as gateway:
+                    elapsed, _, results = await drive(
+                        [lambda: gateway.place_order("S1USDT", "BUY", 1)] * burst, concurrency)
+                    waits = gateway.limiter.waits
+        finally:
+            await runner.cleanup()
+        print(f"{mode:<8} burst of {burst}: accepted {exchange.orders_accepted}, 429s {exchange.rejected_429}, "
+              f"limiter waits {waits}, {elapsed:5.1f}s")
+
+
+async def bench_paper(n_orders, concurrency):
+    settings = eg.load_settings()
+    cache = LiveBarCache()
+    cache.update({"s": "S1USDT", "t": 0, "o": 100, "h": 101, "l": 99, "c": 100, "v": 1, "x": False})
+    paper = eg.PaperGateway(cache, settings["paper_latency_ms"], settings["paper_jitter_ms"],
+                            settings["paper_slippage_bps"], seed=1)
+    elapsed, rtts, results = await drive([lambda: paper.place_order("S1USDT", "BUY", 1)] * n_orders,
+                                         concurrency)
+    filled = sum(1 for r in results if isinstance(r, dict) and r["status"] == "FILLED")
+    report("paper", filled, elapsed, rtts,
+           f"(latency {settings['paper_latency_ms']:.0f} + up to {settings['paper_jitter_ms']:.0f} ms jitter)")
+
+
+def main(n_orders, concurrency, latency_ms, burst):
+    print(f"{n_orders} orders, {concurrency} concurrent callers, fake exchange latency {latency_ms} ms")
+    bench_signing()
+    asyncio.run(bench_throughput(n_orders, concurrency, latency_ms))
+    asyncio.run(bench_limits(burst, concurrency))
+    asyncio.run(bench_paper(min(n_orders, 1000), concurrency))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("orders", nargs="?", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--burst", type=int, default=450)
+    args = parser.parse_args()
+    main(args.orders, args.concurrency, args.latency_ms, args.burst)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+bench_indicators.py
+
+1. Parity: run IndicatorEngine over synthetic bars and compare every
+   indicator with a full-window pandas recomputation
+   (reference_indicators below: ewm / rolling over each symbol's whole
+   series) for a few symbols. The reference encodes the same seeding
+   conventions as indicator_engine, so this checks the incremental
+   state updates against a batch computation, not agreement with other
+   libraries. Any mismatch makes the script exit non-zero.
+2. Benchmark: per-tick update cost for the whole universe (default 300
+   symbols).
+
+Usage: python bench_indicators.py [n_symbols] [n_ticks]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicator_engine import DAY_MS, IndicatorEngine
+
+PARITY_SYMBOLS = 3
+PARITY_BARS = 600
+TOLERANCE = 1e-6
+
+
+def synthetic_bars(n_symbols, n_bars, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, (n_symbols, n_bars)), axis=1))
+    high = close * (1 + rng.uniform(0, 0.002, close.shape))
+    low = close * (1 - rng.uniform(0, 0.002, close.shape))
+    volume = rng.uniform(1, 100, close.shape)
+    # Starts an hour before midnight UTC so the VWAP session reset is covered
+    timestamp = np.broadcast_to(DAY_MS - 3600000 + np.arange(n_bars, dtype=np.int64) * 60000, close.shape)
+    return {"timestamp": timestamp, "high": high, "low": low, "close": close, "volume": volume}
+
+
+# === PANDAS REFERENCE ===
+
+def _ema(s, length):
+    """EMA seeded with the SMA of the first `length` values of s (NaN prefix skipped)."""
+    valid = s.dropna()
+    seeded = valid.iloc[length - 1:].copy()
+    seeded.iloc[0] = valid.iloc[:length].mean()
+    return seeded.ewm(span=length, adjust=False).mean().reindex(s.index)
+
+
+def _rma(s, length):
+    """Wilder smoothing from the first observation, reported after `length` of them."""
+    valid = s.dropna()
+    return valid.ewm(alpha=1.0 / length, adjust=False, min_periods=length).mean().reindex(s.index)
+
+
+def reference_indicators(timestamp, h, l, c, v):
+    """Every IndicatorEngine output for one symbol, recomputed over the whole series."""
+    prev_close = c.shift(1)
+    diff = c.diff()
+    gain, loss = _rma(diff.clip(lower=0), 14), _rma((-diff).clip(lower=0), 14)
+
+    macd = _ema(c, 12) - _ema(c, 26)
+    signal = _ema(macd, 9)
+
+    tr = pd.concat([h - l, (h - prev_close).abs(), (l - prev_close).abs()], axis=1).max(axis=1, skipna=False)
+    up, dn = h.diff(), -l.diff()
+    plus_dm = up.where((up > dn) & (up > 0), 0.0).where(prev_close.notna())
+    minus_dm = dn.where((dn > up) & (dn > 0), 0.0).where(prev_close.notna())
+    atr, plus, minus = _rma(tr, 14), _rma(plus_dm, 14), _rma(minus_dm, 14)
+    dx = 100.0 * (plus - minus).abs() / (plus + minus)
+
+    mid = c.rolling(20).mean()
+    std = c.rolling(20).std(ddof=0)
+
+    day = pd.Series(timestamp // DAY_MS, index=c.index)
+    pv = ((h + l + c) / 3.0 * v).groupby(day).cumsum()
+    return {
+        "rsi": 100.0 * gain / (gain + loss),
+        "macd": macd,
+        "macd_hist": macd - signal,
+        "macd_signal": signal,
+        "adx": _rma(dx, 14),
+        "plus_di": 100.0 * plus / atr,
+        "minus_di": 100.0 * minus / atr,
+        "ema_short": _ema(c, 20),
+        "ema_long": _ema(c, 50),
+        "bb_lower": mid - 2 * std,
+        "bb_mid": mid,
+        "bb_upper": mid + 2 * std,
+        "vwap": pv / v.groupby(day).cumsum(),
+    }
+
+
+def check_parity():
+    bars = synthetic_bars(PARITY_SYMBOLS, PARITY_BARS)
+    engine = IndicatorEngine([f"SYM{i}" for i in range(PARITY_SYMBOLS)])
+    history = []
+    for t in range(PARITY_BARS):
+        values = engine.update(bars["timestamp"][:, t], bars["high"][:, t], bars["low"][:, t],
+                               bars["close"][:, t], bars["volume"][:, t])
+        history.append({k: v.copy() for k, v in values.items()})
+
+    ok = True
+    for i in range(PARITY_SYMBOLS):
+        series = [pd.Series(bars[f][i]) for f in ("high", "low", "close", "volume")]
+        reference = reference_indicators(bars["timestamp"][i], *series)
+        for name, ref in reference.items():
+            mine = np.array([row[name][i] for row in history])
+            ref = ref.to_numpy()
+            both = ~np.isnan(mine) & ~np.isnan(ref)
+            err = np.max(np.abs(mine[both] - ref[both])) if both.any() else 0.0
+            same_warmup = np.array_equal(np.isnan(mine), np.isnan(ref))
+            status = "ok" if err < TOLERANCE and same_warmup and both.any() else "MISMATCH"
+            if status != "ok":
+                ok = False
+            print(f"Parity SYM{i} {name:12s} max_abs_err={err:.2e} warmup_match={same_warmup} {status}")
+    return ok
+
+
+def benchmark(n_symbols=300, n_ticks=2000):
+    bars = synthetic_bars(n_symbols, n_ticks, seed=11)
+    engine = IndicatorEngine([f"SYM{i}" for i in range(n_symbols)])
+    timings = np.empty(n_ticks)
+    for t in range(n_ticks):
+        start = time.perf_counter()
+        engine.update(bars["timestamp"][:, t], bars["high"][:, t], bars["low"][:, t],
+                      bars["close"][:, t], bars["volume"][:, t])
+        timings[t] = time.perf_counter() - start
+    us = timings * 1e6
+    print(f"Benchmark: {n_symbols} symbols, {n_ticks} ticks: "
+          f"mean={us.mean():.1f}us p50={np.percentile(us, 50):.1f}us "
+          f"p99={np.percentile(us, 99):.1f}us per tick "
+          f"({us.mean() / n_symbols * 1000:.1f}ns per symbol)")
+
+
+if __name__ == "__main__":
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    n_ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    parity_ok = check_parity()
+    benchmark(n_symbols, n_ticks)
+    if not parity_ok:
+        sys.exit("Parity: IndicatorEngine does not match the pandas reference")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+bench_ingest.py
+
+Load test for agent_B_ingest on localhost: runs the server against a
+temporary database, keeps CONCURRENCY clients POSTing for DURATION
+seconds (single items, or batches with --batch N) and subscribes on the
+Unix socket like the Agent B core would.
+
+Reports sustained requests/s and items/s, plus p50/p99 latency from
+the client sending a request to the subscriber receiving the item.
+Clients and server share one event loop, so throughput is a lower bound.
+
+Usage: python bench_ingest.py [DURATION] [CONCURRENCY] [--batch N]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+
+import agent_B_ingest
+
+
+async def client(session, url, stop_at, batch, counter, worker_id):
+    seq = 0
+    while time.perf_counter() < stop_at:
+        sent = time.time()
+        items = [{"headline": f"w{worker_id} headline {seq + k} sent={sent}",
+                  "link": f"https://example.com/{worker_id}/{seq + k}"} for k in range(batch)]
+        seq += batch
+        payload = items[0] if batch == 1 else {"items": items}
+        async with session.post(url, json=payload) as resp:
+            assert resp.status == 200, await resp.text()
+        counter[0] += 1
+
+
+async def subscriber(socket_path, latencies, received):
+    async for item in agent_B_ingest.subscribe_news(socket_path, retry_delay=0.05):
+        sent = float(item["headline"].rsplit("sent=", 1)[1])
+        latencies.append(time.time() - sent)
+        received[0] += 1
+
+
+async def main(duration, concurrency, batch):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "crypto.db")
+        socket_path = os.path.join(tmp, "news.sock")
+        runner = web.AppRunner(agent_B_ingest.create_app(db_path, socket_path), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}/ingest"
+
+        latencies, received, counter = [], [0], [0]
+        sub = asyncio.create_task(subscriber(socket_path, latencies, received))
+        await asyncio.sleep(0.2)
+
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            started = time.perf_counter()
+            stop_at = started + duration
+            await asyncio.gather(*(client(session, url, stop_at, batch, counter, i)
+                                   for i in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            await asyncio.sleep(0.2)
+            async with session.get(f"http://127.0.0.1:{port}/stats") as resp:
+                stats = await resp.json()
+
+        sub.cancel()
+        await runner.cleanup()
+
+    lat = np.array(latencies) * 1000
+    print(f"{concurrency} clients, batch {batch}, {elapsed:.1f}s")
+    print(f"  {counter[0] / elapsed:,.0f} requests/s, {counter[0] * batch / elapsed:,.0f} items/s, "
+          f"{stats['commits']} group commits")
+    print(f"  subscriber got {received[0]} items; ingest->consumer latency "
+          f"p50 {np.percentile(lat, 50):.2f} ms, p99 {np.percentile(lat, 99):.2f} ms")
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    batch = 1
+    if "--batch" in sys.argv:
+        batch = int(sys.argv[sys.argv.index("--batch") + 1])
+        args.remove(str(batch))
+    duration = float(args[0]) if args else 5.0
+    concurrency = int(args[1]) if len(args) > 1 else 32
+    asyncio.run(main(duration, concurrency, batch))
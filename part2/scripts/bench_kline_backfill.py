@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+bench_kline_backfill.py
+
+Cold-start backfill of a whole shard: SYMBOLS with an empty
+market_data_1m and MINUTES of lookback, served by a local fake klines
+endpoint (deterministic bars, KLINES_LIMIT rows per page). Runs
+kline_backfill.backfill_gaps() against a temporary database, then checks
+that every minute reached market_data_1m with the served values and
+that find_gaps() has nothing left. Exits non-zero if anything is missing.
+
+Usage: python bench_kline_backfill.py [SYMBOLS] [MINUTES]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+import kline_backfill
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import storage
+
+MINUTE_MS = kline_backfill.MINUTE_MS
+
+
+def fake_bar(symbol, open_time):
+    """Deterministic (open, high, low, close, volume) for a symbol and minute."""
+    base = 100 + sum(map(ord, symbol)) % 50 + (open_time // MINUTE_MS) % 97 / 100
+    return base, base + 0.5, base - 0.5, base + 0.25, float(open_time // MINUTE_MS % 13 + 1)
+
+
+async def klines(request):
+    symbol = request.query["symbol"]
+    start = int(request.query["startTime"])
+    end = int(request.query["endTime"])
+    limit = int(request.query.get("limit", 500))
+    now_ms = int(time.time() * 1000)
+    rows = []
+    t = -(-start // MINUTE_MS) * MINUTE_MS
+    while t <= end and len(rows) < limit and t + MINUTE_MS <= now_ms:
+        o, h, l, c, v = fake_bar(symbol, t)
+        rows.append([t, str(o), str(h), str(l), str(c), str(v), t + MINUTE_MS - 1])
+        t += MINUTE_MS
+    return web.json_response(rows, headers={"X-MBX-USED-WEIGHT-1M": "1"})
+
+
+async def run(symbols, minutes, db_path):
+    app = web.Application()
+    app.router.add_get(kline_backfill.KLINES_PATH, klines)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    rest_base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    try:
+        async with kline_backfill.new_session() as session:
+            started = time.perf_counter()
+            filled = await kline_backfill.backfill_gaps(session, symbols, db_path, rest_base,
+                                                        lookback_minutes=minutes,
+                                                        limiter=kline_backfill.WeightLimiter())
+            return filled, time.perf_counter() - started
+    finally:
+        await runner.cleanup()
+
+
+def main(n_symbols, minutes):
+    symbols = [f"S{i}USDT" for i in range(n_symbols)]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "crypto.db")
+        storage.connect(db_path).close()
+        now = time.time()
+        end = kline_backfill.current_minute_ms(now)
+        start = end - minutes * MINUTE_MS
+        filled, elapsed = asyncio.run(run(symbols, minutes, db_path))
+
+        conn = storage.connect(db_path)
+        rows = conn.execute("""
+            SELECT symbol, timestamp, open, high, low, close, volume FROM market_data_1m
+            WHERE timestamp >= ? AND timestamp < ?
+        """, (start, end)).fetchall()
+        conn.close()
+        expected = n_symbols * minutes
+        wrong = sum(1 for symbol, ts, *ohlcv in rows if tuple(ohlcv) != fake_bar(symbol, ts))
+        left = kline_backfill.find_gaps(db_path, symbols, minutes, now=now)
+        print(f"{n_symbols} symbols x {minutes} minutes: backfilled {filled:,} rows in {elapsed:.1f}s "
+              f"({filled / elapsed:,.0f} rows/s)")
+        print(f"market_data_1m has {len(rows):,} of {expected:,} rows, {wrong} with wrong values, "
+              f"{len(left)} gaps left")
+        if len(rows) != expected or wrong or left:
+            sys.exit("backfill did not reach market_data_1m intact")
+
+
+if __name__ == "__main__":
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    minutes = int(sys.argv[2]) if len(sys.argv) > 2 else 1440
+    main(n_symbols, minutes)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+bench_market_data_tiers.py
+
+market_data_1m before and after compaction (market_data_tiers.run_pass),
+on a temporary database with SYMBOLS x DAYS of 1m bars:
+
+  * live insert: one candle-writer flush (a bar per symbol, INSERT OR
+    REPLACE + commit), p50/p99
+  * recent reads: the resampler's all-symbol "last 3 days" scan and a
+    single-symbol last-500-bars read
+  * VACUUM time and file size
+  * query_bars(): 4h bars over the whole range (rollups + 1m tail) versus
+    resampling stitched 1m, and a 1m read spanning the archive and the
+    hot table, both checked against the original bars
+
+Usage: python bench_market_data_tiers.py [SYMBOLS] [DAYS] [HOT_DAYS]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import market_data_tiers as tiers
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import storage
+
+MINUTE_MS = 60000
+DAY_MS = 86400000
+INSERTS = 300
+
+
+def seed(conn, symbols, days, end_ms):
+    rng = np.random.default_rng(9)
+    n = days * 1440
+    ts = (end_ms - np.arange(n, 0, -1, dtype=np.int64) * MINUTE_MS).tolist()
+    for symbol in symbols:
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+        conn.executemany("INSERT INTO market_data_1m VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         zip([symbol] * n, ts, close.tolist(), (close * 1.001).tolist(),
+                             (close * 0.999).tolist(), close.tolist(), rng.uniform(1, 10, n).tolist()))
+        conn.commit()
+
+
+def measure(conn, symbols, end_ms, label, db_path):
+    rows = conn.execute("SELECT COUNT(*) FROM market_data_1m").fetchone()[0]
+    lat = []
+    for k in range(INSERTS):
+        ts = end_ms + k * MINUTE_MS
+        started = time.perf_counter()
+        conn.executemany("INSERT OR REPLACE INTO market_data_1m VALUES (?, ?, 1, 1, 1, 1, 1)",
+                         [(s, ts) for s in symbols])
+        conn.commit()
+        lat.append(time.perf_counter() - started)
+    conn.execute("DELETE FROM market_data_1m WHERE timestamp >= ?", (end_ms,))
+    conn.commit()
+    lat = np.array(lat) * 1000
+
+    since = end_ms - 3 * DAY_MS
+    started = time.perf_counter()
+    conn.execute("""
+        SELECT symbol, timestamp, open, high, low, close, volume
+        FROM market_data_1m WHERE timestamp >= ? ORDER BY symbol, timestamp
+    """, (since,)).fetchall()
+    scan_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    for s in symbols:
+        conn.execute("""
+            SELECT timestamp, close FROM market_data_1m
+            WHERE symbol = ? AND timestamp >= ? ORDER BY timestamp
+        """, (s, end_ms - 500 * MINUTE_MS)).fetchall()
+    recent_ms = (time.perf_counter() - started) * 1000 / len(symbols)
+    started = time.perf_counter()
+    conn.execute("VACUUM")
+    vacuum_s = time.perf_counter() - started
+    size_mb = os.path.getsize(db_path) / 1e6
+    print(f"{label:<7} {rows:>10,} hot rows  insert p50 {np.percentile(lat, 50):6.2f} ms  "
+          f"p99 {np.percentile(lat, 99):6.2f} ms  3-day scan {scan_ms:7.1f} ms  "
+          f"last 500 bars {recent_ms:5.2f} ms  VACUUM {vacuum_s:6.2f}s  file {size_mb:7.1f} MB")
+
+
+def same(a, b):
+    return all(np.allclose(np.asarray(a[f], dtype=np.float64), np.asarray(b[f], dtype=np.float64))
+               for f in tiers.FIELDS) and len(a["timestamp"]) == len(b["timestamp"])
+
+
+def main(n_symbols, days, hot_days):
+    symbols = [f"S{i}USDT" for i in range(n_symbols)]
+    end_ms = int(time.time() // 60) * MINUTE_MS
+    start_ms = end_ms - days * DAY_MS
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "crypto.db")
+        archive_dir = os.path.join(tmp, "archive")
+        conn = storage.connect(db_path)
+        started = time.perf_counter()
+        seed(conn, symbols, days, end_ms)
+        print(f"{n_symbols} symbols x {days} days of 1m bars seeded in {time.perf_counter() - started:.0f}s, "
+              f"hot_days {hot_days}")
+        probe = symbols[0]
+        original = tiers._select(conn, "market_data_1m", probe, start_ms, end_ms)
+        original_4h = tiers._resample(original, tiers.timeframe_ms("4h"))
+
+        measure(conn, symbols, end_ms, "before", db_path)
+        settings = {"hot_days": hot_days, "rollup_retention_days": tiers.ROLLUP_RETENTION_DAYS}
+        summary = tiers.run_pass(conn, settings, now_ms=end_ms, archive_dir=archive_dir)
+        print(f"compaction pass: {summary}")
+        again = tiers.run_pass(conn, settings, now_ms=end_ms, archive_dir=archive_dir)
+        print(f"second pass (nothing new): {again['seconds']}s")
+        measure(conn, symbols, end_ms, "after", db_path)
+
+        started = time.perf_counter()
+        bars_4h = tiers.query_bars(conn, probe, start_ms, end_ms, "4h", archive_dir)
+        tiered_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        from_1m = tiers._resample(tiers.bars_1m(conn, probe, start_ms, end_ms, archive_dir),
+                                  tiers.timeframe_ms("4h"))
+        stitched_ms = (time.perf_counter() - started) * 1000
+        print(f"query_bars 4h over {days} days: {tiered_ms:6.1f} ms from rollups, "
+              f"{stitched_ms:6.1f} ms resampling 1m  (match original: "
+              f"{same(bars_4h, original_4h)}, {same(from_1m, original_4h)})")
+
+        started = time.perf_counter()
+        bars = tiers.query_bars(conn, probe, start_ms, end_ms, "1m", archive_dir)
+        print(f"query_bars 1m over {days} days (archive + hot): "
+              f"{(time.perf_counter() - started) * 1000:6.1f} ms, match original: {same(bars, original)}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    hot_days = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    main(n_symbols, days, hot_days)
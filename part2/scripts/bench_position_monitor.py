@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+bench_position_monitor.py
+
+Simulated ticks against thousands of open positions, exits checked two
+ways:
+
+  scan     every tick compares each open position of the ticking symbol
+           against its SL/TP and every open position against its
+           stagnation deadline (the O(positions) loop)
+  monitor  PositionMonitor.on_price() + advance() (trigger heaps and the
+           timer wheel)
+
+Prices are random walks; every exited position is replaced by a new one
+at the current price, so POSITIONS stay open throughout. Both runs see
+the same ticks and must produce the same exits. Reports ticks/s, the
+per-tick cost and the number of exits by reason.
+
+Usage: python bench_position_monitor.py [POSITIONS] [SYMBOLS] [TICKS]
+"""
+
+import random
+import sys
+import time
+from collections import Counter
+
+from position_monitor import PositionMonitor, exit_levels
+
+EXITS = {"stop_loss_percent": 1.5, "take_profit_percent": 3.0, "stagnant_minutes": 240}
+TICK_EVERY_MS = 50           # simulated time between ticks (all symbols together)
+START_MS = 1_700_000_000_000
+
+
+def make_ticks(symbols, n_ticks, seed=7):
+    rng = random.Random(seed)
+    prices = {s: 100.0 for s in symbols}
+    ticks = []
+    for i in range(n_ticks):
+        symbol = rng.choice(symbols)
+        prices[symbol] *= 1 + rng.gauss(0, 0.0015)
+        ticks.append((symbol, prices[symbol], START_MS + i * TICK_EVERY_MS))
+    return ticks
+
+
+def seed_positions(n_positions, symbols, seed=3):
+    rng = random.Random(seed)
+    # (slot, symbol, direction, opened_at); opening times spread over the last
+    # stagnation window so deadlines keep coming due
+    window = EXITS["stagnant_minutes"] * 60000
+    return [(k, symbols[k % len(symbols)], rng.choice((1, -1)), START_MS - rng.randrange(window))
+            for k in range(n_positions)]
+
+
+class ScanMonitor:
+    """The O(positions) baseline with PositionMonitor's exit rules."""
+
+    def __init__(self):
+        self.positions = {}        # pid -> [symbol, direction, sl, tp, deadline]
+        self.by_symbol = {}        # symbol -> {pid}
+        self.last_price = {}
+
+    def open(self, pid, symbol, direction, entry, opened_at):
+        sl, tp = exit_levels(direction, entry, EXITS)
+        self.positions[pid] = [symbol, direction, sl, tp, opened_at + EXITS["stagnant_minutes"] * 60000]
+        self.by_symbol.setdefault(symbol, set()).add(pid)
+        self.last_price.setdefault(symbol, entry)
+
+    def tick(self, symbol, price, now):
+        self.last_price[symbol] = price
+        events = []
+        for pid in list(self.by_symbol.get(symbol, ())):
+            _, direction, sl, tp, _ = self.positions[pid]
+            if direction > 0:
+                reason = "stop_loss" if price <= sl else "take_profit" if price >= tp else None
+            else:
+                reason = "stop_loss" if price >= sl else "take_profit" if price <= tp else None
+            if reason:
+                events.append((pid, reason))
+                self._remove(pid)
+        for pid, (sym, _, _, _, deadline) in list(self.positions.items()):
+            if deadline <= now:
+                events.append((pid, "stagnant"))
+                self._remove(pid)
+        return events
+
+    def _remove(self, pid):
+        symbol = self.positions.pop(pid)[0]
+        self.by_symbol[symbol].discard(pid)
+
+
+def run(kind, positions, ticks, n_positions):
+    entry = {}
+    if kind == "scan":
+        monitor = ScanMonitor()
+
+        def open_(pid, symbol, direction, price, at):
+            monitor.open(pid, symbol, direction, price, at)
+
+        def step(symbol, price, now):
+            return monitor.tick(symbol, price, now)
+    else:
+        monitor = PositionMonitor(now_ms=START_MS)
+
+        def open_(pid, symbol, direction, price, at):
+            monitor.open_with_exits(pid, symbol, direction, price, EXITS, at)
+
+        def step(symbol, price, now):
+            return [(e.position_id, e.reason) for e in monitor.on_price(symbol, price, now)
+                    + monitor.advance(now)]
+
+    for slot, symbol, direction, at in positions:
+        open_(slot, symbol, direction, 100.0, at)
+        entry[slot] = (symbol, direction)
+
+    exits = []
+    started = time.perf_counter()
+    for symbol, price, now in ticks:
+        fired = step(symbol, price, now)
+        for pid, reason in fired:
+            exits.append((pid, reason, now))
+            # Replace the position: same slot, next generation, opened at the current price
+            slot = pid % n_positions
+            sym, direction = entry[slot]
+            open_(pid + n_positions, sym, direction, monitor.last_price[sym], now)
+    elapsed = time.perf_counter() - started
+    return elapsed, exits
+
+
+def main(n_positions, n_symbols, n_ticks):
+    symbols = [f"S{i}USDT" for i in range(n_symbols)]
+    ticks = make_ticks(symbols, n_ticks)
+    positions = seed_positions(n_positions, symbols)
+    print(f"{n_positions:,} open positions over {n_symbols} symbols, {n_ticks:,} ticks "
+          f"({n_ticks * TICK_EVERY_MS / 60000:.0f} simulated minutes)")
+
+    results = {}
+    for kind in ("scan", "monitor"):
+        elapsed, exits = run(kind, positions, ticks, n_positions)
+        results[kind] = exits
+        reasons = Counter(r for _, r, _ in exits)
+        print(f"{kind:<8} {n_ticks / elapsed:>12,.0f} ticks/s  {elapsed / n_ticks * 1e6:8.2f} us/tick  "
+              f"exits {len(exits):,} ({', '.join(f'{k} {v}' for k, v in sorted(reasons.items()))})")
+
+    same = sorted(results["scan"]) == sorted(results["monitor"])
+    print(f"identical exits: {same}")
+
+
+if __name__ == "__main__":
+    n_positions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_symbols = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    n_ticks = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+    main(n_positions, n_symbols, n_ticks)
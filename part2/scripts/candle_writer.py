@@ -0,0 +1,228 @@
+"""
+candle_writer.py
+
+Dedicated SQLite writer stage for agent_B_data_feed.
+
+The websocket handler only enqueues candle rows; a single long-lived
+connection (WAL, synchronous=NORMAL) drains the queue and flushes them
+with executemany whenever BATCH_SIZE rows are pending or FLUSH_INTERVAL
+seconds have passed. The blocking commit runs in a worker thread so the
+asyncio loop keeps reading the stream while SQLite syncs.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics, storage
+
+BATCH_SIZE = 500          # rows per executemany
+FLUSH_INTERVAL = 0.5      # seconds; max age of a pending row
+MAX_BACKLOG = 50000       # rows held in memory before the drop policy applies
+
+# "drop_oldest": never block the websocket; evict the oldest queued row
+#                (gaps are repaired later from REST, newest data wins).
+# "block":       apply backpressure; the stream reader waits for space.
+DROP_POLICY = "drop_oldest"
+
+INSERT_SQL = """
+    INSERT OR REPLACE INTO market_data_1m
+    (symbol, timestamp, open, high, low, close, volume)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+ROW_LATENCY = metrics.histogram("candle_receive_to_commit_seconds",
+                                "Closed 1m bar received until its flush committed")
+FLUSH_SECONDS = metrics.histogram("candle_flush_seconds", "market_data_1m flush (executemany + commit)")
+ROWS_WRITTEN = metrics.counter("candle_rows_written_total", "Rows written to market_data_1m")
+ROWS_DROPPED = metrics.counter("candle_rows_dropped_total", "Rows evicted by the drop_oldest policy")
+FLUSH_ERRORS = metrics.counter("candle_flush_errors_total", "Failed market_data_1m flushes")
+
+SNAPSHOT_SQL = """
+    INSERT OR REPLACE INTO market_data_live
+    (symbol, timestamp, open, high, low, close, volume, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class CandleWriter:
+    def __init__(self, db_path, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_backlog=MAX_BACKLOG, drop_policy=DROP_POLICY):
+        if drop_policy not in ("drop_oldest", "block"):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.queue = asyncio.Queue(maxsize=max_backlog)
+        self.conn = None
+        self._closing = False
+        self._pending_snapshot = None
+
+        # Counters (read by the feed's stats reporter)
+        self.enqueued = 0
+        self.dropped = 0
+        self.rows_written = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.snapshots = 0
+
+    def open(self):
+        # The connection is only ever used by one flush at a time, but that
+        # flush runs in a worker thread, hence check_same_thread=False.
+        self.conn = storage.connect(self.db_path, check_same_thread=False)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    # === PRODUCER SIDE ===
+
+    def submit(self, row, received=None):
+        """
+        Enqueue one (symbol, timestamp, o, h, l, c, v) row without blocking.
+        `received` (perf_counter) is when the bar arrived, for the latency
+        histogram; defaults to now. Returns False if a row had to be dropped.
+        """
+        ok = True
+        if self.queue.full():
+            if self.drop_policy == "block":
+                raise asyncio.QueueFull("candle writer backlog full; use put() for backpressure")
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+            except asyncio.QueueEmpty:
+                pass
+            self.dropped += 1
+            ROWS_DROPPED.inc()
+            ok = False
+        self.queue.put_nowait((row, received or time.perf_counter()))
+        self.enqueued += 1
+        return ok
+
+    async def put(self, row, received=None):
+        """Enqueue one row, honouring the configured drop/backpressure policy."""
+        if self.drop_policy == "block":
+            await self.queue.put((row, received or time.perf_counter()))
+            self.enqueued += 1
+            return True
+        return self.submit(row, received)
+
+    def request_snapshot(self, rows):
+        """
+        Replace market_data_live with these open-bar rows on the next flush.
+        Only the newest pending snapshot is kept.
+        """
+        self._pending_snapshot = rows
+
+    # === CONSUMER SIDE ===
+
+    async def run(self):
+        """Drain the queue until stop() is called, flushing on size or time threshold."""
+        if self.conn is None:
+            self.open()
+        try:
+            while not (self._closing and self.queue.empty()):
+                batch = await self._collect_batch()
+                if batch:
+                    await asyncio.to_thread(self._flush, batch)
+                if self._pending_snapshot is not None:
+                    rows, self._pending_snapshot = self._pending_snapshot, None
+                    await asyncio.to_thread(self._flush_snapshot, rows)
+        finally:
+            self.close()
+
+    def stop(self):
+        """Ask run() to flush whatever is still queued and close the connection."""
+        self._closing = True
+
+    async def _collect_batch(self):
+        batch = []
+        try:
+            row = await asyncio.wait_for(self.queue.get(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            return batch
+        batch.append(row)
+        self.queue.task_done()
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            # Take everything already queued without yielding to the loop
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                self.queue.task_done()
+            if len(batch) >= self.batch_size:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(self.queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            batch.append(row)
+            self.queue.task_done()
+        return batch
+
+    def _flush(self, batch):
+        # Kline updates for the same (symbol, open time) supersede each other;
+        # keep only the newest before touching the database.
+        latest = {}
+        for row, _ in batch:
+            latest[(row[0], row[1])] = row
+        rows = list(latest.values())
+
+        start = time.perf_counter()
+        try:
+            with self.conn:
+                self.conn.executemany(INSERT_SQL, rows)
+        except Exception as e:
+            self.flush_errors += 1
+            FLUSH_ERRORS.inc()
+            print(f"[{datetime.utcnow()}] DB Error: {e}")
+            return
+        committed = time.perf_counter()
+        elapsed_ms = (committed - start) * 1000.0
+        FLUSH_SECONDS.observe(committed - start)
+        ROWS_WRITTEN.inc(len(rows))
+        for _, received in batch:
+            ROW_LATENCY.observe(committed - received)
+
+        self.flushes += 1
+        self.rows_written += len(rows)
+        self.last_flush_ms = elapsed_ms
+        self.total_flush_ms += elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+    def _flush_snapshot(self, rows):
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM market_data_live")
+                self.conn.executemany(SNAPSHOT_SQL, rows)
+        except Exception as e:
+            self.flush_errors += 1
+            print(f"[{datetime.utcnow()}] DB Error (snapshot): {e}")
+            return
+        self.snapshots += 1
+
+    def stats(self):
+        avg = self.total_flush_ms / self.flushes if self.flushes else 0.0
+        return {
+            "queue_depth": self.queue.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "snapshots": self.snapshots,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(avg, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
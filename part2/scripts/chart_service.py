@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+chart_service.py
+
+Candlestick charts for trade alerts, rendered off the trading loop.
+
+Drawing an mplfinance figure costs a few hundred milliseconds of pure
+Python/matplotlib work under the GIL, so rendering it in the decision
+process stalls the loop exactly when a trade fires. ChartService runs
+the rendering in a small process pool instead:
+
+  * workers are spawned at startup with the non-interactive Agg backend
+    and draw one throwaway chart first, so font lookup, style setup and
+    matplotlib's import are paid before the first alert, not during it;
+  * each worker reads its bars straight from the market data store over
+    its own connection (market_data_tiers.query_bars: rollups, hot 1m
+    and the archive), so a job is a few small fields on the wire and
+    only the PNG bytes come back;
+  * finished PNGs are kept in an LRU cache keyed by the job, and a job
+    already being drawn is shared with every caller asking for it, so a
+    repeated alert or the 15m/4h variants of one trade are drawn once.
+
+Jobs end on a closed-bar boundary (chart_job() aligns end_ms), so every
+alert within one bar maps to the same cache entry and a cached chart
+never goes stale.
+
+Overlays are strings: "ema:21", "sma:50", "bb:20" (Bollinger, 2 sigma)
+and "level:64250.5" (horizontal line, e.g. entry / stop / target).
+
+Usage: python chart_service.py SYMBOL TIMEFRAME [BARS] [OVERLAY ...]
+       (writes SYMBOL_TIMEFRAME.png to the current directory)
+"""
+
+import asyncio
+import io
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from market_data_tiers import query_bars
+from resampler import timeframe_ms
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics, storage
+
+DB_PATH = storage.DB_PATH
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CACHE_BYTES = 64 * 1024 * 1024     # rendered PNGs kept in memory
+DEFAULT_BARS = 120
+FIGSIZE = (10, 6)
+DPI = 100
+STYLE = "charles"
+
+JOB_SECONDS = metrics.histogram("chart_job_seconds", "Chart submitted until its PNG is ready (cache misses)")
+CACHE_HITS = metrics.counter("chart_cache_hits_total", "Charts served from the render cache")
+COALESCED = metrics.counter("chart_coalesced_total", "Requests that joined a render already in flight")
+RENDER_ERRORS = metrics.counter("chart_render_errors_total", "Jobs that failed to render")
+
+ChartJob = namedtuple("ChartJob", "symbol timeframe end_ms bars overlays")
+
+_OVERLAYS = ("ema", "sma", "bb", "level")
+
+
+# === JOBS ===
+
+def parse_overlay(overlay):
+    """'ema:21' -> ('ema', 21); 'level:64250.5' -> ('level', 64250.5)."""
+    name, _, arg = overlay.partition(":")
+    name = name.strip().lower()
+    if name not in _OVERLAYS:
+        raise ValueError(f"Unsupported overlay: {overlay}")
+    try:
+        value = float(arg) if name == "level" else int(arg)
+    except ValueError:
+        raise ValueError(f"Unsupported overlay: {overlay}")
+    if name != "level" and value < 1:
+        raise ValueError(f"Unsupported overlay: {overlay}")
+    return name, value
+
+
+def chart_job(symbol, timeframe, bars=DEFAULT_BARS, end_ms=None, overlays=()):
+    """
+    Job for the last `bars` closed bars before end_ms (default: now).
+    end_ms is aligned down to the timeframe, so the same chart requested
+    twice within one bar has the same key.
+    """
+    tf_ms = timeframe_ms(timeframe)
+    end_ms = int(time.time() * 1000) if end_ms is None else int(end_ms)
+    overlays = tuple(sorted(set(overlays)))
+    for overlay in overlays:
+        parse_overlay(overlay)
+    return ChartJob(symbol.upper(), timeframe.strip().lower(), end_ms - end_ms % tf_ms, int(bars), overlays)
+
+
+def lookback_bars(overlays):
+    """Extra bars read before the window so moving averages are settled at its left edge."""
+    periods = [int(value) for name, value in map(parse_overlay, overlays) if name != "level"]
+    return 3 * max(periods) if periods else 0
+
+
+# === RENDERING (worker side) ===
+
+def load_bars(conn, job):
+    """OHLCV arrays of job.timeframe bars, window plus overlay lookback, oldest first."""
+    tf_ms = timeframe_ms(job.timeframe)
+    start_ms = job.end_ms - (job.bars + lookback_bars(job.overlays)) * tf_ms
+    bars = query_bars(conn, job.symbol, start_ms, job.end_ms, job.timeframe)
+    if not len(bars["timestamp"]):
+        raise ValueError(f"No bars for {job.symbol} {job.timeframe} before {job.end_ms}")
+    return bars
+
+
+def draw_png(bars, title, overlays=(), show_bars=DEFAULT_BARS):
+    """PNG bytes of a candlestick + volume chart of `bars` ({field: array}, oldest first)."""
+    import matplotlib.pyplot as plt
+    import mplfinance as mpf
+    import pandas as pd
+
+    frame = pd.DataFrame(
+        {"Open": bars["open"], "High": bars["high"], "Low": bars["low"],
+         "Close": bars["close"], "Volume": bars["volume"]},
+        index=pd.to_datetime(np.asarray(bars["timestamp"], dtype=np.int64), unit="ms"),
+    )
+    close = frame["Close"]
+    lines, levels = [], []
+    for name, value in map(parse_overlay, overlays):
+        if name == "ema":
+            lines.append(close.ewm(span=value, adjust=False).mean())
+        elif name == "sma":
+            lines.append(close.rolling(value).mean())
+        elif name == "bb":
+            mid, std = close.rolling(value).mean(), close.rolling(value).std()
+            lines += [mid + 2 * std, mid - 2 * std]
+        else:
+            levels.append(value)
+
+    shown = frame.iloc[-show_bars:]
+    kwargs = {}
+    if lines:
+        kwargs["addplot"] = [mpf.make_addplot(line.iloc[-show_bars:], width=0.8) for line in lines]
+    if levels:
+        kwargs["hlines"] = dict(hlines=levels, linestyle="--", linewidths=0.8)
+    fig, _ = mpf.plot(shown, type="candle", style=STYLE, volume=True, title=title,
+                      figsize=FIGSIZE, returnfig=True, **kwargs)
+    buf = io.BytesIO()
+    try:
+        fig.savefig(buf, format="png", dpi=DPI)
+    finally:
+        plt.close(fig)
+    return buf.getvalue()
+
+
+def render_chart(conn, job):
+    """PNG bytes for one job, read from the store behind conn."""
+    bars = load_bars(conn, job)
+    return draw_png(bars, f"{job.symbol} {job.timeframe}", job.overlays, job.bars)
+
+
+def warm_up():
+    """Import matplotlib on the Agg backend and draw one synthetic chart."""
+    import matplotlib
+    matplotlib.use("Agg")
+
+    n = 60
+    ts = np.arange(n, dtype=np.int64) * 60000
+    close = 100 + np.cumsum(np.random.default_rng(0).normal(0, 0.2, n))
+    bars = {"timestamp": ts, "open": close, "high": close + 0.3, "low": close - 0.3,
+            "close": close, "volume": np.ones(n)}
+    draw_png(bars, "warm-up", ("ema:9", "level:100"), n)
+
+
+_worker = {}
+
+
+def _init_worker(db_path, renderer, warm):
+    os.environ["MPLBACKEND"] = "Agg"   # before pyplot is first imported, warm or not
+    _worker["conn"] = storage.connect(db_path, migrate_schema=False)
+    _worker["renderer"] = renderer
+    if warm:
+        warm_up()
+
+
+def _render_in_worker(job):
+    return _worker["renderer"](_worker["conn"], job)
+
+
+def _ready():
+    time.sleep(0.05)   # keep this worker busy so the next call spawns another
+    return os.getpid()
+
+
+# === SERVICE (caller side) ===
+
+class ChartService:
+    """
+    submit(job) returns a concurrent.futures.Future of PNG bytes without
+    blocking; await render(job) is the asyncio form. Safe to call from
+    any thread.
+    """
+
+    def __init__(self, db_path=DB_PATH, workers=CHART_WORKERS, cache_bytes=CACHE_BYTES,
+                 renderer=render_chart, warm=True):
+        # spawn, not fork: the caller is usually a threaded trading process
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                        initializer=_init_worker, initargs=(db_path, renderer, warm))
+        self.workers = workers
+        self.cache_bytes = cache_bytes
+        self.cache = OrderedDict()        # job -> png
+        self.cached_bytes = 0
+        self.pending = {}                 # job -> future of a render in flight
+        self.lock = threading.Lock()
+
+        self.requests = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.renders = 0
+        self.errors = 0
+
+    def start(self):
+        """Spawn and warm every worker now; returns the seconds it took."""
+        started = time.perf_counter()
+        wait([self.pool.submit(_ready) for _ in range(self.workers)])
+        return time.perf_counter() - started
+
+    def submit(self, job):
+        with self.lock:
+            self.requests += 1
+            png = self.cache.get(job)
+            if png is not None:
+                self.cache.move_to_end(job)
+                self.cache_hits += 1
+                CACHE_HITS.inc()
+                future = Future()
+                future.set_result(png)
+                return future
+            future = self.pending.get(job)
+            if future is not None:
+                self.coalesced += 1
+                COALESCED.inc()
+                return future
+            future = self.pool.submit(_render_in_worker, job)
+            self.pending[job] = future
+        submitted = time.perf_counter()
+        future.add_done_callback(lambda f: self._finished(job, f, submitted))
+        return future
+
+    async def render(self, job):
+        return await asyncio.wrap_future(self.submit(job))
+
+    async def render_many(self, jobs):
+        """PNGs for several jobs (e.g. one trade on several timeframes), in order."""
+        return await asyncio.gather(*(self.render(job) for job in jobs))
+
+    def _finished(self, job, future, submitted):
+        JOB_SECONDS.observe(time.perf_counter() - submitted)
+        with self.lock:
+            self.pending.pop(job, None)
+            if future.cancelled() or future.exception() is not None:
+                self.errors += 1
+                RENDER_ERRORS.inc()
+                return
+            png = future.result()
+            self.renders += 1
+            self.cache[job] = png
+            self.cached_bytes += len(png)
+            while self.cached_bytes > self.cache_bytes and len(self.cache) > 1:
+                _, evicted = self.cache.popitem(last=False)
+                self.cached_bytes -= len(evicted)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "cache_hit_rate": round(self.cache_hits / self.requests, 4) if self.requests else 0.0,
+                "coalesced": self.coalesced,
+                "renders": self.renders,
+                "errors": self.errors,
+                "in_flight": len(self.pending),
+                "cached_charts": len(self.cache),
+                "cached_mb": round(self.cached_bytes / 1e6, 2),
+            }
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("Usage: python chart_service.py SYMBOL TIMEFRAME [BARS] [OVERLAY ...]")
+    bars = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_BARS
+    job = chart_job(sys.argv[1], sys.argv[2], bars, overlays=sys.argv[4:])
+    service = ChartService(workers=1)
+    try:
+        print(f"Worker ready in {service.start():.2f}s")
+        started = time.perf_counter()
+        png = service.submit(job).result()
+        print(f"Rendered in {(time.perf_counter() - started) * 1000:.0f} ms")
+    finally:
+        service.close()
+    path = f"{job.symbol}_{job.timeframe}.png"
+    with open(path, "wb") as f:
+        f.write(png)
+    print(f"Wrote {path} ({len(png) / 1024:.0f} KiB)")
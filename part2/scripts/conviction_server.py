@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+conviction_server.py
+
+CPU inference service for OPT-350M conviction scoring.
+
+The decision loop submits one market state per symbol (indicator values
+per timeframe, e.g. {"4h": {...}, "15m": {...}} with the keys produced by
+IndicatorEngine plus "close"). The service:
+
+  * discretizes the state into a fingerprint (RSI/ADX in 5-point steps,
+    signs of MACD histogram / DI spread / EMA cross / close-vs-VWAP,
+    Bollinger position in fifths). The prompt is rendered from the
+    fingerprint alone, so equal fingerprints mean equal prompts and the
+    result cache is exact: a repeated market state skips inference.
+  * collects cache misses into padded micro-batches (up to BATCH_MAX
+    prompts or BATCH_WINDOW seconds) and runs them in a worker thread.
+  * runs an int8 dynamically quantized model, and computes the KV cache
+    of the shared instruction prefix once; each batch only runs the
+    short per-state suffix on top of it.
+  * scores with a single forward pass: the softmax over the answer
+    tokens (LONG / SHORT / NONE) at the end of the prompt gives the
+    direction and its probability (the conviction).
+
+Per-batch latency and the cache hit rate are kept in stats(). Run it as
+a standalone HTTP service (POST /score with {"states": [...]}, GET
+/stats, GET /metrics for the Prometheus histograms) or use
+ConvictionService in-process.
+
+The fine-tuned weights are expected at MODEL_PATH. Without them the
+server refuses to start unless it is run with --base-model: the untuned
+facebook/opt-350m answers, but its convictions mean nothing.
+
+Usage: python conviction_server.py [--base-model]
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics
+
+MODEL_PATH = os.getenv("CONVICTION_MODEL", "/home/tito/crypto_algotrader_part1/part2/models/opt350m_decision")
+BASE_MODEL = "facebook/opt-350m"
+THREADS = int(os.getenv("CONVICTION_THREADS", str(os.cpu_count() or 4)))
+HOST = "127.0.0.1"
+PORT = 8010
+
+BATCH_MAX = 32
+BATCH_WINDOW = 0.01          # seconds to wait for more requests before running a batch
+CACHE_ITEMS = 50000
+LATENCY_WINDOW = 1000        # batches kept for latency percentiles
+
+BATCH_SECONDS = metrics.histogram("conviction_batch_seconds", "One batched forward pass")
+BATCHED_PROMPTS = metrics.counter("conviction_batched_prompts_total", "Prompts run through the model")
+REQUEST_SECONDS = metrics.histogram("conviction_request_seconds", "POST /score received until answered")
+CACHE_HITS = metrics.counter("conviction_cache_hits_total", "States answered from the fingerprint cache")
+STATES = metrics.counter("conviction_states_total", "States scored or looked up")
+
+ANSWERS = ("LONG", "SHORT", "NONE")
+PROMPT_PREFIX = (
+    "You are a crypto futures trading assistant. Given the discretized market state "
+    "on a higher and a lower timeframe, answer with one word: LONG, SHORT or NONE.\n\n"
+)
+
+Conviction = namedtuple("Conviction", "direction conviction probs cached")
+
+
+# === FINGERPRINT ===
+
+def _bucket(value, step, lo=0, hi=100):
+    if value is None or not np.isfinite(value):
+        return None
+    return int(min(hi, max(lo, value)) // step * step)
+
+
+def _sign(value):
+    if value is None or not np.isfinite(value):
+        return 0
+    return 1 if value > 0 else -1 if value < 0 else 0
+
+
+def fingerprint(state):
+    """Hashable, discretized view of {timeframe: indicators} (timeframes sorted)."""
+    fp = []
+    for tf in sorted(state):
+        ind = state[tf]
+        close = ind.get("close", np.nan)
+        upper, lower = ind.get("bb_upper", np.nan), ind.get("bb_lower", np.nan)
+        if np.isfinite(upper) and np.isfinite(lower) and upper > lower:
+            bb_pos = int(min(4, max(0, (close - lower) / (upper - lower) * 5)))
+        else:
+            bb_pos = None
+        fp.append((
+            tf,
+            _bucket(ind.get("rsi"), 5),
+            _sign(ind.get("macd_hist")),
+            _bucket(ind.get("adx"), 5),
+            _sign(ind.get("plus_di", np.nan) - ind.get("minus_di", np.nan)),
+            _sign(ind.get("ema_short", np.nan) - ind.get("ema_long", np.nan)),
+            bb_pos,
+            _sign(close - ind.get("vwap", np.nan)),
+        ))
+    return tuple(fp)
+
+
+_SIGN_WORDS = {1: "up", -1: "down", 0: "flat"}
+
+
+def render_prompt(fp):
+    """Per-state prompt suffix (the shared prefix is not included)."""
+    lines = []
+    for tf, rsi, macd, adx, di, ema, bb_pos, vwap in fp:
+        lines.append(
+            f"{tf}: RSI {rsi if rsi is not None else 'na'}, MACD {_SIGN_WORDS[macd]}, "
+            f"ADX {adx if adx is not None else 'na'}, DI {_SIGN_WORDS[di]}, EMA {_SIGN_WORDS[ema]}, "
+            f"BB {bb_pos if bb_pos is not None else 'na'}/4, VWAP {_SIGN_WORDS[vwap]}"
+        )
+    return "\n".join(lines) + "\nDecision:"
+
+
+# === MODEL ===
+
+class ConvictionModel:
+    def __init__(self, model_path=MODEL_PATH, threads=THREADS, quantize=True, base_model=False):
+        """base_model=True allows falling back to BASE_MODEL when model_path is missing."""
+        path = model_path
+        if not os.path.isdir(model_path):
+            if not base_model:
+                raise FileNotFoundError(f"No fine-tuned conviction model at {model_path} "
+                                        f"(use --base-model to run the untuned {BASE_MODEL})")
+            print(f"[{datetime.utcnow()}] WARNING: {model_path} not found, scoring with the "
+                  f"untuned {BASE_MODEL}; convictions are not meaningful")
+            path = BASE_MODEL
+
+        # Heavy imports stay here so importing the module (fingerprints,
+        # HTTP client side) does not pull in torch
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        torch.set_num_threads(threads)
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.tokenizer.padding_side = "right"   # the last real token is gathered per row
+        model = AutoModelForCausalLM.from_pretrained(path, torch_dtype=torch.float32)
+        model.eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.model_path = path
+
+        # First token of each answer (with the leading space OPT's BPE expects)
+        self.answer_ids = [self.tokenizer(" " + a, add_special_tokens=False).input_ids[0] for a in ANSWERS]
+
+        # Shared prefix: run once, keep its KV cache
+        prefix = self.tokenizer(PROMPT_PREFIX, return_tensors="pt")
+        with torch.inference_mode():
+            out = model(**prefix, use_cache=True)
+        self.prefix_len = prefix.input_ids.shape[1]
+        self.prefix_kv = _legacy_cache(out.past_key_values)
+
+    def _expanded_prefix(self, batch):
+        kv = tuple((k.expand(batch, -1, -1, -1), v.expand(batch, -1, -1, -1)) for k, v in self.prefix_kv)
+        try:
+            from transformers import DynamicCache
+            return DynamicCache.from_legacy_cache(kv)
+        except ImportError:
+            return kv
+
+    def score(self, prompts):
+        """Probabilities over ANSWERS for each prompt suffix, shape (n, 3)."""
+        torch = self.torch
+        enc = self.tokenizer(prompts, add_special_tokens=False, padding=True, return_tensors="pt")
+        n = len(prompts)
+        lengths = enc.attention_mask.sum(dim=1)
+        attention = torch.cat([torch.ones(n, self.prefix_len, dtype=enc.attention_mask.dtype),
+                               enc.attention_mask], dim=1)
+        with torch.inference_mode():
+            out = self.model(input_ids=enc.input_ids, attention_mask=attention,
+                             past_key_values=self._expanded_prefix(n), use_cache=True)
+            last = out.logits[torch.arange(n), lengths - 1]          # last real token per row
+            probs = torch.softmax(last[:, self.answer_ids], dim=-1)
+        return probs.numpy()
+
+
+def _legacy_cache(past):
+    if hasattr(past, "to_legacy_cache"):
+        return past.to_legacy_cache()
+    return past
+
+
+# === SERVICE ===
+
+class ConvictionService:
+    def __init__(self, model, batch_max=BATCH_MAX, batch_window=BATCH_WINDOW, cache_items=CACHE_ITEMS):
+        self.model = model
+        self.batch_max = batch_max
+        self.batch_window = batch_window
+        self.cache_items = cache_items
+        self.cache = OrderedDict()        # fingerprint -> probs
+        self.pending = {}                 # fingerprint -> future (coalesces identical in-flight states)
+        self.queue = asyncio.Queue()
+        self.lock = threading.Lock()      # one forward pass at a time
+
+        self.requests = 0
+        self.cache_hits = 0
+        self.batches = 0
+        self.batched_prompts = 0
+        self.batch_latency = deque(maxlen=LATENCY_WINDOW)
+
+    async def score(self, state):
+        return (await self.score_many([state]))[0]
+
+    async def score_many(self, states):
+        """Conviction per state, in order. Cached states resolve immediately."""
+        loop = asyncio.get_running_loop()
+        fps = [fingerprint(s) for s in states]
+        futures = []
+        for fp in fps:
+            self.requests += 1
+            STATES.inc()
+            probs = self.cache.get(fp)
+            if probs is not None:
+                self.cache.move_to_end(fp)
+                self.cache_hits += 1
+                CACHE_HITS.inc()
+                fut = loop.create_future()
+                fut.set_result((probs, True))
+            elif fp in self.pending:
+                fut = self.pending[fp]
+            else:
+                fut = loop.create_future()
+                self.pending[fp] = fut
+                self.queue.put_nowait(fp)
+            futures.append(fut)
+        results = await asyncio.gather(*futures)
+        out = []
+        for probs, cached in results:
+            best = int(np.argmax(probs))
+            out.append(Conviction(ANSWERS[best], float(probs[best]), tuple(float(p) for p in probs), cached))
+        return out
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_max:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            prompts = [render_prompt(fp) for fp in batch]
+            started = time.perf_counter()
+            try:
+                probs = await asyncio.to_thread(self._score_locked, prompts)
+            except Exception as e:
+                for fp in batch:
+                    fut = self.pending.pop(fp, None)
+                    if fut is not None and not fut.done():
+                        fut.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - started
+            self.batch_latency.append(elapsed)
+            BATCH_SECONDS.observe(elapsed)
+            self.batches += 1
+            self.batched_prompts += len(batch)
+            BATCHED_PROMPTS.inc(len(batch))
+
+            for fp, p in zip(batch, probs):
+                self.cache[fp] = p
+                if len(self.cache) > self.cache_items:
+                    self.cache.popitem(last=False)
+                fut = self.pending.pop(fp, None)
+                if fut is not None and not fut.done():
+                    fut.set_result((p, False))
+
+    def _score_locked(self, prompts):
+        with self.lock:
+            return self.model.score(prompts)
+
+    def stats(self):
+        lat = np.array(self.batch_latency) * 1000 if self.batch_latency else np.zeros(1)
+        return {
+            "requests": self.requests,
+            "cache_hit_rate": round(self.cache_hits / self.requests, 4) if self.requests else 0.0,
+            "cache_size": len(self.cache),
+            "batches": self.batches,
+            "mean_batch": round(self.batched_prompts / self.batches, 2) if self.batches else 0.0,
+            "batch_ms_p50": round(float(np.percentile(lat, 50)), 2),
+            "batch_ms_p99": round(float(np.percentile(lat, 99)), 2),
+        }
+
+
+# === HTTP ===
+
+def create_app(service):
+    from aiohttp import web
+
+    async def handle_score(request):
+        started = time.perf_counter()
+        body = await request.json()
+        results = await service.score_many(body["states"])
+        REQUEST_SECONDS.observe(time.perf_counter() - started)
+        return web.json_response({"results": [r._asdict() for r in results]})
+
+    async def handle_stats(request):
+        return web.json_response(service.stats())
+
+    async def handle_metrics(request):
+        return web.Response(text=metrics.REGISTRY.render(), content_type="text/plain")
+
+    app = web.Application(client_max_size=8 * 1024 * 1024)
+    app.router.add_post("/score", handle_score)
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_get("/metrics", handle_metrics)
+    metrics.gauge("conviction_queue_depth", "States waiting for a batch").set_function(service.queue.qsize)
+
+    async def lifecycle(app):
+        task = asyncio.create_task(service.run())
+        yield
+        task.cancel()
+
+    app.cleanup_ctx.append(lifecycle)
+    return app
+
+
+if __name__ == "__main__":
+    from aiohttp import web
+
+    print(f"[{datetime.utcnow()}] Loading {MODEL_PATH} (int8, {THREADS} threads)")
+    service = ConvictionService(ConvictionModel(base_model="--base-model" in sys.argv[1:]))
+    print(f"[{datetime.utcnow()}] Conviction server on http://{HOST}:{PORT}/score")
+    web.run_app(create_app(service), host=HOST, port=PORT, access_log=None, print=None)
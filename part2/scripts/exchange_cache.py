@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+exchange_cache.py
+
+Disk-cached trading universe for the Agent B data feed.
+
+The feed used to build a python-binance Client and download the full
+futures exchange info before the first stream could open. The universe
+now comes from a JSON snapshot at CACHE_PATH (every futures contract
+with its type, quote asset, status and 24h quote volume, stored as
+columns):
+
+  * snapshot younger than CACHE_TTL: used as is;
+  * stale snapshot: used as is, and refresh_loop() replaces it in the
+    background, so the next restart starts from the new one;
+  * no snapshot (first run): fetched once over REST, about one second.
+
+select_universe() keeps perpetual, trading, USDT-quoted contracts with
+at least symbols.filters.min_volume_usd of 24h quote volume that are not
+excluded, as one vectorized numpy pass over the snapshot columns.
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+import aiohttp
+import numpy as np
+import yaml
+
+CACHE_PATH = "/home/tito/crypto_algotrader_part1/part2/cache/exchange_universe.json"
+KEYS_PATH = "/home/tito/crypto_algotrader_part1/part2/config/binance_keys.yaml"
+AGENT_CONFIG_PATH = "/home/tito/crypto_algotrader_part1/part2/config/agent_b_config.yaml"
+
+FAPI_BASE = "https://fapi.binance.com"
+EXCHANGE_INFO_PATH = "/fapi/v1/exchangeInfo"
+TICKER_24H_PATH = "/fapi/v1/ticker/24hr"
+REQUEST_TIMEOUT = 15
+CACHE_TTL = 6 * 3600          # seconds before a snapshot is refreshed
+RETRY_DELAY = 300             # seconds between refresh attempts after a failure
+
+COLUMNS = ("symbol", "contract_type", "quote_asset", "status", "quote_volume")
+
+
+# === SNAPSHOT ===
+
+async def fetch_snapshot(session, rest_base=FAPI_BASE):
+    """Exchange info and 24h tickers, fetched concurrently, as one columnar snapshot."""
+    async def get(path):
+        async with session.get(rest_base + path) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    info, tickers = await asyncio.gather(get(EXCHANGE_INFO_PATH), get(TICKER_24H_PATH))
+    volume = {t["symbol"]: float(t.get("quoteVolume") or 0) for t in tickers}
+    contracts = info["symbols"]
+    return {
+        "fetched_at": time.time(),
+        "symbol": [s["symbol"] for s in contracts],
+        "contract_type": [s.get("contractType", "") for s in contracts],
+        "quote_asset": [s.get("quoteAsset", "") for s in contracts],
+        "status": [s.get("status", "") for s in contracts],
+        "quote_volume": [volume.get(s["symbol"], 0.0) for s in contracts],
+    }
+
+
+def load_snapshot(path=CACHE_PATH):
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not all(c in snapshot for c in COLUMNS):
+        return None
+    return snapshot
+
+
+def save_snapshot(snapshot, path=CACHE_PATH):
+    # Written to a temp file and renamed, so a crash never leaves half a snapshot
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def snapshot_age(snapshot, now=None):
+    now = time.time() if now is None else now
+    return now - snapshot.get("fetched_at", 0)
+
+
+async def refresh(path=CACHE_PATH, session=None, rest_base=FAPI_BASE):
+    """Fetch a new snapshot and write it to disk; returns it."""
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+    try:
+        snapshot = await fetch_snapshot(session, rest_base)
+    finally:
+        if own_session:
+            await session.close()
+    save_snapshot(snapshot, path)
+    return snapshot
+
+
+# === UNIVERSE ===
+
+def normalize_symbol(symbol):
+    """'BTC/USDT' (agent_b_config style) -> 'BTCUSDT' (exchange style)."""
+    return symbol.replace("/", "").replace("-", "").upper()
+
+
+def load_filters(keys_path=KEYS_PATH, agent_config_path=AGENT_CONFIG_PATH):
+    """(min_volume_usd, excluded symbols) from both config files; missing files are skipped."""
+    excluded = set()
+    min_volume = 0.0
+    for path in (keys_path, agent_config_path):
+        try:
+            with open(path) as f:
+                cfg = yaml.safe_load(f) or {}
+        except OSError:
+            continue
+        excluded.update((cfg.get("binance") or {}).get("symbols_excluded") or [])
+        symbols_cfg = cfg.get("symbols") or {}
+        excluded.update(symbols_cfg.get("exclude") or [])
+        min_volume = max(min_volume, float((symbols_cfg.get("filters") or {}).get("min_volume_usd") or 0))
+    return min_volume, {normalize_symbol(s) for s in excluded}
+
+
+def select_universe(snapshot, min_volume_usd=0.0, excluded=(), quote_asset="USDT"):
+    """Symbols passing every filter, highest 24h quote volume first."""
+    symbols = np.asarray(snapshot["symbol"], dtype=object)
+    if len(symbols) == 0:
+        return []
+    volume = np.asarray(snapshot["quote_volume"], dtype=np.float64)
+    mask = (
+        (np.asarray(snapshot["contract_type"], dtype=object) == "PERPETUAL")
+        & (np.asarray(snapshot["quote_asset"], dtype=object) == quote_asset)
+        & (np.asarray(snapshot["status"], dtype=object) == "TRADING")
+        & (volume >= min_volume_usd)
+        & ~np.isin(symbols, np.asarray(list(excluded), dtype=object))
+    )
+    picked = np.flatnonzero(mask)
+    picked = picked[np.argsort(-volume[picked], kind="stable")]
+    return symbols[picked].tolist()
+
+
+def get_universe(path=CACHE_PATH, ttl=CACHE_TTL, keys_path=KEYS_PATH,
+                 agent_config_path=AGENT_CONFIG_PATH):
+    """
+    (symbols, snapshot age in seconds, stale) from the cached snapshot.
+    Only a missing snapshot blocks on the network.
+    """
+    snapshot = load_snapshot(path)
+    if snapshot is None:
+        print(f"[{datetime.utcnow()}] No exchange snapshot at {path}, fetching it")
+        snapshot = asyncio.run(refresh(path))
+    min_volume, excluded = load_filters(keys_path, agent_config_path)
+    age = snapshot_age(snapshot)
+    return select_universe(snapshot, min_volume, excluded), age, age >= ttl
+
+
+async def refresh_loop(path=CACHE_PATH, ttl=CACHE_TTL, session=None, rest_base=FAPI_BASE,
+                       current=None):
+    """
+    Keep the snapshot on disk younger than `ttl`. The running feed keeps
+    its universe; a changed universe is logged and applies on the next start.
+    """
+    current = set(current or ())
+    while True:
+        snapshot = load_snapshot(path)
+        wait = ttl - snapshot_age(snapshot) if snapshot is not None else 0
+        if wait > 0:
+            await asyncio.sleep(wait)
+            continue
+        try:
+            snapshot = await refresh(path, session, rest_base)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[{datetime.utcnow()}] Exchange snapshot refresh failed: {e}")
+            await asyncio.sleep(RETRY_DELAY)
+            continue
+        if current:
+            min_volume, excluded = load_filters()
+            fresh = set(select_universe(snapshot, min_volume, excluded))
+            if fresh != current:
+                print(f"[{datetime.utcnow()}] Universe changed (+{len(fresh - current)} "
+                      f"-{len(current - fresh)} symbols); applies on next restart")
+        print(f"[{datetime.utcnow()}] Exchange snapshot refreshed ({len(snapshot['symbol'])} contracts)")
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    snapshot = asyncio.run(refresh())
+    min_volume, excluded = load_filters()
+    symbols = select_universe(snapshot, min_volume, excluded)
+    print(f"{len(snapshot['symbol'])} contracts, {len(symbols)} in universe "
+          f"(min 24h volume {min_volume:,.0f} USD, {len(excluded)} excluded), "
+          f"{time.perf_counter() - started:.2f}s")
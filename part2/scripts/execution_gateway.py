@@ -0,0 +1,610 @@
+#!/usr/bin/env python3
+"""
+execution_gateway.py
+
+Asyncio order gateway for Agent B, with one backend per trading mode:
+
+  live   ExecutionGateway: signed REST calls to Binance USDT-M futures
+         (fapi), the market the data feed trades
+  paper  PaperGateway: the same calls answered locally, with market
+         orders filled against the LiveBarCache after a configurable
+         latency
+
+Both expose place_order(), place_orders(), cancel_order(),
+cancel_orders(), cancel_all() and open_orders() and return fapi-shaped
+order dicts, so the strategy does not care which one it holds.
+create_gateway() picks the backend from agent_b_config.yaml.
+
+ExecutionGateway keeps the request path short:
+
+  * one aiohttp session with a keep-alive connection pool (no TCP/TLS
+    handshake per order) and the API key header set once;
+  * HMAC-SHA256 signing from a keyed hmac object built once and copied
+    per request, instead of re-deriving the key pads every time;
+  * RateLimiter reserves each request's cost against the exchange's
+    windows (request weight per minute, orders per 10 s and per minute)
+    before sending and corrects its counts from the X-MBX-USED-WEIGHT-1M
+    and X-MBX-ORDER-COUNT-* response headers. Requests that would
+    exceed a window wait for it to roll over rather than collect 429s
+    and, if ignored, a 418 IP ban. A 429/418 that still happens (other
+    clients on the IP) blocks the limiter for its Retry-After;
+  * batches where the API allows it: up to BATCH_ORDERS_MAX orders per
+    batchOrders call, up to BATCH_CANCEL_MAX ids per batch cancel, and
+    allOpenOrders to cancel a symbol in one call.
+
+bench_execution_gateway.py runs it against a local fake fapi server.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from urllib.parse import urlencode
+
+import aiohttp
+import yaml
+from yarl import URL
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics
+
+KEYS_PATH = "/home/tito/crypto_algotrader_part1/part2/config/binance_keys.yaml"
+CONFIG_PATH = "/home/tito/crypto_algotrader_part1/part2/config/agent_b_config.yaml"
+
+FAPI_BASE = "https://fapi.binance.com"
+RECV_WINDOW_MS = 5000
+REQUEST_TIMEOUT = 10           # seconds
+MAX_CONNECTIONS = 16           # keep-alive pool size
+KEEPALIVE_TIMEOUT = 60         # seconds an idle pooled connection is kept
+MAX_RETRIES = 2                # resends after a 429 or a clock-skew rejection
+MAX_QUEUE_WAIT = 15.0          # seconds a request may wait for rate limits before failing
+BATCH_ORDERS_MAX = 5           # orders per batchOrders call
+BATCH_CANCEL_MAX = 10          # ids per batch cancel
+
+# Rate-limit windows: (response header, window seconds, limit)
+FAPI_LIMITS = (
+    ("X-MBX-USED-WEIGHT-1M", 60, 2400),
+    ("X-MBX-ORDER-COUNT-10S", 10, 300),
+    ("X-MBX-ORDER-COUNT-1M", 60, 1200),
+)
+LIMIT_HEADROOM = 0.9           # fraction of each limit we allow ourselves
+
+# name -> (method, path, cost as (weight, orders per 10s, orders per 1m))
+ENDPOINTS = {
+    "time": ("GET", "/fapi/v1/time", (1, 0, 0)),
+    "order": ("POST", "/fapi/v1/order", (0, 1, 1)),
+    "batch_orders": ("POST", "/fapi/v1/batchOrders", (5, 5, 1)),
+    "query_order": ("GET", "/fapi/v1/order", (1, 0, 0)),
+    "cancel_order": ("DELETE", "/fapi/v1/order", (1, 0, 0)),
+    "cancel_batch": ("DELETE", "/fapi/v1/batchOrders", (1, 0, 0)),
+    "cancel_all": ("DELETE", "/fapi/v1/allOpenOrders", (1, 0, 0)),
+    "open_orders": ("GET", "/fapi/v1/openOrders", (1, 0, 0)),
+}
+OPEN_ORDERS_ALL_WEIGHT = 40    # openOrders without a symbol
+
+PAPER_LATENCY_MS = 120         # simulated order round trip in paper mode
+PAPER_JITTER_MS = 60           # plus uniform jitter up to this
+PAPER_SLIPPAGE_BPS = 2.0       # market orders fill this far past the last price
+
+REQUEST_SECONDS = {
+    (backend, name): metrics.histogram("gateway_request_seconds", "Order gateway call round trip",
+                                       endpoint=name, backend=backend)
+    for backend in ("live", "paper") for name in ENDPOINTS
+}
+LIMIT_WAITS = metrics.counter("gateway_rate_limit_waits_total", "Requests held back for a rate-limit window")
+RATE_LIMITED = metrics.counter("gateway_rate_limited_total", "429/418 responses received")
+ORDERS_SENT = metrics.counter("gateway_orders_total", "Orders submitted (batched orders count one each)")
+
+
+class ExchangeError(Exception):
+    """A rejected gateway call: HTTP status, exchange error code and message."""
+
+    def __init__(self, status, code, msg):
+        super().__init__(f"HTTP {status} code {code}: {msg}")
+        self.status = status
+        self.code = code
+        self.msg = msg
+
+
+class RateLimited(ExchangeError):
+    """The rate limits would hold the call longer than the caller allows."""
+
+
+# === RATE LIMITS ===
+
+class _Window:
+    __slots__ = ("header", "seconds", "budget", "used", "window")
+
+    def __init__(self, header, seconds, limit, headroom):
+        self.header = header
+        self.seconds = seconds
+        self.budget = int(limit * headroom)
+        self.used = 0
+        self.window = int(time.time() // seconds)
+
+    def _roll(self, now):
+        window = int(now // self.seconds)
+        if window != self.window:
+            self.window = window
+            self.used = 0
+
+    def delay(self, cost, now):
+        """Seconds until cost fits in this window (0 if it fits now)."""
+        self._roll(now)
+        if self.used + cost <= self.budget:
+            return 0.0
+        return self.seconds - now % self.seconds + 0.05
+
+
+class RateLimiter:
+    """
+    Fixed windows aligned to the clock, as the exchange counts them.
+    acquire() reserves a request's cost in every window up front, so
+    concurrent callers cannot overshoot between sending and reading the
+    headers; observe() raises the counts to what the exchange reports,
+    which includes other clients on the same IP/account.
+    """
+
+    def __init__(self, limits=FAPI_LIMITS, headroom=LIMIT_HEADROOM):
+        self.windows = [_Window(header, seconds, limit, headroom) for header, seconds, limit in limits]
+        self.blocked_until = 0.0
+        self.waits = 0
+        self.waited = 0.0
+        self._lock = asyncio.Lock()
+
+    def delay(self, cost, now=None):
+        now = time.time() if now is None else now
+        wait = max(0.0, self.blocked_until - now)
+        for window, amount in zip(self.windows, cost):
+            if amount:
+                wait = max(wait, window.delay(amount, now))
+        return wait
+
+    async def acquire(self, cost, max_wait=None):
+        async with self._lock:
+            while True:
+                now = time.time()
+                wait = self.delay(cost, now)
+                if wait <= 0:
+                    for window, amount in zip(self.windows, cost):
+                        window.used += amount
+                    return
+                if max_wait is not None and wait > max_wait:
+                    raise RateLimited(429, None, f"rate limits need {wait:.1f}s, more than {max_wait}s allowed")
+                self.waits += 1
+                self.waited += wait
+                LIMIT_WAITS.inc()
+                await asyncio.sleep(wait)
+
+    def observe(self, headers):
+        now = time.time()
+        for window in self.windows:
+            used = headers.get(window.header)
+            if used is not None:
+                window._roll(now)
+                window.used = max(window.used, int(used))
+
+    def back_off(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+    def stats(self):
+        stats = {w.header: w.used for w in self.windows}
+        stats.update(waits=self.waits, waited=round(self.waited, 2))
+        return stats
+
+
+# === ORDERS ===
+
+def _num(value):
+    """Plain decimal string for a price/quantity (no exponent, shortest repr)."""
+    if isinstance(value, str):
+        return value
+    return format(Decimal(repr(value)), "f")
+
+
+def new_client_order_id():
+    return "agb_" + uuid.uuid4().hex[:28]
+
+
+def order_params(symbol, side, quantity, order_type="MARKET", price=None, reduce_only=False,
+                 time_in_force=None, client_order_id=None, **extra):
+    """
+    fapi parameters of one order, as strings. Every order gets a
+    newClientOrderId, so a request retried after a 429 cannot fill twice
+    and an order whose response was lost can still be looked up.
+    """
+    params = {
+        "symbol": symbol,
+        "side": side.upper(),
+        "type": order_type.upper(),
+        "quantity": _num(quantity),
+        "newClientOrderId": client_order_id or new_client_order_id(),
+    }
+    if price is not None:
+        params["price"] = _num(price)
+        params["timeInForce"] = time_in_force or "GTC"
+    if reduce_only:
+        params["reduceOnly"] = "true"
+    for key, value in extra.items():
+        params[key] = value if isinstance(value, str) else _num(value)
+    return params
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class ExecutionGateway:
+    def __init__(self, api_key, api_secret, base_url=FAPI_BASE, recv_window=RECV_WINDOW_MS,
+                 limiter=None, max_connections=MAX_CONNECTIONS, max_wait=MAX_QUEUE_WAIT):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.recv_window = recv_window
+        self.limiter = limiter or RateLimiter()
+        self.max_connections = max_connections
+        self.max_wait = max_wait
+        self.time_offset = 0          # exchange clock minus ours, ms
+        self.session = None
+        self._mac = hmac.new(api_secret.encode(), digestmod=hashlib.sha256)
+
+        self.requests = 0
+        self.rate_limited = 0
+
+    async def start(self):
+        """Open the pooled session and sync the clock (which also warms one connection)."""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=KEEPALIVE_TIMEOUT,
+                                             ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"X-MBX-APIKEY": self.api_key},
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            )
+            await self.sync_time()
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def sign(self, query):
+        mac = self._mac.copy()
+        mac.update(query.encode())
+        return mac.hexdigest()
+
+    def _query(self, params, signed):
+        items = [(k, v) for k, v in params.items() if v is not None]
+        if signed:
+            items.append(("recvWindow", self.recv_window))
+            items.append(("timestamp", int(time.time() * 1000) + self.time_offset))
+        query = urlencode(items)
+        if signed:
+            query += "&signature=" + self.sign(query)
+        return query
+
+    async def sync_time(self):
+        started = time.time()
+        body = await self._request("time", {}, signed=False)
+        local = (started + time.time()) / 2 * 1000
+        self.time_offset = int(body["serverTime"] - local)
+        return self.time_offset
+
+    async def _request(self, name, params, signed=True, weight=None):
+        method, path, cost = ENDPOINTS[name]
+        if weight is not None:
+            cost = (weight,) + cost[1:]
+        histogram = REQUEST_SECONDS["live", name]
+        for attempt in range(MAX_RETRIES + 1):
+            await self.limiter.acquire(cost, self.max_wait)
+            # The query is signed as sent; encoded=True stops aiohttp re-encoding it
+            url = URL(f"{self.base_url}{path}?{self._query(params, signed)}", encoded=True)
+            started = time.perf_counter()
+            async with self.session.request(method, url) as resp:
+                self.limiter.observe(resp.headers)
+                try:
+                    body = await resp.json(content_type=None)
+                except ValueError:
+                    # Proxies and an overloaded exchange answer with HTML error pages
+                    text = await resp.text(errors="replace")
+                    body = {"code": None, "msg": f"non-JSON response: {text[:200]}"}
+                    if resp.status < 400:
+                        raise ExchangeError(resp.status, None, body["msg"])
+            histogram.observe(time.perf_counter() - started)
+            self.requests += 1
+
+            if resp.status in (429, 418):
+                retry_after = float(resp.headers.get("Retry-After") or 60)
+                self.limiter.back_off(retry_after)
+                self.rate_limited += 1
+                RATE_LIMITED.inc()
+                print(f"[{datetime.utcnow()}] ⚠️ {resp.status} on {path}, backing off {retry_after:.0f}s")
+                if resp.status == 418 or attempt == MAX_RETRIES:
+                    raise ExchangeError(resp.status, (body or {}).get("code"), (body or {}).get("msg"))
+                continue
+            if resp.status >= 400:
+                code, msg = (body or {}).get("code"), (body or {}).get("msg")
+                if code == -1021 and attempt < MAX_RETRIES:
+                    # Timestamp outside recvWindow: our clock drifted
+                    await self.sync_time()
+                    continue
+                raise ExchangeError(resp.status, code, msg)
+            return body
+
+    # --- orders ---
+
+    async def place_order(self, symbol, side, quantity, order_type="MARKET", price=None, **kwargs):
+        ORDERS_SENT.inc()
+        return await self._request("order", order_params(symbol, side, quantity, order_type, price, **kwargs))
+
+    async def place_orders(self, orders):
+        """
+        Submit order_params() dicts in batchOrders calls of up to
+        BATCH_ORDERS_MAX, sent concurrently. Returns one entry per order,
+        in order: the order, or {"code", "msg"} if that order was rejected.
+        Every order of a call that failed as a whole (rate limit, network,
+        5xx) gets {"code", "msg", "newClientOrderId"}, so the caller can
+        reconcile it; the other calls' results are kept.
+        """
+        orders = list(orders)
+        ORDERS_SENT.inc(len(orders))
+        chunks = list(_chunks(orders, BATCH_ORDERS_MAX))
+
+        async def batch(chunk):
+            if len(chunk) == 1:
+                return [await self._request("order", chunk[0])]
+            payload = json.dumps(chunk, separators=(",", ":"))
+            return await self._request("batch_orders", {"batchOrders": payload})
+
+        results = await asyncio.gather(*(batch(c) for c in chunks), return_exceptions=True)
+        placed = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, Exception):
+                    raise result   # cancelled
+                code, msg = (result.code, result.msg) if isinstance(result, ExchangeError) else (None, repr(result))
+                result = [{"code": code, "msg": msg, "newClientOrderId": o.get("newClientOrderId")} for o in chunk]
+            placed.extend(result)
+        return placed
+
+    async def query_order(self, symbol, order_id=None, client_order_id=None):
+        return await self._request("query_order", {"symbol": symbol, "orderId": order_id,
+                                                   "origClientOrderId": client_order_id})
+
+    async def cancel_order(self, symbol, order_id=None, client_order_id=None):
+        return await self._request("cancel_order", {"symbol": symbol, "orderId": order_id,
+                                                    "origClientOrderId": client_order_id})
+
+    async def cancel_orders(self, symbol, order_ids=(), client_order_ids=()):
+        """Cancel by order id or client order id, BATCH_CANCEL_MAX per call; results as for place_orders."""
+        calls = [{"symbol": symbol, "orderIdList": json.dumps([int(i) for i in chunk], separators=(",", ":"))}
+                 for chunk in _chunks(list(order_ids), BATCH_CANCEL_MAX)]
+        calls += [{"symbol": symbol, "origClientOrderIdList": json.dumps(chunk, separators=(",", ":"))}
+                  for chunk in _chunks(list(client_order_ids), BATCH_CANCEL_MAX)]
+        results = await asyncio.gather(*(self._request("cancel_batch", p) for p in calls))
+        return [r for chunk in results for r in chunk]
+
+    async def cancel_all(self, symbol):
+        return await self._request("cancel_all", {"symbol": symbol})
+
+    async def open_orders(self, symbol=None):
+        return await self._request("open_orders", {"symbol": symbol},
+                                   weight=None if symbol else OPEN_ORDERS_ALL_WEIGHT)
+
+    def stats(self):
+        stats = {"requests": self.requests, "rate_limited": self.rate_limited, "time_offset_ms": self.time_offset}
+        stats.update(self.limiter.stats())
+        return stats
+
+
+# === PAPER ===
+
+class PaperGateway:
+    """
+    ExecutionGateway's interface answered in process. Each call waits
+    latency_ms plus up to jitter_ms (one wait per batch, as one request
+    would), then:
+
+      * MARKET orders fill at the LiveBarCache price at that moment,
+        slippage_bps worse;
+      * LIMIT orders that are marketable fill at the last price, the
+        rest stay open until on_bar() sees the price trade through them.
+    """
+
+    def __init__(self, bar_cache, latency_ms=PAPER_LATENCY_MS, jitter_ms=PAPER_JITTER_MS,
+                 slippage_bps=PAPER_SLIPPAGE_BPS, seed=None):
+        self.bar_cache = bar_cache
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.slippage = slippage_bps / 10000.0
+        self.orders = {}              # orderId -> order dict (open orders only)
+        self._ids = itertools.count(1)
+        self._rng = random.Random(seed)
+
+        self.requests = 0
+        self.fills = 0
+
+    async def start(self):
+        return self
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def _delay(self, name):
+        self.requests += 1
+        seconds = (self.latency_ms + self._rng.uniform(0, self.jitter_ms)) / 1000
+        await asyncio.sleep(seconds)
+        REQUEST_SECONDS["paper", name].observe(seconds)
+
+    def _order(self, params):
+        now = int(time.time() * 1000)
+        order_type = params["type"]
+        if order_type not in ("MARKET", "LIMIT"):
+            raise ExchangeError(400, -1116, f"Paper mode does not support {order_type} orders")
+        last = self.bar_cache.latest_price(params["symbol"])
+        if last is None:
+            raise ExchangeError(400, -1121, f"No live price for {params['symbol']}")
+        buy = params["side"] == "BUY"
+        order = {
+            "orderId": next(self._ids),
+            "clientOrderId": params.get("newClientOrderId") or new_client_order_id(),
+            "symbol": params["symbol"],
+            "side": params["side"],
+            "type": order_type,
+            "status": "NEW",
+            "price": params.get("price", "0"),
+            "avgPrice": "0",
+            "origQty": params["quantity"],
+            "executedQty": "0",
+            "reduceOnly": params.get("reduceOnly") == "true",
+            "updateTime": now,
+        }
+        if order_type == "MARKET":
+            self._fill(order, last * (1 + self.slippage if buy else 1 - self.slippage), now)
+        else:
+            limit = float(order["price"])
+            if (buy and last <= limit) or (not buy and last >= limit):
+                self._fill(order, last, now)
+            else:
+                self.orders[order["orderId"]] = order
+        return order
+
+    def _fill(self, order, price, now):
+        order.update(status="FILLED", avgPrice=_num(price), executedQty=order["origQty"], updateTime=now)
+        self.fills += 1
+
+    def on_bar(self, bar):
+        """Fill open LIMIT orders the bar traded through (at their limit); returns the filled orders."""
+        filled = []
+        for order_id, order in list(self.orders.items()):
+            if order["symbol"] != bar.symbol:
+                continue
+            limit = float(order["price"])
+            if (order["side"] == "BUY" and bar.low <= limit) or (order["side"] == "SELL" and bar.high >= limit):
+                del self.orders[order_id]
+                self._fill(order, limit, bar.event_time or bar.timestamp)
+                filled.append(order)
+        return filled
+
+    async def place_order(self, symbol, side, quantity, order_type="MARKET", price=None, **kwargs):
+        ORDERS_SENT.inc()
+        await self._delay("order")
+        return self._order(order_params(symbol, side, quantity, order_type, price, **kwargs))
+
+    async def place_orders(self, orders):
+        orders = list(orders)
+        ORDERS_SENT.inc(len(orders))
+        await self._delay("batch_orders")
+        results = []
+        for params in orders:
+            try:
+                results.append(self._order(params))
+            except ExchangeError as e:
+                results.append({"code": e.code, "msg": e.msg})
+        return results
+
+    def _find(self, symbol, order_id=None, client_order_id=None):
+        for order in self.orders.values():
+            if order["symbol"] == symbol and (order["orderId"] == order_id
+                                              or (client_order_id and order["clientOrderId"] == client_order_id)):
+                return order
+        return None
+
+    def _cancel(self, symbol, order_id=None, client_order_id=None):
+        order = self._find(symbol, order_id, client_order_id)
+        if order is None:
+            raise ExchangeError(400, -2011, "Unknown order sent.")
+        del self.orders[order["orderId"]]
+        order.update(status="CANCELED", updateTime=int(time.time() * 1000))
+        return order
+
+    async def query_order(self, symbol, order_id=None, client_order_id=None):
+        await self._delay("query_order")
+        order = self._find(symbol, order_id, client_order_id)
+        if order is None:
+            raise ExchangeError(400, -2013, "Order does not exist.")
+        return order
+
+    async def cancel_order(self, symbol, order_id=None, client_order_id=None):
+        await self._delay("cancel_order")
+        return self._cancel(symbol, order_id, client_order_id)
+
+    async def cancel_orders(self, symbol, order_ids=(), client_order_ids=()):
+        await self._delay("cancel_batch")
+        results = []
+        for kwargs in [{"order_id": int(i)} for i in order_ids] + [{"client_order_id": c} for c in client_order_ids]:
+            try:
+                results.append(self._cancel(symbol, **kwargs))
+            except ExchangeError as e:
+                results.append({"code": e.code, "msg": e.msg})
+        return results
+
+    async def cancel_all(self, symbol):
+        await self._delay("cancel_all")
+        for order in [o for o in self.orders.values() if o["symbol"] == symbol]:
+            self._cancel(symbol, order["orderId"])
+        return {"code": 200, "msg": "The operation of cancel all open order is done."}
+
+    async def open_orders(self, symbol=None):
+        await self._delay("open_orders")
+        return [o for o in self.orders.values() if symbol is None or o["symbol"] == symbol]
+
+    def stats(self):
+        return {"requests": self.requests, "fills": self.fills, "open_orders": len(self.orders)}
+
+
+# === SETUP ===
+
+def load_settings(path=CONFIG_PATH):
+    """mode and the execution section of agent_b_config.yaml, with defaults."""
+    try:
+        with open(path) as f:
+            cfg = yaml.safe_load(f) or {}
+    except OSError:
+        cfg = {}
+    execution = cfg.get("execution") or {}
+    return {
+        "mode": cfg.get("mode", "paper"),
+        "paper_latency_ms": float(execution.get("paper_latency_ms", PAPER_LATENCY_MS)),
+        "paper_jitter_ms": float(execution.get("paper_jitter_ms", PAPER_JITTER_MS)),
+        "paper_slippage_bps": float(execution.get("paper_slippage_bps", PAPER_SLIPPAGE_BPS)),
+        "recv_window_ms": int(execution.get("recv_window_ms", RECV_WINDOW_MS)),
+        "max_queue_wait": float(execution.get("max_queue_wait_seconds", MAX_QUEUE_WAIT)),
+    }
+
+
+def create_gateway(bar_cache=None, mode=None, config_path=CONFIG_PATH, keys_path=KEYS_PATH):
+    """The gateway for the configured mode (not started; use `async with` or start())."""
+    settings = load_settings(config_path)
+    mode = mode or settings["mode"]
+    if mode == "paper":
+        if bar_cache is None:
+            raise ValueError("Paper mode fills against the live bar cache; pass bar_cache")
+        return PaperGateway(bar_cache, settings["paper_latency_ms"], settings["paper_jitter_ms"],
+                            settings["paper_slippage_bps"])
+    if mode == "live":
+        with open(keys_path) as f:
+            keys = (yaml.safe_load(f) or {}).get("binance") or {}
+        return ExecutionGateway(keys["api_key"], keys["api_secret"], recv_window=settings["recv_window_ms"],
+                                max_wait=settings["max_queue_wait"])
+    raise ValueError(f"No execution gateway for mode {mode!r}")
@@ -0,0 +1,271 @@
+"""
+indicator_engine.py
+
+Incremental indicators for the whole symbol universe at once.
+
+Every indicator in agent_b_config.yaml keeps running state (Wilder/RMA
+averages, EMA accumulators, rolling sums, session VWAP sums) in NumPy
+arrays of shape (n_symbols,). One bar-close tick for the universe is a
+fixed handful of vectorized operations, independent of history length.
+
+Seeding is this engine's own convention (warm-up values can differ
+from other libraries, e.g. pandas_ta's adjust=True RMA; they converge
+once the early observations have decayed):
+  * EMA is seeded with the SMA of the first `length` values.
+  * RMA (RSI, ADX) is a recursive Wilder average (alpha=1/length) that
+    starts from the first observation and is reported once `length`
+    observations have been seen.
+  * Bollinger uses the population standard deviation (ddof=0).
+  * VWAP is anchored to the UTC day.
+"""
+
+import numpy as np
+
+DAY_MS = 86400000
+RESYNC_EVERY = 1000  # ticks between exact recomputations of the Bollinger sums
+
+
+class _EMA:
+    """SMA-seeded EMA over (n,) arrays."""
+
+    def __init__(self, n, length):
+        self.length = length
+        self.alpha = 2.0 / (length + 1)
+        self.count = np.zeros(n, dtype=np.int64)
+        self.seed_sum = np.zeros(n)
+        self.value = np.full(n, np.nan)
+
+    def update(self, x, mask):
+        count = self.count + mask
+        seed_sum = np.where(mask & (count <= self.length), self.seed_sum + x, self.seed_sum)
+        seeded = np.where(count == self.length, seed_sum / self.length, self.value)
+        stepped = self.value + self.alpha * (x - self.value)
+        self.value = np.where(mask & (count > self.length), stepped,
+                              np.where(mask, seeded, self.value))
+        self.count = count
+        self.seed_sum = seed_sum
+        return self.output()
+
+    def output(self):
+        return np.where(self.count >= self.length, self.value, np.nan)
+
+
+class _RMA:
+    """Wilder smoothing (ewm alpha=1/length, adjust=False) over (n,) arrays."""
+
+    def __init__(self, n, length):
+        self.length = length
+        self.alpha = 1.0 / length
+        self.count = np.zeros(n, dtype=np.int64)
+        self.value = np.full(n, np.nan)
+
+    def update(self, x, mask):
+        mask = mask & ~np.isnan(x)
+        first = mask & (self.count == 0)
+        stepped = self.value + self.alpha * (x - self.value)
+        self.value = np.where(first, x, np.where(mask, stepped, self.value))
+        self.count = self.count + mask
+        return self.output()
+
+    def output(self):
+        return np.where(self.count >= self.length, self.value, np.nan)
+
+
+class IndicatorEngine:
+    def __init__(self, symbols, rsi_length=14, macd_fast=12, macd_slow=26, macd_signal=9,
+                 adx_length=14, ema_short=20, ema_long=50, bb_period=20, bb_deviation=2.0,
+                 vwap_enabled=True):
+        self.symbols = list(symbols)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        n = len(self.symbols)
+        self.n = n
+        self.ticks = 0
+
+        # Previous bar, needed for diffs / true range
+        self.prev_close = np.full(n, np.nan)
+        self.prev_high = np.full(n, np.nan)
+        self.prev_low = np.full(n, np.nan)
+
+        # RSI
+        self.rsi_gain = _RMA(n, rsi_length)
+        self.rsi_loss = _RMA(n, rsi_length)
+
+        # MACD
+        self.macd_fast = _EMA(n, macd_fast)
+        self.macd_slow = _EMA(n, macd_slow)
+        self.macd_signal = _EMA(n, macd_signal)
+
+        # ADX
+        self.atr = _RMA(n, adx_length)
+        self.dm_plus = _RMA(n, adx_length)
+        self.dm_minus = _RMA(n, adx_length)
+        self.adx = _RMA(n, adx_length)
+
+        # EMA trend pair
+        self.ema_short = _EMA(n, ema_short)
+        self.ema_long = _EMA(n, ema_long)
+
+        # Bollinger rolling window + running sums
+        self.bb_period = bb_period
+        self.bb_deviation = bb_deviation
+        self.bb_window = np.zeros((n, bb_period))
+        self.bb_count = np.zeros(n, dtype=np.int64)
+        self.bb_sum = np.zeros(n)
+        self.bb_sumsq = np.zeros(n)
+
+        # Session (UTC day) VWAP
+        self.vwap_enabled = vwap_enabled
+        self.vwap_day = np.full(n, -1, dtype=np.int64)
+        self.vwap_pv = np.zeros(n)
+        self.vwap_v = np.zeros(n)
+
+        self.values = {}
+
+    @classmethod
+    def from_config(cls, symbols, cfg):
+        """Build from the `indicators` section of agent_b_config.yaml."""
+        ind = cfg.get("indicators", {})
+        return cls(
+            symbols,
+            ema_short=ind.get("ema", {}).get("short", 20),
+            ema_long=ind.get("ema", {}).get("long", 50),
+            bb_period=ind.get("bollinger", {}).get("period", 20),
+            bb_deviation=ind.get("bollinger", {}).get("deviation", 2),
+            vwap_enabled=ind.get("vwap", {}).get("enabled", True),
+        )
+
+    def update(self, timestamp, high, low, close, volume):
+        """
+        Apply one closed bar per symbol. All arguments are (n,) arrays in
+        self.symbols order; a NaN close means "no bar for this symbol this
+        tick" and leaves its state untouched. Returns the latest values.
+        """
+        close = np.asarray(close, dtype=np.float64)
+        high = np.asarray(high, dtype=np.float64)
+        low = np.asarray(low, dtype=np.float64)
+        volume = np.asarray(volume, dtype=np.float64)
+        mask = ~np.isnan(close)
+        has_prev = mask & ~np.isnan(self.prev_close)
+        self.ticks += 1
+
+        # --- RSI ---
+        diff = np.where(has_prev, close - self.prev_close, np.nan)
+        gain = self.rsi_gain.update(np.maximum(diff, 0.0), has_prev)
+        loss = self.rsi_loss.update(np.maximum(-diff, 0.0), has_prev)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rsi = 100.0 * gain / (gain + loss)
+
+        # --- MACD ---
+        fast = self.macd_fast.update(close, mask)
+        slow = self.macd_slow.update(close, mask)
+        macd = fast - slow
+        signal = self.macd_signal.update(macd, mask & ~np.isnan(macd))
+
+        # --- ADX ---
+        tr = np.maximum.reduce([
+            high - low,
+            np.abs(high - self.prev_close),
+            np.abs(low - self.prev_close),
+        ])
+        up = high - self.prev_high
+        dn = self.prev_low - low
+        plus_dm = np.where((up > dn) & (up > 0), up, 0.0)
+        minus_dm = np.where((dn > up) & (dn > 0), dn, 0.0)
+        atr = self.atr.update(tr, has_prev)
+        plus = self.dm_plus.update(plus_dm, has_prev)
+        minus = self.dm_minus.update(minus_dm, has_prev)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            plus_di = 100.0 * plus / atr
+            minus_di = 100.0 * minus / atr
+            dx = 100.0 * np.abs(plus - minus) / (plus + minus)
+        adx = self.adx.update(dx, has_prev & ~np.isnan(dx))
+
+        # --- EMA pair ---
+        ema_short = self.ema_short.update(close, mask)
+        ema_long = self.ema_long.update(close, mask)
+
+        # --- Bollinger ---
+        bb_mid, bb_upper, bb_lower = self._update_bollinger(close, mask)
+
+        # --- VWAP ---
+        if self.vwap_enabled:
+            vwap = self._update_vwap(timestamp, high, low, close, volume, mask)
+        else:
+            vwap = np.full(self.n, np.nan)
+
+        self.prev_close = np.where(mask, close, self.prev_close)
+        self.prev_high = np.where(mask, high, self.prev_high)
+        self.prev_low = np.where(mask, low, self.prev_low)
+
+        self.values = {
+            "rsi": rsi,
+            "macd": macd,
+            "macd_signal": signal,
+            "macd_hist": macd - signal,
+            "adx": adx,
+            "plus_di": plus_di,
+            "minus_di": minus_di,
+            "ema_short": ema_short,
+            "ema_long": ema_long,
+            "bb_mid": bb_mid,
+            "bb_upper": bb_upper,
+            "bb_lower": bb_lower,
+            "vwap": vwap,
+        }
+        return self.values
+
+    def _update_bollinger(self, close, mask):
+        rows = np.nonzero(mask)[0]
+        slot = self.bb_count[rows] % self.bb_period
+        evicted = self.bb_window[rows, slot]
+        full = self.bb_count[rows] >= self.bb_period
+        x = close[rows]
+
+        self.bb_sum[rows] += x - np.where(full, evicted, 0.0)
+        self.bb_sumsq[rows] += x * x - np.where(full, evicted * evicted, 0.0)
+        self.bb_window[rows, slot] = x
+        self.bb_count[rows] += 1
+
+        if self.ticks % RESYNC_EVERY == 0:
+            # Running sums drift by a few ulps per tick; recompute exactly now and then
+            filled = np.minimum(self.bb_count, self.bb_period)
+            cols = np.arange(self.bb_period)
+            valid = cols[None, :] < filled[:, None]
+            self.bb_sum = np.where(valid, self.bb_window, 0.0).sum(axis=1)
+            self.bb_sumsq = np.where(valid, self.bb_window ** 2, 0.0).sum(axis=1)
+
+        ready = self.bb_count >= self.bb_period
+        mean = np.where(ready, self.bb_sum / self.bb_period, np.nan)
+        var = np.maximum(self.bb_sumsq / self.bb_period - mean * mean, 0.0)
+        std = np.sqrt(var)
+        return mean, mean + self.bb_deviation * std, mean - self.bb_deviation * std
+
+    def _update_vwap(self, timestamp, high, low, close, volume, mask):
+        day = np.asarray(timestamp, dtype=np.int64) // DAY_MS
+        new_session = mask & (day != self.vwap_day)
+        self.vwap_pv = np.where(new_session, 0.0, self.vwap_pv)
+        self.vwap_v = np.where(new_session, 0.0, self.vwap_v)
+        self.vwap_day = np.where(mask, day, self.vwap_day)
+
+        typical = (high + low + close) / 3.0
+        self.vwap_pv = np.where(mask, self.vwap_pv + typical * volume, self.vwap_pv)
+        self.vwap_v = np.where(mask, self.vwap_v + volume, self.vwap_v)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.vwap_v > 0, self.vwap_pv / self.vwap_v, np.nan)
+
+    # === CONVENIENCE ===
+
+    def warmup(self, bars):
+        """
+        Replay history, e.g. OHLCVRing.last_matrix(symbols, n): a dict of
+        (n_symbols, n_bars) arrays with NaN-padded gaps.
+        """
+        for t in range(bars["close"].shape[1]):
+            self.update(bars["timestamp"][:, t], bars["high"][:, t], bars["low"][:, t],
+                        bars["close"][:, t], bars["volume"][:, t])
+        return self.values
+
+    def latest(self, symbol):
+        """Latest indicator values for one symbol as a plain dict."""
+        i = self.index[symbol]
+        return {name: float(arr[i]) for name, arr in self.values.items()}
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+kline_archive.py
+
+Columnar archive of historical 1m klines, partitioned by symbol and month:
+
+    ARCHIVE_DIR/<SYMBOL>/<YYYY-MM>.npy
+
+Each partition is one float64 array of shape (6, n_bars): rows are
+timestamp, open, high, low, close, volume, so every column is contiguous
+on disk. Readers get memory-mapped views, which lets backtests, training
+data generation and warm-up scan history at disk speed instead of
+through per-row SQL.
+
+The bulk loader pulls klines for many symbols concurrently, paginating
+under the REST weight budget, and writes each partition in a single
+atomic replace. A month it has fetched end to end after the month closed
+is sealed with a <YYYY-MM>.complete marker next to the partition; only
+sealed months are skipped on later runs, so partitions started mid-month
+(a partial load, or compaction out of market_data_1m) get filled in.
+
+Usage: python kline_archive.py START END [SYMBOL ...]
+       (dates as YYYY-MM-DD; no symbols = every symbol in market_data_1m)
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import kline_backfill
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import storage
+
+ARCHIVE_DIR = "/home/tito/crypto_algotrader_part1/part2/archive/klines_1m"
+DB_PATH = storage.DB_PATH
+
+MINUTE_MS = 60000
+MAX_CONCURRENT_SYMBOLS = 8
+FIELDS = ("timestamp", "open", "high", "low", "close", "volume")
+
+
+# === PARTITION HELPERS ===
+
+def month_start_ms(year, month):
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def months_between(start_ms, end_ms):
+    """[(year, month, month_start_ms, month_end_ms)] overlapping [start_ms, end_ms)."""
+    dt = datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc)
+    year, month = dt.year, dt.month
+    out = []
+    while True:
+        m_start = month_start_ms(year, month)
+        if m_start >= end_ms:
+            break
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        m_end = month_start_ms(next_year, next_month)
+        out.append((year, month, m_start, m_end))
+        year, month = next_year, next_month
+    return out
+
+
+def partition_path(symbol, year, month, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, symbol, f"{year:04d}-{month:02d}.npy")
+
+
+def write_partition(path, rows):
+    """
+    Write (symbol, ts, o, h, l, c, v) rows as one columnar partition.
+    Rows already in the partition are kept unless the new rows replace
+    them; the file is swapped in atomically.
+    """
+    new = np.array([r[1:] for r in rows], dtype=np.float64).reshape(-1, 6).T
+    if os.path.exists(path):
+        old = np.load(path)
+        merged = np.concatenate((old, new), axis=1)
+        # Newest copy of a timestamp wins (stable sort keeps 'new' after 'old')
+        order = np.argsort(merged[0], kind="stable")
+        merged = merged[:, order]
+        keep = np.concatenate((merged[0, 1:] != merged[0, :-1], [True]))
+        new = merged[:, keep]
+    else:
+        new = new[:, np.argsort(new[0], kind="stable")]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp.npy"
+    np.save(tmp, np.ascontiguousarray(new))
+    os.replace(tmp, path)
+    return new.shape[1]
+
+
+def read_partition(path):
+    """Memory-mapped (6, n) array, or None if the partition does not exist."""
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+def read_range(symbol, start_ms, end_ms, archive_dir=ARCHIVE_DIR):
+    """
+    Bars for symbol in [start_ms, end_ms) as {field: array}. A range inside
+    one partition is returned as zero-copy memory-mapped views; a range
+    spanning months is concatenated (one copy).
+    """
+    pieces = []
+    for year, month, _, _ in months_between(start_ms, end_ms):
+        part = read_partition(partition_path(symbol, year, month, archive_dir))
+        if part is None or part.shape[1] == 0:
+            continue
+        lo = np.searchsorted(part[0], start_ms, side="left")
+        hi = np.searchsorted(part[0], end_ms, side="left")
+        if hi > lo:
+            pieces.append(part[:, lo:hi])
+
+    if not pieces:
+        block = np.empty((6, 0))
+    elif len(pieces) == 1:
+        block = pieces[0]
+    else:
+        block = np.concatenate(pieces, axis=1)
+    out = {field: block[i] for i, field in enumerate(FIELDS)}
+    out["timestamp"] = out["timestamp"].astype(np.int64)
+    return out
+
+
+def seal_path(path):
+    return path[:-len(".npy")] + ".complete"
+
+
+def partition_complete(path):
+    """True once the bulk loader has sealed the month (fetched it whole after it ended)."""
+    return os.path.exists(seal_path(path))
+
+
+def seal_partition(path):
+    with open(seal_path(path), "w"):
+        pass
+
+
+# === BULK LOADER ===
+
+async def load_symbol(session, limiter, symbol, start_ms, end_ms, archive_dir, rest_base):
+    written = 0
+    now_ms = int(time.time() * 1000)
+    for year, month, m_start, m_end in months_between(start_ms, end_ms):
+        path = partition_path(symbol, year, month, archive_dir)
+        if partition_complete(path):
+            continue
+        lo, hi = max(start_ms, m_start), min(end_ms, m_end, now_ms)
+        rows = await kline_backfill.fetch_klines(session, symbol, lo, hi, rest_base, limiter)
+        if rows:
+            written += await asyncio.to_thread(write_partition, path, rows)
+        # Seal only a closed month fetched from its first to its last minute
+        if lo == m_start and hi == m_end and os.path.exists(path):
+            seal_partition(path)
+    return written
+
+
+async def bulk_load(symbols, start_ms, end_ms, archive_dir=ARCHIVE_DIR,
+                    rest_base=kline_backfill.REST_BASE, concurrency=MAX_CONCURRENT_SYMBOLS):
+    limiter = kline_backfill.WeightLimiter()
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    async with kline_backfill.new_session() as session:
+        async def one(symbol):
+            async with semaphore:
+                try:
+                    n = await load_symbol(session, limiter, symbol, start_ms, end_ms,
+                                          archive_dir, rest_base)
+                    print(f"[{datetime.utcnow()}] {symbol}: {n} bars archived")
+                    return n
+                except Exception as e:
+                    print(f"[{datetime.utcnow()}] {symbol}: archive load failed: {e}")
+                    return 0
+
+        total = sum(await asyncio.gather(*(one(s) for s in symbols)))
+
+    print(f"Archived {total} bars for {len(symbols)} symbols in "
+          f"{time.perf_counter() - started:.1f}s (weight waits: {limiter.waits})")
+    return total
+
+
+def list_symbols(db_path=DB_PATH):
+    conn = storage.connect(db_path)
+    try:
+        return [r[0] for r in conn.execute("SELECT DISTINCT symbol FROM market_data_1m")]
+    finally:
+        conn.close()
+
+
+def parse_date_ms(value):
+    dt = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    start, end = parse_date_ms(sys.argv[1]), parse_date_ms(sys.argv[2])
+    symbols = sys.argv[3:] or list_symbols()
+    asyncio.run(bulk_load(symbols, start, end))
@@ -0,0 +1,244 @@
+"""
+kline_backfill.py
+
+Find missing minutes in market_data_1m and refill them from the Binance
+klines REST endpoint. Called by agent_B_data_feed every time a stream
+shard (re)connects, so disconnects never leave permanent holes; the
+refetched minutes also go to the shared ring and the HTF resampler.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+import aiohttp
+
+import resampler as htf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import storage
+
+REST_BASE = "https://api.binance.com"
+KLINES_PATH = "/api/v3/klines"
+KLINES_LIMIT = 1000            # max rows per request on this endpoint
+KLINES_WEIGHT = 2              # request weight of one klines call at that limit
+WEIGHT_LIMIT_1M = 6000         # exchange REQUEST_WEIGHT budget per minute
+WEIGHT_HEADROOM = 0.8          # fraction of the budget we allow ourselves
+MINUTE_MS = 60000
+
+LOOKBACK_MINUTES = 24 * 60     # how far back gaps are searched for
+MAX_CONCURRENT_REQUESTS = 5    # parallel REST calls during a backfill
+WRITE_CHUNK = 5000             # backfilled rows per market_data_1m transaction
+REQUEST_TIMEOUT = 10           # seconds
+
+INSERT_SQL = """
+    INSERT OR REPLACE INTO market_data_1m
+    (symbol, timestamp, open, high, low, close, volume)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class WeightLimiter:
+    """
+    Keeps REST usage under the per-minute weight budget. Requests reserve
+    their weight up front; the X-MBX-USED-WEIGHT-1M response header
+    (which also counts other clients on this IP) corrects our estimate.
+    """
+
+    def __init__(self, limit=WEIGHT_LIMIT_1M, headroom=WEIGHT_HEADROOM):
+        self.budget = limit * headroom
+        self.used = 0
+        self.minute = int(time.time() // 60)
+        self.waits = 0
+        self._lock = asyncio.Lock()
+
+    def _roll(self):
+        minute = int(time.time() // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.used = 0
+
+    async def acquire(self, weight):
+        async with self._lock:
+            while True:
+                self._roll()
+                if self.used + weight <= self.budget:
+                    self.used += weight
+                    return
+                self.waits += 1
+                await asyncio.sleep(60 - time.time() % 60 + 0.05)
+
+    def observe(self, headers):
+        used = headers.get("X-MBX-USED-WEIGHT-1M")
+        if used is not None:
+            self._roll()
+            self.used = max(self.used, int(used))
+
+
+def current_minute_ms(now=None):
+    now = time.time() if now is None else now
+    return int(now // 60) * MINUTE_MS
+
+
+def find_gaps(db_path, symbols, lookback_minutes=LOOKBACK_MINUTES, now=None):
+    """
+    Return [(symbol, start_ms, end_ms)] ranges of missing closed 1m bars
+    (end exclusive) within the lookback window, including the tail between
+    the newest stored bar and the minute that is still forming.
+    """
+    end = current_minute_ms(now)
+    start = end - lookback_minutes * MINUTE_MS
+    gaps = []
+
+    conn = storage.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        for symbol in symbols:
+            # Holes between consecutive stored bars
+            cursor.execute("""
+                SELECT timestamp, next_ts FROM (
+                    SELECT timestamp,
+                           LEAD(timestamp) OVER (ORDER BY timestamp) AS next_ts
+                    FROM market_data_1m
+                    WHERE symbol = ? AND timestamp >= ?
+                )
+                WHERE next_ts - timestamp > ?
+            """, (symbol, start, MINUTE_MS))
+            for ts, next_ts in cursor.fetchall():
+                gaps.append((symbol, ts + MINUTE_MS, next_ts))
+
+            cursor.execute(
+                "SELECT MIN(timestamp), MAX(timestamp) FROM market_data_1m "
+                "WHERE symbol = ? AND timestamp >= ?",
+                (symbol, start)
+            )
+            first, last = cursor.fetchone()
+            if last is None:
+                gaps.append((symbol, start, end))
+                continue
+            if first > start:
+                gaps.append((symbol, start, first))
+            if last + MINUTE_MS < end:
+                gaps.append((symbol, last + MINUTE_MS, end))
+    finally:
+        conn.close()
+    return gaps
+
+
+async def fetch_klines(session, symbol, start_ms, end_ms, rest_base=REST_BASE, limiter=None):
+    """
+    Page through the klines endpoint for [start_ms, end_ms) and return
+    (symbol, open_time, open, high, low, close, volume) rows for closed bars.
+    """
+    rows = []
+    cursor = start_ms
+    now_ms = int(time.time() * 1000)
+    while cursor < end_ms:
+        params = {
+            "symbol": symbol,
+            "interval": "1m",
+            "startTime": cursor,
+            "endTime": end_ms - 1,
+            "limit": KLINES_LIMIT,
+        }
+        if limiter is not None:
+            await limiter.acquire(KLINES_WEIGHT)
+        async with session.get(f"{rest_base}{KLINES_PATH}", params=params) as resp:
+            if limiter is not None:
+                limiter.observe(resp.headers)
+            if resp.status in (418, 429):
+                retry_after = int(resp.headers.get("Retry-After", "5"))
+                print(f"[{datetime.utcnow()}] Rate limited fetching {symbol}; sleeping {retry_after}s")
+                await asyncio.sleep(retry_after)
+                continue
+            resp.raise_for_status()
+            batch = await resp.json()
+        if not batch:
+            break
+        for k in batch:
+            open_time, close_time = int(k[0]), int(k[6])
+            if close_time >= now_ms:
+                continue  # still forming
+            rows.append((symbol, open_time, float(k[1]), float(k[2]),
+                         float(k[3]), float(k[4]), float(k[5])))
+        cursor = int(batch[-1][0]) + MINUTE_MS
+        if len(batch) < KLINES_LIMIT:
+            break
+    return rows
+
+
+def store_klines(db_path, rows, chunk=WRITE_CHUNK):
+    """
+    Write backfilled rows straight to market_data_1m, one transaction per
+    `chunk` rows so the candle writer can take the lock in between. They
+    do not go through CandleWriter: a cold-start backfill is far larger
+    than its drop_oldest backlog and would evict its own rows.
+    """
+    conn = storage.connect(db_path)
+    try:
+        for i in range(0, len(rows), chunk):
+            with conn:
+                conn.executemany(INSERT_SQL, rows[i:i + chunk])
+    finally:
+        conn.close()
+    return len(rows)
+
+
+async def repair_resampler(resampler, db_path, rows):
+    """Rebuild the HTF bars the backfilled rows fall in (StreamingResampler.repair)."""
+    if not rows:
+        return 0
+    if resampler.pending is not None:
+        resampler.repair(rows)   # only queued until catch_up is done
+        return 0
+    stored = await asyncio.to_thread(htf.read_1m, db_path, resampler.repair_spans(rows))
+    return len(resampler.repair(rows, stored))
+
+
+async def backfill_gaps(session, symbols, db_path, rest_base=REST_BASE,
+                        lookback_minutes=LOOKBACK_MINUTES, ring=None, limiter=None, resampler=None):
+    """
+    Detect gaps for these symbols, write the refetched bars to
+    market_data_1m and hand them to the shared ring and the resampler.
+    """
+    gaps = await asyncio.to_thread(find_gaps, db_path, symbols, lookback_minutes)
+    if not gaps:
+        return 0
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def fill(gap):
+        symbol, start_ms, end_ms = gap
+        async with semaphore:
+            try:
+                return await fetch_klines(session, symbol, start_ms, end_ms, rest_base, limiter)
+            except Exception as e:
+                print(f"[{datetime.utcnow()}] Backfill error for {symbol}: {e}")
+                return []
+
+    fetched = [row for rows in await asyncio.gather(*(fill(g) for g in gaps)) for row in rows]
+    fetched.sort(key=lambda r: (r[0], r[1]))
+    try:
+        await asyncio.to_thread(store_klines, db_path, fetched)
+    except Exception as e:
+        # The minutes stay missing and the next backfill finds them again
+        print(f"[{datetime.utcnow()}] Backfill DB Error: {e}")
+        return 0
+    if ring is not None:
+        for row in fetched:
+            ring.append(*row)
+    if resampler is not None:
+        try:
+            repaired = await repair_resampler(resampler, db_path, fetched)
+            if repaired:
+                print(f"[{datetime.utcnow()}] Backfill repaired {repaired} HTF bars")
+        except Exception as e:
+            print(f"[{datetime.utcnow()}] Backfill resampler repair error: {e!r}")
+    print(f"[{datetime.utcnow()}] Backfilled {len(fetched)} bars across {len(gaps)} gaps")
+    return len(fetched)
+
+
+def new_session():
+    return aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
@@ -0,0 +1,98 @@
+"""
+live_bar_cache.py
+
+In-memory cache of the currently forming 1m candle per symbol.
+
+Binance pushes the open kline many times a minute; those updates only
+land here. Consumers in the feed process get the newest bar or price
+with a dict lookup, and only closed candles are handed to the writer.
+Open bars can be snapshotted to market_data_live so another process (or
+the feed after a crash) can see the last known state.
+"""
+
+import os
+import sys
+import time
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import storage
+
+Bar = namedtuple("Bar", "symbol timestamp open high low close volume closed event_time")
+
+
+class LiveBarCache:
+    def __init__(self):
+        self.bars = {}       # symbol -> Bar (forming, or last closed)
+        self.updates = 0     # kline messages seen
+        self.closed = 0      # of which were final
+
+    def update(self, k, event_time=None):
+        """Apply one websocket kline payload ('k' object) and return the Bar."""
+        bar = Bar(
+            symbol=k['s'],
+            timestamp=int(k['t']),
+            open=float(k['o']),
+            high=float(k['h']),
+            low=float(k['l']),
+            close=float(k['c']),
+            volume=float(k['v']),
+            closed=bool(k['x']),
+            event_time=event_time,
+        )
+        self.bars[bar.symbol] = bar
+        self.updates += 1
+        if bar.closed:
+            self.closed += 1
+        return bar
+
+    def latest(self, symbol):
+        """Newest known bar for symbol (forming or just closed), or None."""
+        return self.bars.get(symbol)
+
+    def latest_price(self, symbol):
+        bar = self.bars.get(symbol)
+        return bar.close if bar is not None else None
+
+    def symbols(self):
+        return list(self.bars)
+
+    # === CRASH-RECOVERY SNAPSHOTS ===
+
+    def snapshot_rows(self):
+        """Rows for market_data_live: every bar that has not closed yet."""
+        now = int(time.time() * 1000)
+        return [
+            (b.symbol, b.timestamp, b.open, b.high, b.low, b.close, b.volume, now)
+            for b in self.bars.values() if not b.closed
+        ]
+
+    def restore(self, db_path):
+        """
+        Reload the last open-bar snapshot. Bars whose minute has already
+        ended are dropped, not persisted: their OHLCV stopped at the crash
+        and a row in market_data_1m would hide the minute from the gap
+        backfill, which refetches the real bar. Returns the number of bars
+        restored into the cache.
+        """
+        conn = storage.connect(db_path)
+        try:
+            rows = conn.execute(
+                "SELECT symbol, timestamp, open, high, low, close, volume FROM market_data_live"
+            ).fetchall()
+
+            current_minute = int(time.time() // 60) * 60000
+            stale = []
+            for symbol, ts, o, h, l, c, v in rows:
+                if ts < current_minute:
+                    stale.append((symbol, ts))
+                    continue
+                self.bars[symbol] = Bar(symbol, ts, o, h, l, c, v, False, None)
+
+            with conn:
+                conn.executemany(
+                    "DELETE FROM market_data_live WHERE symbol = ? AND timestamp = ?", stale
+                )
+        finally:
+            conn.close()
+        return len(self.bars)
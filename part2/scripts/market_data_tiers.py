@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+market_data_tiers.py
+
+Tiered storage for 1m klines, so market_data_1m stays a few days deep
+and live inserts and recent-window reads cost the same after a year as
+on day one.
+
+  hot      market_data_1m: the last market_data.hot_days days
+  rollups  market_data_5m / _1h / _1d, built from 1m bars once they can
+           no longer change (older than kline_backfill's gap lookback),
+           one read and one vectorized resample_arrays() pass per day.
+           5m rows are pruned after rollup_retention_days["5m"]; 1h and
+           1d are kept (0 = forever)
+  cold     1m bars older than the hot horizon, moved into the columnar
+           kline archive (kline_archive.py, one .npy per symbol and
+           month) and deleted from market_data_1m
+
+Each compaction pass works symbol by symbol and month by month with a
+commit per step, so the live candle writer never waits long on the
+write lock. Archive files are written before the rows are deleted; a
+pass interrupted in between just merges the same bars again next time.
+Deleted pages go to SQLite's freelist and are reused by new inserts, so
+the file stops growing without a VACUUM.
+
+query_bars() reads any range at any timeframe and stitches the tiers:
+1m comes from the archive for the part older than the hot table, then
+from market_data_1m; higher timeframes come from the largest rollup that
+divides them, with the part the rollups do not cover yet (the last day,
+or older than their retention) resampled from 1m.
+
+Usage: python market_data_tiers.py [--once] [config_path]
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import yaml
+
+import kline_archive
+import kline_backfill
+import resampler
+from resampler import resample_arrays, timeframe_ms
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import metrics, storage
+
+DB_PATH = storage.DB_PATH
+CONFIG_PATH = "/home/tito/crypto_algotrader_part1/part2/config/agent_b_config.yaml"
+ARCHIVE_DIR = kline_archive.ARCHIVE_DIR
+
+MINUTE_MS = 60000
+DAY_MS = 86400000
+ROLLUPS = {"5m": "market_data_5m", "1h": "market_data_1h", "1d": "market_data_1d"}
+FIELDS = ("timestamp", "open", "high", "low", "close", "volume")
+
+HOT_DAYS = 14
+ROLLUP_RETENTION_DAYS = {"5m": 90, "1h": 0, "1d": 0}
+COMPACTION_INTERVAL = 3600       # seconds between passes
+ROLLUP_BATCH_MS = DAY_MS         # 1m rows read per rollup step; a multiple of every rollup
+# 1m bars may still be backfilled or re-read by the resampler inside this window
+SETTLE_MS = kline_backfill.LOOKBACK_MINUTES * MINUTE_MS
+MIN_HOT_MS = max(resampler.CATCHUP_MINUTES * MINUTE_MS, SETTLE_MS) + DAY_MS
+METRICS_PORT = 9107              # Prometheus text at http://127.0.0.1:9107/metrics
+
+PASS_SECONDS = metrics.histogram("compaction_pass_seconds", "Rollup + archive + prune pass")
+ROWS_ROLLED = metrics.counter("compaction_rolled_rows_total", "1m rows folded into rollups")
+ROWS_ARCHIVED = metrics.counter("compaction_archived_rows_total", "1m rows moved to the kline archive")
+ROWS_PRUNED = metrics.counter("compaction_pruned_rows_total", "Rollup rows past their retention")
+
+
+def load_settings(path=CONFIG_PATH):
+    """market_data section of agent_b_config.yaml, with defaults."""
+    try:
+        with open(path) as f:
+            cfg = (yaml.safe_load(f) or {}).get("market_data") or {}
+    except OSError:
+        cfg = {}
+    retention = dict(ROLLUP_RETENTION_DAYS)
+    retention.update(cfg.get("rollup_retention_days") or {})
+    return {
+        "hot_days": float(cfg.get("hot_days", HOT_DAYS)),
+        "rollup_retention_days": retention,
+        "interval": float(cfg.get("compaction_interval_minutes", COMPACTION_INTERVAL / 60)) * 60,
+    }
+
+
+def get_state(conn, name, default=None):
+    row = conn.execute("SELECT value FROM compaction_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row is not None else default
+
+
+def set_state(conn, name, value):
+    conn.execute("""
+        INSERT INTO compaction_state (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value
+    """, (name, value))
+
+
+def _as_bars(block):
+    """(n, 6) array -> {field: array} in kline_archive.read_range's layout."""
+    block = np.asarray(block, dtype=np.float64).reshape(-1, 6)
+    out = {field: block[:, i] for i, field in enumerate(FIELDS)}
+    out["timestamp"] = out["timestamp"].astype(np.int64)
+    return out
+
+
+def _concat(*parts):
+    parts = [p for p in parts if len(p["timestamp"])]
+    if not parts:
+        return _as_bars(np.empty((0, 6)))
+    if len(parts) == 1:
+        return parts[0]
+    return {field: np.concatenate([p[field] for p in parts]) for field in FIELDS}
+
+
+def _resample(bars, tf_ms):
+    out = resample_arrays(bars["timestamp"], bars["open"], bars["high"], bars["low"],
+                          bars["close"], bars["volume"], tf_ms)
+    return {field: out[field] for field in FIELDS}
+
+
+# === ROLLUPS ===
+
+def roll_up(conn, upto_ms, timeframes=tuple(ROLLUPS)):
+    """
+    Fold every 1m bar older than upto_ms (whole buckets only) into the
+    rollup tables. Each day of 1m rows is read once and resampled to
+    every timeframe still behind, with one commit per day. Returns the
+    number of 1m rows read.
+    """
+    tf_ms = {tf: timeframe_ms(tf) for tf in timeframes}
+    upto = {tf: upto_ms - upto_ms % tf_ms[tf] for tf in timeframes}
+    marks = {tf: get_state(conn, f"rollup_{tf}") for tf in timeframes}
+    if any(mark is None for mark in marks.values()):
+        oldest = conn.execute("SELECT MIN(timestamp) FROM market_data_1m").fetchone()[0]
+        if oldest is None:
+            return 0
+        for tf, mark in marks.items():
+            if mark is None:
+                marks[tf] = oldest - oldest % tf_ms[tf]
+    behind = [marks[tf] for tf in timeframes if marks[tf] < upto[tf]]
+    if not behind:
+        return 0
+
+    # The oldest mark behind is aligned to its own timeframe, and every
+    # timeframe's sub-range below starts at its own mark or a day boundary
+    lo, end = min(behind), max(upto.values())
+    read = 0
+    while lo < end:
+        hi = min(lo - lo % ROLLUP_BATCH_MS + ROLLUP_BATCH_MS, end)
+        rows = conn.execute("""
+            SELECT symbol, timestamp, open, high, low, close, volume
+            FROM market_data_1m
+            WHERE timestamp >= ? AND timestamp < ?
+            ORDER BY symbol, timestamp
+        """, (lo, hi)).fetchall()
+        if rows:
+            symbols, ts, o, h, l, c, v = zip(*rows)
+            names, codes = np.unique(np.array(symbols), return_inverse=True)
+            ts = np.array(ts, dtype=np.int64)
+            o, h, l, c, v = (np.array(col, dtype=np.float64) for col in (o, h, l, c, v))
+            read += len(rows)
+        for tf in timeframes:
+            a, b = max(lo, marks[tf]), min(hi, upto[tf])
+            if a >= b:
+                continue
+            if rows:
+                keep = (ts >= a) & (ts < b)
+                out = resample_arrays(ts[keep], o[keep], h[keep], l[keep], c[keep], v[keep],
+                                      tf_ms[tf], groups=codes[keep])
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {ROLLUPS[tf]} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    zip(names[out["group"]].tolist(), out["timestamp"].tolist(), out["open"].tolist(),
+                        out["high"].tolist(), out["low"].tolist(), out["close"].tolist(),
+                        out["volume"].tolist(), out["minutes"].tolist()),
+                )
+            marks[tf] = b
+            set_state(conn, f"rollup_{tf}", b)
+        conn.commit()
+        lo = hi
+    ROWS_ROLLED.inc(read)
+    return read
+
+
+def prune_rollup(conn, timeframe, before_ms):
+    """Delete rollup rows older than before_ms, symbol by symbol (primary key range deletes)."""
+    table = ROLLUPS[timeframe]
+    deleted = 0
+    for (symbol,) in conn.execute(f"SELECT DISTINCT symbol FROM {table}").fetchall():
+        deleted += conn.execute(f"DELETE FROM {table} WHERE symbol = ? AND timestamp < ?",
+                                (symbol, before_ms)).rowcount
+        conn.commit()
+    ROWS_PRUNED.inc(deleted)
+    return deleted
+
+
+# === COLD TIER ===
+
+def archive_before(conn, cutoff_ms, archive_dir=ARCHIVE_DIR):
+    """
+    Move market_data_1m rows older than cutoff_ms into the kline archive,
+    one (month, symbol) partition at a time: merge into the partition
+    file, then delete those rows and commit. Returns rows moved.
+    """
+    oldest = conn.execute("SELECT MIN(timestamp) FROM market_data_1m").fetchone()[0]
+    if oldest is None or oldest >= cutoff_ms:
+        return 0
+    symbols = [r[0] for r in conn.execute(
+        "SELECT DISTINCT symbol FROM market_data_1m WHERE timestamp < ?", (cutoff_ms,))]
+
+    moved = 0
+    for year, month, m_start, m_end in kline_archive.months_between(oldest, cutoff_ms):
+        lo, hi = max(oldest, m_start), min(m_end, cutoff_ms)
+        for symbol in symbols:
+            rows = conn.execute("""
+                SELECT symbol, timestamp, open, high, low, close, volume
+                FROM market_data_1m
+                WHERE symbol = ? AND timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp
+            """, (symbol, lo, hi)).fetchall()
+            if not rows:
+                continue
+            kline_archive.write_partition(kline_archive.partition_path(symbol, year, month, archive_dir), rows)
+            conn.execute("DELETE FROM market_data_1m WHERE symbol = ? AND timestamp >= ? AND timestamp < ?",
+                         (symbol, lo, hi))
+            conn.commit()
+            moved += len(rows)
+    set_state(conn, "archived_before", cutoff_ms)
+    conn.commit()
+    ROWS_ARCHIVED.inc(moved)
+    return moved
+
+
+# === COMPACTION PASS ===
+
+def run_pass(conn, settings, now_ms=None, archive_dir=ARCHIVE_DIR):
+    """Rollups, then the cold move, then rollup retention. Returns a summary dict."""
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    started = time.perf_counter()
+    summary = {}
+    summary["rolled"] = roll_up(conn, now_ms - SETTLE_MS)
+
+    # Only bars every rollup has already seen may leave the hot table
+    cutoff = now_ms - max(settings["hot_days"] * DAY_MS, MIN_HOT_MS)
+    cutoff = int(min(cutoff - cutoff % DAY_MS, *(get_state(conn, f"rollup_{tf}", 0) for tf in ROLLUPS)))
+    summary["archived"] = archive_before(conn, cutoff, archive_dir)
+
+    for tf, days in settings["rollup_retention_days"].items():
+        if days and tf in ROLLUPS:
+            summary[f"pruned_{tf}"] = prune_rollup(conn, tf, now_ms - int(days * DAY_MS))
+    elapsed = time.perf_counter() - started
+    PASS_SECONDS.observe(elapsed)
+    summary["seconds"] = round(elapsed, 2)
+    return summary
+
+
+# === QUERY ===
+
+def _select(conn, table, symbol, start_ms, end_ms):
+    rows = conn.execute(f"""
+        SELECT timestamp, open, high, low, close, volume
+        FROM {table}
+        WHERE symbol = ? AND timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp
+    """, (symbol, start_ms, end_ms)).fetchall()
+    return _as_bars(np.array(rows, dtype=np.float64))
+
+
+def bars_1m(conn, symbol, start_ms, end_ms, archive_dir=ARCHIVE_DIR):
+    """1m bars in [start_ms, end_ms): the archive up to the first hot row, then market_data_1m."""
+    hot = _select(conn, "market_data_1m", symbol, start_ms, end_ms)
+    hot_from = int(hot["timestamp"][0]) if len(hot["timestamp"]) else end_ms
+    if hot_from <= start_ms:
+        return hot
+    cold = kline_archive.read_range(symbol, start_ms, hot_from, archive_dir)
+    return _concat({f: np.asarray(cold[f]) for f in FIELDS}, hot)
+
+
+def _base_rollup(tf_ms):
+    """Largest rollup timeframe that tiles tf_ms, or None."""
+    best = None
+    for tf in ROLLUPS:
+        ms = timeframe_ms(tf)
+        if ms <= tf_ms and tf_ms % ms == 0:
+            best = tf
+    return best
+
+
+def query_bars(conn, symbol, start_ms, end_ms, timeframe="1m", archive_dir=ARCHIVE_DIR):
+    """
+    OHLCV bars of `timeframe` for symbol in [start_ms, end_ms) (start is
+    aligned down to the timeframe), from whichever tiers hold them, as
+    {field: array} like kline_archive.read_range().
+    """
+    tf_ms = timeframe_ms(timeframe)
+    start_ms -= start_ms % tf_ms
+    if tf_ms == MINUTE_MS:
+        return bars_1m(conn, symbol, start_ms, end_ms, archive_dir)
+
+    base = _base_rollup(tf_ms)
+    if base is None:
+        return _resample(bars_1m(conn, symbol, start_ms, end_ms, archive_dir), tf_ms)
+
+    base_ms = timeframe_ms(base)
+    mark = min(get_state(conn, f"rollup_{base}", start_ms), end_ms)
+    rolled = _select(conn, ROLLUPS[base], symbol, start_ms, mark) if mark > start_ms else _as_bars([])
+    # Not rolled up (yet, or any more): resample those stretches from 1m
+    covered_from = int(rolled["timestamp"][0]) if len(rolled["timestamp"]) else max(mark, start_ms)
+    older = (_resample(bars_1m(conn, symbol, start_ms, covered_from, archive_dir), base_ms)
+             if covered_from > start_ms else _as_bars([]))
+    newer = (_resample(bars_1m(conn, symbol, max(mark, start_ms), end_ms, archive_dir), base_ms)
+             if end_ms > max(mark, start_ms) else _as_bars([]))
+    bars = _concat(older, rolled, newer)
+    return bars if base_ms == tf_ms else _resample(bars, tf_ms)
+
+
+# === SERVICE ===
+
+def main_loop(config_path=CONFIG_PATH, once=False, db_path=DB_PATH):
+    conn = storage.connect(db_path)
+    if not once:
+        metrics.serve(METRICS_PORT)
+    while True:
+        settings = load_settings(config_path)
+        try:
+            summary = run_pass(conn, settings)
+            print(f"[{datetime.utcnow()}] Compaction pass: {summary}")
+        except Exception as e:
+            conn.rollback()
+            print(f"[{datetime.utcnow()}] Compaction pass failed: {e}")
+        if once:
+            break
+        time.sleep(settings["interval"])
+    conn.close()
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--once"]
+    main_loop(args[0] if args else CONFIG_PATH, once="--once" in sys.argv)
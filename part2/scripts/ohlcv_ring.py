@@ -0,0 +1,241 @@
+"""
+ohlcv_ring.py
+
+Shared, memory-mapped ring buffer of closed 1m OHLCV bars per symbol.
+
+The data feed is the only writer; any other process can attach read-only
+and get zero-copy NumPy views of a symbol's last N bars without touching
+SQLite. The file persists across restarts.
+
+Layout (all little-endian, one file):
+    header        HEADER_SIZE bytes: magic, version, max_symbols, capacity
+    symbol table  max_symbols * SYMBOL_BYTES ascii names
+    heads         int64[max_symbols]  newest minute written + 1 (0 = empty)
+    timestamp     int64[max_symbols, 2 * capacity]
+    open..volume  float64[max_symbols, 2 * capacity] each
+
+Slots are addressed by minute (minute % capacity), not by arrival, so a
+bar that arrives late (a REST backfill running next to the live stream)
+fills its own slot in place instead of being refused. A minute nobody
+wrote still holds a bar from an earlier rotation; its timestamp gives it
+away, and readers get a `valid` mask next to the columns.
+
+Every bar is written twice, at i and i + capacity, so the newest N
+minutes are always one contiguous slice and can be returned as a view.
+The prices go in before the timestamp and the head moves only after
+both copies are written; readers may ask for at most capacity - 1
+minutes so the slot being overwritten is never in their window.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+RING_PATH = "/home/tito/crypto_algotrader_part1/part2/data/ohlcv_1m.ring"
+MAX_SYMBOLS = 512
+CAPACITY = 4320          # bars per symbol (3 days of 1m)
+
+MINUTE_MS = 60000
+
+MAGIC = b"OHLCVRB1"
+VERSION = 2
+HEADER_SIZE = 64
+HEADER_FORMAT = "<8sIII"
+SYMBOL_BYTES = 32
+FIELDS = ("timestamp", "open", "high", "low", "close", "volume")
+
+
+def _layout(max_symbols, capacity):
+    offsets = {}
+    pos = HEADER_SIZE
+    offsets["symbols"] = pos
+    pos += max_symbols * SYMBOL_BYTES
+    offsets["heads"] = pos
+    pos += max_symbols * 8
+    column_bytes = max_symbols * 2 * capacity * 8
+    for field in FIELDS:
+        offsets[field] = pos
+        pos += column_bytes
+    return offsets, pos
+
+
+class OHLCVRing:
+    def __init__(self, path, buf, max_symbols, capacity, writable):
+        self.path = path
+        self.max_symbols = max_symbols
+        self.capacity = capacity
+        self.writable = writable
+        self._buf = buf
+        offsets, _ = _layout(max_symbols, capacity)
+
+        self._names = buf[offsets["symbols"]:offsets["heads"]].reshape(max_symbols, SYMBOL_BYTES)
+        self.heads = buf[offsets["heads"]:offsets["heads"] + max_symbols * 8].view(np.int64)
+        column_bytes = max_symbols * 2 * capacity * 8
+        self.columns = {}
+        for field in FIELDS:
+            start = offsets[field]
+            dtype = np.int64 if field == "timestamp" else np.float64
+            raw = buf[start:start + column_bytes]
+            self.columns[field] = raw.view(dtype).reshape(max_symbols, 2 * capacity)
+
+        self.slots = {}
+        self._load_symbol_table()
+        self.skipped = 0  # bars older than the window the writer refused
+
+    # === OPEN / ATTACH ===
+
+    @classmethod
+    def open_writer(cls, path=RING_PATH, max_symbols=MAX_SYMBOLS, capacity=CAPACITY):
+        """
+        Open (creating if needed) the ring for writing. Only one writer at
+        a time. A file from an older layout version is recreated empty.
+        """
+        _, size = _layout(max_symbols, capacity)
+        if os.path.exists(path) and cls._read_header(path, check=False)[0] != VERSION:
+            os.remove(path)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, max_symbols, capacity))
+                f.truncate(size)  # sparse until symbols are written
+        else:
+            existing = cls._read_header(path)[1:]
+            if existing != (max_symbols, capacity):
+                raise ValueError(
+                    f"{path} was created with max_symbols/capacity={existing}, "
+                    f"not {(max_symbols, capacity)}"
+                )
+        buf = np.memmap(path, dtype=np.uint8, mode="r+", shape=(size,))
+        return cls(path, buf, max_symbols, capacity, writable=True)
+
+    @classmethod
+    def attach(cls, path=RING_PATH):
+        """Attach read-only; geometry is taken from the file header."""
+        _, max_symbols, capacity = cls._read_header(path)
+        _, size = _layout(max_symbols, capacity)
+        buf = np.memmap(path, dtype=np.uint8, mode="r", shape=(size,))
+        return cls(path, buf, max_symbols, capacity, writable=False)
+
+    @staticmethod
+    def _read_header(path, check=True):
+        """(version, max_symbols, capacity) from the file header."""
+        with open(path, "rb") as f:
+            magic, version, max_symbols, capacity = struct.unpack(
+                HEADER_FORMAT, f.read(struct.calcsize(HEADER_FORMAT))
+            )
+        if magic != MAGIC or (check and version != VERSION):
+            raise ValueError(f"{path} is not an OHLCV ring file (v{VERSION})")
+        return version, max_symbols, capacity
+
+    def _load_symbol_table(self):
+        for slot in range(len(self.slots), self.max_symbols):
+            name = bytes(self._names[slot]).rstrip(b"\0").decode("ascii")
+            if not name:
+                break
+            self.slots[name] = slot
+
+    def flush(self):
+        if self.writable:
+            self._buf.flush()
+
+    def close(self):
+        self.flush()
+        self.slots = {}
+
+    # === WRITER ===
+
+    def _slot_for_write(self, symbol):
+        slot = self.slots.get(symbol)
+        if slot is not None:
+            return slot
+        slot = len(self.slots)
+        if slot >= self.max_symbols:
+            raise ValueError(f"Ring is full ({self.max_symbols} symbols)")
+        encoded = symbol.encode("ascii")[:SYMBOL_BYTES]
+        self._names[slot, :] = 0
+        self._names[slot, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+        self.slots[symbol] = slot
+        return slot
+
+    def append(self, symbol, timestamp, o, h, l, c, v):
+        """
+        Write one closed bar into its minute's slot: a new newest bar moves
+        the head, an older one (gap backfill) fills its slot in place and a
+        repeated minute is replaced. Bars that fall out of the readable
+        window (capacity - 1 minutes behind the head) are skipped.
+        """
+        slot = self._slot_for_write(symbol)
+        minute = int(timestamp) // MINUTE_MS
+        head = int(self.heads[slot])
+        if head and minute < head - (self.capacity - 1):
+            self.skipped += 1
+            return False
+
+        pos = minute % self.capacity
+        for field, value in zip(FIELDS[1:], (o, h, l, c, v)):
+            col = self.columns[field][slot]
+            col[pos] = value
+            col[pos + self.capacity] = value
+        ts_col = self.columns["timestamp"][slot]
+        ts_col[pos] = timestamp  # the bar counts as present from here
+        ts_col[pos + self.capacity] = timestamp
+        if minute >= head:
+            self.heads[slot] = minute + 1  # publish after the data
+        return True
+
+    # === READERS ===
+
+    def last(self, symbol, n):
+        """
+        Zero-copy views of the newest n minutes as {field: ndarray}, oldest
+        first, plus "valid": a bool array (computed, not a view) that is
+        False for minutes with no bar. Those rows hold whatever an earlier
+        rotation left there. Views track live memory: copy them if they
+        must stay stable across later appends.
+        """
+        slot = self.slots.get(symbol)
+        if slot is None:
+            self._load_symbol_table()
+            slot = self.slots.get(symbol)
+            if slot is None:
+                views = {field: self.columns[field][0, :0] for field in FIELDS}
+                views["valid"] = np.zeros(0, dtype=bool)
+                return views
+
+        head = int(self.heads[slot])
+        n = min(n, head, self.capacity - 1)
+        end = (head - 1) % self.capacity + 1 + self.capacity
+        views = {field: self.columns[field][slot, end - n:end] for field in FIELDS}
+        expected = np.arange(head - n, head, dtype=np.int64) * MINUTE_MS
+        views["valid"] = views["timestamp"] == expected
+        return views
+
+    def last_matrix(self, symbols, n):
+        """
+        Stack the newest n minutes of many symbols into (len(symbols), n)
+        arrays per field (this one copies), each symbol aligned on its own
+        newest minute. Missing minutes, and symbols with a shorter history,
+        are NaN with a 0 timestamp; "valid" marks the rows that hold a bar.
+        """
+        out = {
+            field: np.full((len(symbols), n), 0 if field == "timestamp" else np.nan,
+                           dtype=np.int64 if field == "timestamp" else np.float64)
+            for field in FIELDS
+        }
+        out["valid"] = np.zeros((len(symbols), n), dtype=bool)
+        for row, symbol in enumerate(symbols):
+            views = self.last(symbol, n)
+            got = len(views["timestamp"])
+            if got:
+                valid = views["valid"]
+                for field in FIELDS:
+                    out[field][row, n - got:] = np.where(valid, views[field], out[field][row, n - got:])
+                out["valid"][row, n - got:] = valid
+        return out
+
+    def newest(self, symbol):
+        """Open time of the newest bar written for symbol, or None."""
+        slot = self.slots.get(symbol)
+        head = 0 if slot is None else int(self.heads[slot])
+        return (head - 1) * MINUTE_MS if head else None
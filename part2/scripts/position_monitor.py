@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+position_monitor.py
+
+Event-driven exit monitoring (stop-loss, take-profit, stagnant timeout)
+for many open positions.
+
+Checking every open position against every price update is
+O(positions) per tick. PositionMonitor indexes the triggers instead:
+
+  * per symbol, two heaps of trigger levels: "upper" levels fire when
+    the price rises to them (long TP, short SL), "lower" levels when it
+    falls to them (long SL, short TP). A price update only compares
+    against the two heap tops and pops exactly the triggers it crossed.
+  * stagnation deadlines sit in a hashed timer wheel (TimerWheel), so
+    advancing the clock only looks at the slots it passed.
+
+Closed or modified positions leave their old heap/wheel entries behind;
+they are skipped when reached and the heaps are rebuilt once stale
+entries outnumber live ones.
+
+Fired exits come back from on_price() / on_bar() / advance() and go to
+every subscriber as ExitEvent. Live trading feeds ticks to on_price();
+paper mode and backtests replay 1m bars through on_bar(), which applies
+the backtest_engine rules (exit at the trigger level, a bar touching
+both levels counts as a stop), so every mode runs the same exit path.
+
+Levels come from the exits section of agent_b_config.yaml
+(stop_loss_percent, take_profit_percent, stagnant_minutes) via
+open_with_exits(), or are given explicitly to open().
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import namedtuple
+
+MINUTE_MS = 60000
+TICK_MS = 1000          # timer wheel resolution
+WHEEL_SLOTS = 4096      # one rotation = ~68 minutes at 1 s ticks
+COMPACT_MIN = 64        # stale heap entries tolerated before a rebuild is considered
+
+LONG, SHORT = 1, -1
+
+ExitEvent = namedtuple("ExitEvent", "position_id symbol direction reason level price timestamp")
+Position = namedtuple("Position", "position_id symbol direction entry_price stop_loss take_profit "
+                                  "deadline_ms opened_at version")
+
+
+def exit_levels(direction, entry_price, exits):
+    """(stop_loss, take_profit) prices for a position under the config's exits section."""
+    sl_pct = exits["stop_loss_percent"] / 100.0
+    tp_pct = exits["take_profit_percent"] / 100.0
+    if direction > 0:
+        return entry_price * (1 - sl_pct), entry_price * (1 + tp_pct)
+    return entry_price * (1 + sl_pct), entry_price * (1 - tp_pct)
+
+
+# === TIMER WHEEL ===
+
+class TimerWheel:
+    """
+    Hashed timing wheel. schedule() is an append to the slot of the
+    deadline's tick; advance(now) scans only the slots between the last
+    advance and now (at most one full rotation, however long the gap),
+    and entries more than a rotation out stay in place until their turn.
+    """
+
+    def __init__(self, tick_ms=TICK_MS, slots=WHEEL_SLOTS, now_ms=0):
+        self.tick_ms = tick_ms
+        self.slots = [[] for _ in range(slots)]
+        self.current = now_ms // tick_ms
+        self.size = 0
+
+    def schedule(self, deadline_ms, item):
+        # Overdue deadlines go in the current slot and fire on the next advance
+        tick = max(deadline_ms // self.tick_ms, self.current)
+        self.slots[tick % len(self.slots)].append((deadline_ms, item))
+        self.size += 1
+
+    def advance(self, now_ms):
+        """Remove and return (deadline, item) for every deadline <= now_ms, earliest first."""
+        target = now_ms // self.tick_ms
+        if target < self.current or not self.size:
+            self.current = max(self.current, target)
+            return []
+        n = len(self.slots)
+        fired = []
+        for tick in range(self.current, self.current + min(target - self.current + 1, n)):
+            slot = self.slots[tick % n]
+            if not slot:
+                continue
+            keep = []
+            for entry in slot:
+                (fired if entry[0] <= now_ms else keep).append(entry)
+            self.slots[tick % n] = keep
+        self.current = target
+        self.size -= len(fired)
+        fired.sort(key=lambda entry: entry[0])
+        return fired
+
+
+# === MONITOR ===
+
+class _Book:
+    """Trigger heaps of one symbol: upper as (level, ...), lower as (-level, ...)."""
+    __slots__ = ("upper", "lower", "stale")
+
+    def __init__(self):
+        self.upper = []
+        self.lower = []
+        self.stale = 0
+
+
+class PositionMonitor:
+    def __init__(self, tick_ms=TICK_MS, slots=WHEEL_SLOTS, now_ms=0):
+        # The wheel clock follows whatever time advance() is given, live or
+        # historical; starting at 0 only costs one full-rotation scan on the
+        # first advance
+        self.positions = {}           # position_id -> Position
+        self.books = {}               # symbol -> _Book
+        self.wheel = TimerWheel(tick_ms, slots, now_ms)
+        self.last_price = {}          # symbol -> last price seen
+        self.subscribers = []
+        self._seq = itertools.count()
+
+        self.updates = 0
+        self.triggers_popped = 0
+        self.exits = 0
+
+    def subscribe(self, callback):
+        """callback(ExitEvent) is called for every exit fired."""
+        self.subscribers.append(callback)
+
+    def __len__(self):
+        return len(self.positions)
+
+    # --- positions ---
+
+    def open(self, position_id, symbol, direction, entry_price, stop_loss=None, take_profit=None,
+             deadline_ms=None, opened_at=None):
+        if position_id in self.positions:
+            raise ValueError(f"Position {position_id} is already open")
+        opened_at = int(time.time() * 1000) if opened_at is None else opened_at
+        pos = Position(position_id, symbol, LONG if direction > 0 else SHORT, entry_price,
+                       stop_loss, take_profit, deadline_ms, opened_at, 0)
+        self.positions[position_id] = pos
+        self._index(pos)
+        self.last_price.setdefault(symbol, entry_price)
+        return pos
+
+    def open_with_exits(self, position_id, symbol, direction, entry_price, exits, opened_at=None):
+        """open() with SL/TP/stagnation taken from an exits config dict."""
+        opened_at = int(time.time() * 1000) if opened_at is None else opened_at
+        sl, tp = exit_levels(direction, entry_price, exits)
+        stagnant = exits.get("stagnant_minutes")
+        deadline = opened_at + int(stagnant) * MINUTE_MS if stagnant else None
+        return self.open(position_id, symbol, direction, entry_price, sl, tp, deadline, opened_at)
+
+    def modify(self, position_id, stop_loss=None, take_profit=None, deadline_ms=None):
+        """Move a position's levels (e.g. stop to break-even); None keeps the current value."""
+        old = self.positions[position_id]
+        pos = old._replace(
+            stop_loss=old.stop_loss if stop_loss is None else stop_loss,
+            take_profit=old.take_profit if take_profit is None else take_profit,
+            deadline_ms=old.deadline_ms if deadline_ms is None else deadline_ms,
+            version=old.version + 1,
+        )
+        self.positions[position_id] = pos
+        self._retire(old)
+        self._index(pos)
+        return pos
+
+    def close(self, position_id):
+        """Stop monitoring a position closed elsewhere; returns it (or None)."""
+        pos = self.positions.pop(position_id, None)
+        if pos is not None:
+            self._retire(pos)
+        return pos
+
+    def _index(self, pos):
+        book = self.books.get(pos.symbol)
+        if book is None:
+            book = self.books[pos.symbol] = _Book()
+        pid, version = pos.position_id, pos.version
+        if pos.direction > 0:
+            upper, lower = (pos.take_profit, "take_profit"), (pos.stop_loss, "stop_loss")
+        else:
+            upper, lower = (pos.stop_loss, "stop_loss"), (pos.take_profit, "take_profit")
+        if upper[0] is not None:
+            heapq.heappush(book.upper, (upper[0], next(self._seq), pid, version, upper[1]))
+        if lower[0] is not None:
+            heapq.heappush(book.lower, (-lower[0], next(self._seq), pid, version, lower[1]))
+        if pos.deadline_ms is not None:
+            self.wheel.schedule(pos.deadline_ms, (pid, version))
+
+    def _retire(self, pos, popped=0):
+        """Count pos's heap entries as stale; `popped` of them already left the heaps."""
+        book = self.books[pos.symbol]
+        book.stale += (pos.stop_loss is not None) + (pos.take_profit is not None) - popped
+        if book.stale > COMPACT_MIN and book.stale > (len(book.upper) + len(book.lower)) // 2:
+            self._rebuild(pos.symbol, book)
+
+    def _rebuild(self, symbol, book):
+        live = self._live
+        book.upper = [e for e in book.upper if live(e[2], e[3])]
+        book.lower = [e for e in book.lower if live(e[2], e[3])]
+        heapq.heapify(book.upper)
+        heapq.heapify(book.lower)
+        book.stale = 0
+
+    def _live(self, pid, version):
+        pos = self.positions.get(pid)
+        return pos is not None and pos.version == version
+
+    # --- prices ---
+
+    def _crossed(self, book, high, low):
+        """Live heap entries crossed by a move reaching high and low: [(entry, level)]."""
+        hits = []
+        upper, lower = book.upper, book.lower
+        while upper and upper[0][0] <= high:
+            entry = heapq.heappop(upper)
+            hits.append((entry, entry[0]))
+        while lower and -lower[0][0] >= low:
+            entry = heapq.heappop(lower)
+            hits.append((entry, -entry[0]))
+        self.triggers_popped += len(hits)
+        live = [(e, level) for e, level in hits if self._live(e[2], e[3])]
+        book.stale -= len(hits) - len(live)
+        return live
+
+    def on_price(self, symbol, price, timestamp=None):
+        """Apply one trade/mark price; returns the exits it triggered."""
+        self.updates += 1
+        self.last_price[symbol] = price
+        book = self.books.get(symbol)
+        if book is None:
+            return []
+        # Cheap reject: nothing crossed in either direction
+        if not ((book.upper and book.upper[0][0] <= price)
+                or (book.lower and -book.lower[0][0] >= price)):
+            return []
+        timestamp = int(time.time() * 1000) if timestamp is None else timestamp
+        events = []
+        for (_, _, pid, _, reason), level in self._crossed(book, price, price):
+            events.append(self._exit(pid, reason, level, price, timestamp, popped=1))
+        return self._emit(events)
+
+    def on_bar(self, symbol, timestamp, high, low, close):
+        """
+        Apply one bar (paper mode / backtest replay). Exits fill at their
+        trigger level; a position whose SL and TP both fall inside the
+        bar's range is stopped out, as in backtest_engine.resolve_trades().
+        """
+        self.updates += 1
+        self.last_price[symbol] = close
+        book = self.books.get(symbol)
+        if book is None:
+            return []
+        if not ((book.upper and book.upper[0][0] <= high)
+                or (book.lower and -book.lower[0][0] >= low)):
+            return []
+        picked, popped = {}, {}
+        for (_, _, pid, _, reason), level in self._crossed(book, high, low):
+            popped[pid] = popped.get(pid, 0) + 1
+            if pid not in picked or reason == "stop_loss":
+                picked[pid] = (reason, level)
+        events = [self._exit(pid, reason, level, level, timestamp, popped[pid])
+                  for pid, (reason, level) in picked.items()]
+        return self._emit(events)
+
+    def advance(self, now_ms=None):
+        """Fire stagnation exits due by now_ms, at each symbol's last price."""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        events = []
+        for deadline, (pid, version) in self.wheel.advance(now_ms):
+            pos = self.positions.get(pid)
+            if pos is None or pos.version != version or pos.deadline_ms != deadline:
+                continue
+            price = self.last_price.get(pos.symbol, pos.entry_price)
+            events.append(self._exit(pid, "stagnant", None, price, now_ms))
+        return self._emit(events)
+
+    def _exit(self, pid, reason, level, price, timestamp, popped=0):
+        pos = self.positions.pop(pid)
+        self._retire(pos, popped)
+        self.exits += 1
+        return ExitEvent(pid, pos.symbol, pos.direction, reason, level, price, timestamp)
+
+    def _emit(self, events):
+        for event in events:
+            for callback in self.subscribers:
+                callback(event)
+        return events
+
+    def stats(self):
+        return {
+            "open_positions": len(self.positions),
+            "symbols": len(self.books),
+            "updates": self.updates,
+            "triggers_popped": self.triggers_popped,
+            "exits": self.exits,
+            "pending_deadlines": self.wheel.size,
+        }
+
+
+async def run_clock(monitor, interval=1.0):
+    """Advance the monitor's stagnation clock every `interval` seconds (live mode)."""
+    while True:
+        monitor.advance()
+        await asyncio.sleep(interval)
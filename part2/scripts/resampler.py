@@ -0,0 +1,334 @@
+"""
+resampler.py
+
+Streaming 1m -> higher-timeframe resampler (15m / 30m / 2h / 4h).
+
+StreamingResampler is fed closed 1m candles by the data feed and keeps
+one partial bar per (symbol, timeframe). When the last minute of a
+UTC-aligned bucket arrives (or a later bucket starts) the bar is closed
+and handed to every subscriber, so HTF bars stay current at a few dict
+operations per minute. A bar closed with minutes missing (a websocket
+gap) has complete=False.
+
+catch_up() rebuilds HTF history from market_data_1m at startup in one
+vectorized pass over all symbols and seeds the partial bars with the
+bucket that is still forming. repair() folds minutes refetched by the
+gap backfill into the buckets they belong to: the partial bar is
+rebuilt, and closed bars are replaced in history and handed to the
+subscribers again (same symbol, timeframe and timestamp).
+"""
+
+import os
+import sys
+import time
+from collections import defaultdict, deque, namedtuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from common import storage
+
+MINUTE_MS = 60000
+TIMEFRAMES = ("15m", "30m", "2h", "4h")
+HISTORY_BARS = 500                 # closed HTF bars kept in memory per (symbol, timeframe)
+CATCHUP_MINUTES = 3 * 24 * 60      # 1m history read at startup
+
+HTFBar = namedtuple("HTFBar", "symbol timeframe timestamp open high low close volume minutes complete")
+
+_UNIT_MS = {"m": MINUTE_MS, "h": 60 * MINUTE_MS, "d": 24 * 60 * MINUTE_MS}
+
+
+def timeframe_ms(timeframe):
+    """'15m' -> 900000, '4h'/'4H' -> 14400000, '1d' -> 86400000."""
+    tf = timeframe.strip().lower()
+    try:
+        return int(tf[:-1]) * _UNIT_MS[tf[-1]]
+    except (KeyError, ValueError):
+        raise ValueError(f"Unsupported timeframe: {timeframe}")
+
+
+def resample_arrays(timestamp, open_, high, low, close, volume, tf_ms, groups=None):
+    """
+    Vectorized OHLCV resample of time-ordered 1m arrays. `groups` (e.g.
+    symbol codes) keeps buckets of different series apart; input must be
+    sorted by (group, timestamp). Returns a dict of arrays, one entry per
+    bucket, plus 'minutes' (1m bars in each bucket) and 'group'.
+    """
+    timestamp = np.asarray(timestamp, dtype=np.int64)
+    if len(timestamp) == 0:
+        empty = np.array([], dtype=np.float64)
+        return {"timestamp": np.array([], dtype=np.int64), "open": empty, "high": empty,
+                "low": empty, "close": empty, "volume": empty,
+                "minutes": np.array([], dtype=np.int64), "group": np.array([], dtype=np.int64)}
+    groups = np.zeros(len(timestamp), dtype=np.int64) if groups is None else np.asarray(groups)
+    bucket = timestamp - timestamp % tf_ms
+
+    change = (bucket[1:] != bucket[:-1]) | (groups[1:] != groups[:-1])
+    starts = np.concatenate(([0], np.flatnonzero(change) + 1))
+    ends = np.concatenate((starts[1:], [len(timestamp)])) - 1
+
+    return {
+        "timestamp": bucket[starts],
+        "open": np.asarray(open_, dtype=np.float64)[starts],
+        "high": np.maximum.reduceat(np.asarray(high, dtype=np.float64), starts),
+        "low": np.minimum.reduceat(np.asarray(low, dtype=np.float64), starts),
+        "close": np.asarray(close, dtype=np.float64)[ends],
+        "volume": np.add.reduceat(np.asarray(volume, dtype=np.float64), starts),
+        "minutes": ends - starts + 1,
+        "group": groups[starts],
+    }
+
+
+def read_1m(db_path, spans):
+    """market_data_1m rows for {symbol: (start_ms, end_ms)}, as (symbol, ts, o, h, l, c, v) tuples."""
+    conn = storage.connect(db_path)
+    try:
+        rows = []
+        for symbol, (start_ms, end_ms) in spans.items():
+            rows.extend(conn.execute("""
+                SELECT symbol, timestamp, open, high, low, close, volume
+                FROM market_data_1m
+                WHERE symbol = ? AND timestamp >= ? AND timestamp < ?
+            """, (symbol, start_ms, end_ms)).fetchall())
+        return rows
+    finally:
+        conn.close()
+
+
+class StreamingResampler:
+    def __init__(self, timeframes=TIMEFRAMES, history_bars=HISTORY_BARS):
+        self.timeframes = {tf: timeframe_ms(tf) for tf in timeframes}
+        self.partial = {}      # (symbol, tf) -> [bucket, o, h, l, c, v, minutes]
+        self.history = defaultdict(lambda: deque(maxlen=history_bars))
+        self.subscribers = []
+        self.closed_bars = 0
+        self.late_bars = 0
+        self.pending = None    # closed 1m bars held back while catch_up runs (see defer())
+        self.deferred_repairs = []  # backfilled 1m rows received meanwhile, for repair()
+        self.catch_up_started = False
+        self.caught_up_to = {} # symbol -> newest 1m timestamp read by catch_up
+        # Latest live 1m bars per symbol (one longest bucket's worth), so repair()
+        # sees minutes the candle writer may not have flushed yet
+        self.recent = defaultdict(lambda: deque(maxlen=max(self.timeframes.values()) // MINUTE_MS))
+
+    def subscribe(self, callback):
+        """callback(HTFBar) is called for every closed higher-timeframe bar."""
+        self.subscribers.append(callback)
+
+    def add_1m(self, symbol, timestamp, o, h, l, c, v):
+        """Fold one closed 1m bar into every timeframe; return the HTF bars it closed."""
+        if self.pending is not None:
+            self.pending.append((symbol, timestamp, o, h, l, c, v))
+            return []
+        self.recent[symbol].append((symbol, timestamp, o, h, l, c, v))
+        closed = []
+        for tf, tf_ms in self.timeframes.items():
+            key = (symbol, tf)
+            bucket = timestamp - timestamp % tf_ms
+            bar = self.partial.get(key)
+
+            if bar is not None and bar[0] != bucket:
+                if bucket < bar[0]:
+                    self.late_bars += 1
+                    continue
+                # A newer bucket started before the old one saw its last minute
+                closed.append(self._close(symbol, tf, key))
+                bar = None
+
+            if bar is None:
+                self.partial[key] = [bucket, o, h, l, c, v, 1]
+            else:
+                bar[2] = max(bar[2], h)
+                bar[3] = min(bar[3], l)
+                bar[4] = c
+                bar[5] += v
+                bar[6] += 1
+
+            if timestamp + MINUTE_MS == bucket + tf_ms:
+                closed.append(self._close(symbol, tf, key))
+
+        for htf_bar in closed:
+            for callback in self.subscribers:
+                callback(htf_bar)
+        return closed
+
+    def _bar(self, symbol, tf, b):
+        return HTFBar(symbol, tf, *b[:7], b[6] == self.timeframes[tf] // MINUTE_MS)
+
+    def _close(self, symbol, tf, key):
+        htf_bar = self._bar(symbol, tf, self.partial.pop(key))
+        self.history[key].append(htf_bar)
+        self.closed_bars += 1
+        return htf_bar
+
+    def partial_bar(self, symbol, timeframe):
+        """The still-forming HTF bar, or None."""
+        b = self.partial.get((symbol, timeframe))
+        if b is None:
+            return None
+        return self._bar(symbol, timeframe, b)._replace(complete=False)
+
+    def bars(self, symbol, timeframe):
+        """Closed HTF bars for (symbol, timeframe), oldest first."""
+        return list(self.history[(symbol, timeframe)])
+
+    # === STARTUP CATCH-UP ===
+
+    def defer(self):
+        """
+        Hold live bars back so catch_up can run in a worker thread while the
+        streams are already open; resume() folds them in afterwards.
+        """
+        self.pending = []
+
+    def resume(self):
+        """Replay the bars held back since defer(), skipping any catch_up already read."""
+        pending, self.pending = self.pending or [], None
+        replayed = 0
+        for bar in pending:
+            if bar[1] > self.caught_up_to.get(bar[0], -1):
+                self.add_1m(*bar)
+                replayed += 1
+        return replayed
+
+    def catch_up(self, db_path, minutes=CATCHUP_MINUTES, now=None):
+        """
+        Build HTF history for every symbol from market_data_1m in one
+        query and one vectorized resample per timeframe. The newest bucket
+        of each series is seeded as the partial bar unless it is complete.
+        Returns the number of 1m rows read.
+        """
+        self.catch_up_started = True
+        now = time.time() if now is None else now
+        since = int(now // 60) * MINUTE_MS - minutes * MINUTE_MS
+
+        conn = storage.connect(db_path)
+        try:
+            rows = conn.execute("""
+                SELECT symbol, timestamp, open, high, low, close, volume
+                FROM market_data_1m
+                WHERE timestamp >= ?
+                ORDER BY symbol, timestamp
+            """, (since,)).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return 0
+
+        symbols, ts, o, h, l, c, v = zip(*rows)
+        names, codes = np.unique(np.array(symbols), return_inverse=True)
+        # Rows are ordered by symbol, timestamp: the last row of each symbol is its newest
+        last = np.concatenate((codes[1:] != codes[:-1], [True]))
+        self.caught_up_to.update(zip(names[codes[last]].tolist(), np.array(ts)[last].tolist()))
+
+        for tf, tf_ms in self.timeframes.items():
+            out = resample_arrays(ts, o, h, l, c, v, tf_ms, groups=codes)
+            last_of_group = np.concatenate((out["group"][1:] != out["group"][:-1], [True]))
+            for i in range(len(out["timestamp"])):
+                symbol = str(names[out["group"][i]])
+                key = (symbol, tf)
+                fields = [int(out["timestamp"][i]), float(out["open"][i]), float(out["high"][i]),
+                          float(out["low"][i]), float(out["close"][i]), float(out["volume"][i]),
+                          int(out["minutes"][i])]
+                complete = fields[0] + tf_ms <= since + minutes * MINUTE_MS
+                if last_of_group[i] and not complete:
+                    self.partial[key] = fields
+                else:
+                    self.partial.pop(key, None)
+                    self.history[key].append(self._bar(symbol, tf, fields))
+        return len(rows)
+
+    # === BACKFILL REPAIR ===
+
+    def repair_spans(self, rows):
+        """{symbol: (start_ms, end_ms)} of 1m history covering every bucket the rows fall in."""
+        spans = {}
+        for symbol, ts, *_ in rows:
+            lo = min(ts - ts % tf_ms for tf_ms in self.timeframes.values())
+            hi = max(ts - ts % tf_ms + tf_ms for tf_ms in self.timeframes.values())
+            span = spans.get(symbol)
+            spans[symbol] = (min(span[0], lo), max(span[1], hi)) if span else (lo, hi)
+        return spans
+
+    def repair(self, rows, stored=(), now=None):
+        """
+        Rebuild the HTF buckets that backfilled 1m `rows` fall in, from
+        `stored` (market_data_1m over repair_spans(rows), see read_1m),
+        the recent live minutes and the rows themselves. Buckets still
+        forming replace the partial bar; ended ones are replaced or
+        inserted in history and handed to the subscribers when they
+        changed. While catch_up is pending the rows are kept for a later
+        call (take_deferred_repairs), unless catch_up has not started
+        reading yet: rows are stored before repair() sees them, so it
+        will read them itself. Returns the bars emitted.
+        """
+        if not rows:
+            return []
+        if self.pending is not None:
+            if self.catch_up_started:
+                self.deferred_repairs.extend(rows)
+            return []
+        now_ms = int((time.time() if now is None else now) * 1000)
+
+        minutes = defaultdict(dict)     # symbol -> ts -> row, later sources win
+        touched = {r[0] for r in rows}
+        for row in stored:
+            minutes[row[0]][row[1]] = row
+        for symbol in touched:
+            for row in self.recent.get(symbol, ()):
+                minutes[symbol][row[1]] = row
+        for row in rows:
+            minutes[row[0]][row[1]] = row
+
+        emitted = []
+        for symbol in touched:
+            series = [minutes[symbol][ts] for ts in sorted(minutes[symbol])]
+            _, ts, o, h, l, c, v = zip(*series)
+            for tf, tf_ms in self.timeframes.items():
+                affected = {r[1] - r[1] % tf_ms for r in rows if r[0] == symbol}
+                out = resample_arrays(ts, o, h, l, c, v, tf_ms)
+                for i in np.flatnonzero(np.isin(out["timestamp"], list(affected))):
+                    fields = [int(out["timestamp"][i]), float(out["open"][i]), float(out["high"][i]),
+                              float(out["low"][i]), float(out["close"][i]), float(out["volume"][i]),
+                              int(out["minutes"][i])]
+                    emitted.extend(self._repair_bucket(symbol, tf, tf_ms, fields, now_ms))
+
+        for htf_bar in emitted:
+            for callback in self.subscribers:
+                callback(htf_bar)
+        return emitted
+
+    def _repair_bucket(self, symbol, tf, tf_ms, fields, now_ms):
+        key = (symbol, tf)
+        bucket = fields[0]
+        closed = []
+        partial = self.partial.get(key)
+        if partial is not None and partial[0] < bucket:
+            closed.append(self._close(symbol, tf, key))  # superseded, as in add_1m
+            partial = None
+        if bucket + tf_ms > now_ms:
+            self.partial[key] = fields                    # still forming
+            return closed
+        if partial is not None and partial[0] == bucket:
+            self.partial.pop(key)
+
+        htf_bar = self._bar(symbol, tf, fields)
+        history = self.history[key]
+        for k, old in enumerate(history):
+            if old.timestamp == bucket:
+                if old != htf_bar:
+                    history[k] = htf_bar
+                    closed.append(htf_bar)
+                return closed
+        # Not in history yet: insert in time order
+        bars = sorted([*history, htf_bar], key=lambda bar: bar.timestamp)
+        history.clear()
+        history.extend(bars[-history.maxlen:])
+        self.closed_bars += 1
+        closed.append(htf_bar)
+        return closed
+
+    def take_deferred_repairs(self):
+        """Backfilled rows repair() held back while catch_up was pending."""
+        rows, self.deferred_repairs = self.deferred_repairs, []
+        return rows